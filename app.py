@@ -1,27 +1,102 @@
 from flask import Flask
-from models import User, Plant, ControlStatus, TankLevel
 from flask_login import LoginManager
 import os
+import time
 
 def create_app():
+    started = time.perf_counter()
     app = Flask(__name__)
     app.config['SECRET_KEY'] = 'dev-secret-key-change-this' # Change for production
-    
-    # Firebase Init
-    from firebase_config import db
-    
+
+    # Sensor ingest (Pi posts readings with X-API-Key)
+    app.config['INGEST_API_KEY'] = os.environ.get('INGEST_API_KEY')
+    app.config['INGEST_MAX_BATCH'] = int(os.environ.get('INGEST_MAX_BATCH', 100))
+    app.config['INGEST_MAX_AGE'] = float(os.environ.get('INGEST_MAX_AGE', 5.0))
+    app.config['SIMULATE_SENSORS'] = os.environ.get('SIMULATE_SENSORS') == '1'
+    # Edge spool: readings are appended to this local log before they are
+    # acknowledged, then synced to the store (and SPOOL_UPSTREAM_URL, another
+    # instance's /api/sensor-data, when set) in compressed bulk batches
+    app.config['SPOOL_PATH'] = os.environ.get('SPOOL_PATH')
+    app.config['SPOOL_RETAIN_HOURS'] = float(os.environ.get('SPOOL_RETAIN_HOURS', 72))
+    app.config['SPOOL_UPSTREAM_URL'] = os.environ.get('SPOOL_UPSTREAM_URL')
+    app.config['SPOOL_UPSTREAM_KEY'] = os.environ.get('SPOOL_UPSTREAM_KEY')
+    app.config['SPOOL_MAX_BACKOFF'] = float(os.environ.get('SPOOL_MAX_BACKOFF', 300))
+    # In-memory window of recent readings: hours kept at the expected rate (readings/s)
+    app.config['RECENT_WINDOW_HOURS'] = float(os.environ.get('RECENT_WINDOW_HOURS', 24))
+    app.config['RECENT_WINDOW_RATE'] = float(os.environ.get('RECENT_WINDOW_RATE', 1.0))
+    app.config['PLANT_CACHE_TTL'] = float(os.environ.get('PLANT_CACHE_TTL', 300))
+    app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 1024))
+    app.config['USER_CACHE_TTL'] = float(os.environ.get('USER_CACHE_TTL', 300))
+
+    # Interlocks: pumps stay blocked when the newest reading is older than this (s)
+    app.config['SENSOR_MAX_AGE'] = float(os.environ.get('SENSOR_MAX_AGE', 60))
+
+    # Closed-loop controller for 'auto'/'schedule' modes. Off unless asked
+    # for, so extra processes never run a second loop (see wsgi.py)
+    app.config['CONTROL_LOOP_ENABLED'] = os.environ.get('CONTROL_LOOP', '0') == '1'
+    app.config['CONTROL_LOOP_INTERVAL'] = float(os.environ.get('CONTROL_LOOP_INTERVAL', 5.0))
+
+    # AI scan images (content-addressed files) and optional Pi camera command
+    app.config['IMAGE_ROOT'] = os.environ.get('IMAGE_ROOT', os.path.join(app.instance_path, 'images'))
+    app.config['MAX_IMAGE_BYTES'] = int(os.environ.get('MAX_IMAGE_BYTES', 20 * 1024 * 1024))
+    app.config['CAMERA_COMMAND'] = os.environ.get('CAMERA_COMMAND')
+    # Scan/capture jobs queued or running at once before new ones get a 503
+    app.config['ANALYSIS_MAX_PENDING'] = int(os.environ.get('ANALYSIS_MAX_PENDING', 16))
+    # Fingerprinted static assets (build on startup unless done at deploy
+    # time with `flask build-assets`; wsgi.py turns the startup build off)
+    app.config['ASSET_DIR'] = os.environ.get('ASSET_DIR', os.path.join(app.instance_path, 'assets'))
+    app.config['ASSET_BUILD'] = os.environ.get('ASSET_BUILD', '1') == '1'
+    # Scans are cross-checked only against readings newer than this (s)
+    app.config['SCAN_SENSOR_MAX_AGE'] = float(os.environ.get('SCAN_SENSOR_MAX_AGE', 300))
+    # /metrics (Prometheus text); set METRICS_TOKEN to require "Authorization: Bearer <token>"
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 500))
+    # Threads used to issue a request's independent store reads concurrently
+    app.config['READ_POOL_WORKERS'] = int(os.environ.get('READ_POOL_WORKERS', 8))
+
+    # Registered first so the other request hooks are timed too
+    from services.metrics import metrics, init_app as init_metrics
+    init_metrics(app)
+
+    from services.assets import assets
+    phase = time.perf_counter()
+    assets.configure(app.static_folder, app.config['ASSET_DIR'])
+    assets.init_app(app)
+    if app.config['ASSET_BUILD']:
+        assets.build()
+    metrics.record_startup('assets', (time.perf_counter() - phase) * 1000)
+
+    # Seed missing default data in the background at startup (one marker read
+    # per process); set AUTO_SEED=0 and run `flask seed` at deploy time instead
+    app.config['AUTO_SEED'] = os.environ.get('AUTO_SEED', '1') == '1'
+
+    # Firebase Init: the store opens lazily on first use. Every store call is
+    # timed and attributed to its request; routes import db from
+    # firebase_config, so wrap it there before they load.
+    import firebase_config
+    from storage import InstrumentedStore
+    if firebase_config.db and not isinstance(firebase_config.db, InstrumentedStore):
+        firebase_config.db = InstrumentedStore(firebase_config.db, metrics.record_store)
+    db = firebase_config.db
+
+    from storage import read_pool
+    read_pool.configure(workers=app.config['READ_POOL_WORKERS'])
+
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
     login_manager.init_app(app)
 
+    # Every authenticated request resolves its user: serve it from memory
+    from services.users import user_cache
+    user_cache.configure(db, max_size=app.config['USER_CACHE_SIZE'], ttl=app.config['USER_CACHE_TTL'])
+
     @login_manager.user_loader
     def load_user(user_id):
-        if not db: return None
-        doc = db.collection('users').document(user_id).get()
-        if doc.exists:
-            data = doc.to_dict()
-            return User(email=data['email'], password_hash=data['password_hash'], name=data['name'], id=user_id)
-        return None
+        started = time.perf_counter()
+        try:
+            return user_cache.get(user_id)
+        finally:
+            metrics.record_load_user((time.perf_counter() - started) * 1000)
 
     # Register Blueprints
     from routes.auth import auth as auth_blueprint
@@ -33,36 +108,100 @@ def create_app():
     from routes.views import views as views_blueprint
     app.register_blueprint(views_blueprint)
 
-    # Seed Default Data (Firestore)
+    # Grow units: each has its own partition of readings, controls, tanks and plants
+    from services.units import unit_registry, seeder, init_app as init_units
+    unit_registry.configure(db, ttl=app.config['PLANT_CACHE_TTL'])
+    init_units(app)
+    seeder.configure(db)
+
+    # Plant profiles are served from an in-process registry per unit
+    from services.plants import plant_registry
+    plant_registry.configure(store=db, ttl=app.config['PLANT_CACHE_TTL'])
+
+    # Only once every registry the seed writes through is configured
+    if db and app.config['AUTO_SEED']:
+        seeder.start()
+
+    # Write-behind sensor buffer
+    from services.ingest import ingest_buffer, start_simulator
+    from services.rollups import rollups
+    from services.broker import publish_readings
+    from services.spool import Spool, HttpSink, init_app as init_spool
+    spool = upstream = None
+    if app.config['SPOOL_PATH']:
+        spool = Spool(app.config['SPOOL_PATH'], retain=app.config['SPOOL_RETAIN_HOURS'] * 3600)
+    if spool and app.config['SPOOL_UPSTREAM_URL']:
+        upstream = HttpSink(app.config['SPOOL_UPSTREAM_URL'], api_key=app.config['SPOOL_UPSTREAM_KEY'])
+    ingest_buffer.configure(db, max_batch=app.config['INGEST_MAX_BATCH'], max_age=app.config['INGEST_MAX_AGE'],
+                            spool=spool, upstream=upstream, max_backoff=app.config['SPOOL_MAX_BACKOFF'])
+    init_spool(app)
+
+    # Bulk export of sensor_data / control_logs (also GET /api/export/<dataset>)
+    from services.export import init_app as init_export
+    init_export(app)
+
+    # History rollups follow every accepted reading, written after each flush
+    rollups.configure(db)
+    ingest_buffer.subscribe(rollups.add)
+    ingest_buffer.on_flush(rollups.flush)
+
+    # Newest readings per unit in compact arrays for window stats and short-range graphs
+    from services.recent import recent_readings, record_recent
+    capacity = int(app.config['RECENT_WINDOW_HOURS'] * 3600 * app.config['RECENT_WINDOW_RATE'])
+    recent_readings.configure(capacity=capacity)
+    if capacity:
+        ingest_buffer.subscribe(record_recent)
+
+    # Push new readings to /api/stream subscribers
+    ingest_buffer.subscribe(publish_readings)
+
+    # Server-side alerts against the active plant's ranges
+    from services.alerts import alert_engine
+    from services.broker import broker
+    alert_engine.configure(db, plants=plant_registry, publish=broker.publish)
+    ingest_buffer.subscribe(alert_engine.submit)
     if db:
-        # 1. Plants
-        plants_ref = db.collection('plants')
-        if not next(plants_ref.limit(1).stream(), None):
-            print("🌱 Seeding Default Plant...")
-            default_plant = Plant(name="Lettuce")
-            plants_ref.add(default_plant.to_dict())
-
-        # 2. Controls
-        controls_ref = db.collection('control_status')
-        if not next(controls_ref.limit(1).stream(), None):
-            print("🔌 Seeding Default Controls...")
-            controls = ['n_pump', 'p_pump', 'k_pump', 'ph_up_pump', 'ph_down_pump', 
-                        'circulation_pump', 'stirring_motor', 'oxygen_motor',
-                        'environmental_fans', 'cpu_fans', 'grow_light']
-            for name in controls:
-                # Use name as doc ID
-                controls_ref.document(name).set(ControlStatus(name=name).to_dict())
-        
-        # 3. Tanks
-        tanks_ref = db.collection('tanks')
-        if not next(tanks_ref.limit(1).stream(), None):
-             print("🛢️ Seeding Default Tanks...")
-             tanks = ['n_tank', 'p_tank', 'k_tank', 'ph_up_tank', 'ph_down_tank', 'main_tank']
-             for name in tanks:
-                 tanks_ref.document(name).set(TankLevel(name=name).to_dict())
+        alert_engine.start()
+        ingest_buffer.start()
+        if app.config['SIMULATE_SENSORS']:
+            start_simulator(ingest_buffer)
+
+    # In-memory control table for the interlock checks
+    from services.controls import control_state
+    control_state.configure(store=db)
+
+    # Tank levels estimated from pump run time, updated on every pump switch
+    from services.tanks import tank_model, init_app as init_tanks
+    tank_model.configure(store=db)
+    init_tanks(app)
+
+    # Control logs are committed in batches off the request thread
+    from services.logs import log_writer
+    log_writer.configure(db)
+    if db:
+        log_writer.start()
+
+    from services.controller import control_loop
+    control_loop.configure(db, plant_registry, ingest_buffer, units=unit_registry,
+                           max_age=app.config['SENSOR_MAX_AGE'], interval=app.config['CONTROL_LOOP_INTERVAL'],
+                           ready=seeder.ensure if app.config['AUTO_SEED'] else None)
+    if db and app.config['CONTROL_LOOP_ENABLED']:
+        control_loop.start()
+
+    # Image uploads and asynchronous scan jobs
+    from services.images import image_store, analysis_jobs
+    from services.vision import leaf_analyzer
+    image_store.configure(root=app.config['IMAGE_ROOT'], max_bytes=app.config['MAX_IMAGE_BYTES'])
+    leaf_analyzer.configure(plant_registry, ingest_buffer, max_age=app.config['SCAN_SENSOR_MAX_AGE'])
+    analysis_jobs.configure(analyzer=leaf_analyzer, publish=broker.publish,
+                            max_pending=app.config['ANALYSIS_MAX_PENDING'])
 
+    metrics.record_startup('total', (time.perf_counter() - started) * 1000)
     return app
 
 if __name__ == '__main__':
+    # Development server (one process, so it runs the control loop too);
+    # production runs wsgi:app under a WSGI server
+    os.environ.setdefault('CONTROL_LOOP', '1')
     app = create_app()
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG', '1') == '1')
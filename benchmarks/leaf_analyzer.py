@@ -0,0 +1,94 @@
+"""Images/sec for the leaf health analyzer on CPU.
+
+    python benchmarks/leaf_analyzer.py [--frames 256] [--workers 4] [--images DIR]
+
+Scores synthetic frames in one process (feature extraction only), then, if
+Pillow is installed, decodes and scores real files end to end both in-process
+and over the process pool. Without --images the end-to-end run uses copies of
+static/images/aura.jpg.
+"""
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.vision import FRAME_SIZE, LeafAnalyzer, frame_features  # noqa: E402
+
+
+def synthetic_frames(count, size=FRAME_SIZE, seed=0):
+    # Green canopy with random yellow and white blotches on a grey background
+    rng = np.random.default_rng(seed)
+    frames = np.empty((count, size, size, 3), dtype=np.uint8)
+    frames[:] = (120, 120, 120)
+    frames[:, size // 8:-size // 8, size // 8:-size // 8] = (40, 150, 50)
+    for i in range(count):
+        for color in ((210, 200, 40), (235, 235, 230)):
+            y, x = rng.integers(size // 8, size - size // 4, 2)
+            frames[i, y:y + size // 8, x:x + size // 8] = color
+    return frames
+
+
+def rate(label, count, seconds):
+    print(f"{label:<32} {count:>6} images  {seconds:8.3f}s  {count / seconds:10.1f} img/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--frames', type=int, default=256)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--images', help='directory of JPEG/PNG files to score')
+    args = parser.parse_args()
+
+    frames = synthetic_frames(args.frames)
+    frame_features(frames[:4])  # warm up
+    start = time.perf_counter()
+    frame_features(frames)
+    rate(f'features, batch of {args.frames}', args.frames, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for frame in frames:
+        frame_features(frame)
+    rate('features, one at a time', args.frames, time.perf_counter() - start)
+
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        print('Pillow not installed: skipping decode + score runs')
+        return
+
+    tmp = None
+    if args.images:
+        paths = sorted(p for p in glob.glob(os.path.join(args.images, '*'))
+                       if p.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')))
+    else:
+        tmp = tempfile.mkdtemp()
+        source = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'images', 'aura.jpg')
+        paths = []
+        for i in range(min(args.frames, 64)):
+            paths.append(os.path.join(tmp, f'{i}.jpg'))
+            shutil.copyfile(source, paths[-1])
+
+    try:
+        analyzer = LeafAnalyzer(workers=args.workers)
+        start = time.perf_counter()
+        analyzer.analyze_batch(paths, pool=False)
+        rate('decode + score, in-process', len(paths), time.perf_counter() - start)
+
+        analyzer.analyze_batch(paths[:args.workers * 16])  # start the pool
+        start = time.perf_counter()
+        analyzer.analyze_batch(paths)
+        rate(f'decode + score, {args.workers} workers', len(paths), time.perf_counter() - start)
+    finally:
+        if tmp:
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
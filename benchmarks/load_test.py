@@ -0,0 +1,308 @@
+"""Load test for the Flask app against an in-process fake store.
+
+    python benchmarks/load_test.py [--dashboards 8] [--iterations 200]
+        [--read-latency-ms 2] [--write-latency-ms 5] [--output run.json]
+        [--compare baseline.json]
+
+Boots create_app() on a MemoryStore that sleeps for the injected latency on
+every read, query and commit and counts them per request (including the
+reads it fans out on the read pool, which run in a copy of its context). It then
+runs a fixed, seeded mix of workers concurrently:
+
+  dashboards  N browsers polling /api/sensor-data and /api/controls (with
+              If-None-Match, like the pages do) plus a page load now and then
+  sensor      the Pi posting a reading per iteration
+  toggles     bursts of manual pump/fan toggles
+  estop       an emergency stop every so often
+  login       fresh sessions logging in
+
+Per endpoint it reports requests, errors, throughput, p50/p95/p99/max latency
+and the mean store gets/queries/docs/commits issued on behalf of the request.
+Background writers (ingest flush, log writer) are reported separately. The
+JSON written with --output is stable across runs so two versions can be
+diffed; --compare prints the change in p50/p95 and store calls per endpoint.
+"""
+import argparse
+import contextvars
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+os.environ.setdefault('CONTROL_LOOP', '0')
+os.environ.setdefault('ASSET_BUILD', '0')
+
+import firebase_config  # noqa: E402
+from storage import MemoryStore  # noqa: E402
+
+COUNTERS = ('gets', 'queries', 'docs', 'commits')
+TOGGLES = ('n_pump', 'p_pump', 'k_pump', 'circulation_pump', 'oxygen_motor', 'environmental_fans', 'grow_light')
+
+
+class LatencyStore(MemoryStore):
+    """MemoryStore with injected latency and per-request call counters.
+
+    The counters live in a contextvar, like services.metrics: read-pool
+    tasks run in a copy of the caller's context and so share its dict.
+    """
+    name = 'latency'
+
+    def __init__(self, read_latency=0.0, write_latency=0.0):
+        super().__init__()
+        self.read_latency = read_latency
+        self.write_latency = write_latency
+        self._counts = contextvars.ContextVar('store_counts')
+        self._totals_lock = threading.Lock()
+        self.totals = dict.fromkeys(COUNTERS, 0)
+
+    def counters(self):
+        # This context's counters since the last reset
+        counts = self._counts.get(None)
+        if counts is None:
+            counts = dict.fromkeys(COUNTERS, 0)
+            self._counts.set(counts)
+        return counts
+
+    def reset(self):
+        self._counts.set(dict.fromkeys(COUNTERS, 0))
+
+    def _count(self, key, n=1):
+        self.counters()[key] += n
+        with self._totals_lock:
+            self.totals[key] += n
+
+    def _get(self, collection, doc_id):
+        self._count('gets')
+        self._count('docs')
+        time.sleep(self.read_latency)
+        return super()._get(collection, doc_id)
+
+    def _run_query(self, query):
+        self._count('queries')
+        time.sleep(self.read_latency)
+        rows = list(super()._run_query(query))
+        self._count('docs', len(rows))
+        return rows
+
+    def _commit(self, ops):
+        self._count('commits')
+        time.sleep(self.write_latency)
+        return super()._commit(ops)
+
+
+class Recorder:
+    def __init__(self, store):
+        self.store = store
+        self.samples = defaultdict(list)  # endpoint -> [(ms, status, counts)]
+        self._lock = threading.Lock()
+
+    def call(self, client, endpoint, method, url, **kwargs):
+        self.store.reset()
+        started = time.perf_counter()
+        response = getattr(client, method)(url, **kwargs)
+        response.close()
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.samples[endpoint].append((elapsed, response.status_code, dict(self.store.counters())))
+        return response
+
+
+def login(client, email, password):
+    return client.post('/login', data={'email': email, 'password': password})
+
+
+def dashboard(app, rec, rng, iterations, creds):
+    client = app.test_client()
+    login(client, *creds)
+    etag = None
+    for i in range(iterations):
+        rec.call(client, 'GET /api/sensor-data', 'get', '/api/sensor-data')
+        headers = {'If-None-Match': etag} if etag else {}
+        response = rec.call(client, 'GET /api/controls', 'get', '/api/controls', headers=headers)
+        etag = response.headers.get('ETag') or etag
+        if rng.random() < 0.05:
+            page = rng.choice(['/monitor', '/controls', '/tanks'])
+            rec.call(client, f'GET {page}', 'get', page)
+        if rng.random() < 0.05:
+            rec.call(client, 'GET /api/sensor-history', 'get', '/api/sensor-history?sensor=ph&range=1H')
+
+
+def sensor(app, rec, rng, iterations, api_key):
+    client = app.test_client()
+    for i in range(iterations):
+        reading = {
+            'temperature': rng.uniform(20, 30), 'humidity': rng.uniform(40, 70),
+            'ph': rng.uniform(5.6, 6.4), 'tds': rng.uniform(800, 1200),
+            'water_level': rng.uniform(80, 100), 'cpu_temp': rng.uniform(40, 60)
+        }
+        rec.call(client, 'POST /api/sensor-data', 'post', '/api/sensor-data',
+                 json=reading, headers={'X-API-Key': api_key})
+
+
+def toggles(app, rec, rng, iterations, creds):
+    client = app.test_client()
+    login(client, *creds)
+    for i in range(0, iterations, 5):
+        # Bursts of five toggles back to back
+        for _ in range(5):
+            rec.call(client, 'POST /api/controls', 'post', '/api/controls',
+                     json={'name': rng.choice(TOGGLES), 'state': rng.random() < 0.5})
+        time.sleep(0.001)
+
+
+def estop(app, rec, rng, iterations, creds):
+    client = app.test_client()
+    login(client, *creds)
+    for i in range(max(1, iterations // 20)):
+        rec.call(client, 'POST /api/controls/emergency-stop', 'post', '/api/controls/emergency-stop')
+        time.sleep(0.01)
+
+
+def logins(app, rec, rng, iterations, creds):
+    for i in range(max(1, iterations // 10)):
+        client = app.test_client()
+        rec.call(client, 'POST /login', 'post', '/login', data={'email': creds[0], 'password': creds[1]})
+
+
+def summarize(rec, elapsed):
+    endpoints = {}
+    for endpoint in sorted(rec.samples):
+        rows = rec.samples[endpoint]
+        ms = np.array([r[0] for r in rows])
+        errors = sum(1 for r in rows if r[1] >= 500 or r[1] in (401, 404))
+        endpoints[endpoint] = {
+            'requests': len(rows),
+            'errors': errors,
+            'throughput_rps': round(len(rows) / elapsed, 2),
+            'p50_ms': round(float(np.percentile(ms, 50)), 3),
+            'p95_ms': round(float(np.percentile(ms, 95)), 3),
+            'p99_ms': round(float(np.percentile(ms, 99)), 3),
+            'max_ms': round(float(ms.max()), 3),
+            'store_per_request': {
+                key: round(sum(r[2][key] for r in rows) / len(rows), 3) for key in COUNTERS
+            }
+        }
+    return endpoints
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def print_table(result, out=sys.stderr):
+    print(f"{'endpoint':<36} {'reqs':>6} {'err':>4} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} "
+          f"{'gets':>6} {'qry':>6} {'docs':>7} {'commit':>6}", file=out)
+    for endpoint, row in result['endpoints'].items():
+        store = row['store_per_request']
+        print(f"{endpoint:<36} {row['requests']:>6} {row['errors']:>4} {row['throughput_rps']:>8} "
+              f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8} "
+              f"{store['gets']:>6} {store['queries']:>6} {store['docs']:>7} {store['commits']:>6}", file=out)
+    print(f"total {result['total_requests']} requests in {result['elapsed_s']}s "
+          f"({result['throughput_rps']} req/s); background store calls: {result['background_store']}", file=out)
+
+
+def print_compare(result, baseline, out=sys.stderr):
+    print(f"\nvs {baseline['meta'].get('revision')}:", file=out)
+    for endpoint, row in result['endpoints'].items():
+        old = baseline['endpoints'].get(endpoint)
+        if not old:
+            print(f"  {endpoint:<36} new", file=out)
+            continue
+        calls = sum(row['store_per_request'][k] for k in COUNTERS if k != 'docs')
+        old_calls = sum(old['store_per_request'][k] for k in COUNTERS if k != 'docs')
+        print(f"  {endpoint:<36} p50 {row['p50_ms'] - old['p50_ms']:+8.3f}ms  "
+              f"p95 {row['p95_ms'] - old['p95_ms']:+8.3f}ms  store calls {calls - old_calls:+.3f}", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--dashboards', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=200, help='iterations per worker')
+    parser.add_argument('--read-latency-ms', type=float, default=2.0)
+    parser.add_argument('--write-latency-ms', type=float, default=5.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON result here (default: stdout)')
+    parser.add_argument('--compare', help='previous JSON result to diff against')
+    args = parser.parse_args()
+
+    store = LatencyStore(args.read_latency_ms / 1000, args.write_latency_ms / 1000)
+    firebase_config.db = store  # routes import db from here when create_app registers them
+    os.environ['INGEST_API_KEY'] = api_key = 'load-test'
+
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    creds = ('load@test.local', 'load-test-password')
+    app.test_client().post('/sign-up', data={'email': creds[0], 'name': 'Load', 'password': creds[1]})
+
+    rec = Recorder(store)
+    workers = [(dashboard, creds)] * args.dashboards + [
+        (sensor, api_key), (toggles, creds), (estop, creds), (logins, creds)
+    ]
+    threads = [
+        threading.Thread(target=fn, args=(app, rec, random.Random(args.seed + i), args.iterations, extra))
+        for i, (fn, extra) in enumerate(workers)
+    ]
+    before = dict(store.totals)
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    from services.ingest import ingest_buffer
+    from services.logs import log_writer
+    ingest_buffer.flush()
+    log_writer.flush()
+
+    endpoints = summarize(rec, elapsed)
+    total = sum(row['requests'] for row in endpoints.values())
+    foreground = {k: sum(len(rec.samples[e]) * endpoints[e]['store_per_request'][k] for e in endpoints) for k in COUNTERS}
+    result = {
+        'meta': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'dashboards': args.dashboards,
+            'iterations': args.iterations,
+            'read_latency_ms': args.read_latency_ms,
+            'write_latency_ms': args.write_latency_ms,
+            'seed': args.seed,
+        },
+        'elapsed_s': round(elapsed, 3),
+        'total_requests': total,
+        'throughput_rps': round(total / elapsed, 2),
+        'background_store': {k: round(store.totals[k] - before[k] - foreground[k]) for k in COUNTERS},
+        'endpoints': endpoints,
+    }
+
+    print_table(result)
+    if args.compare:
+        with open(args.compare) as f:
+            print_compare(result, json.load(f))
+    text = json.dumps(result, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    os._exit(0)  # background threads (ingest, log writer) are daemons; skip their atexit flush
+
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,81 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
 import os
+import threading
 
-db = None
+from storage import create_store
+
+# Storage backend: 'firestore', 'sqlite', 'memory' or 'auto' (Firestore when
+# the service account key exists, local SQLite otherwise)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'auto')
+STORAGE_PATH = os.environ.get('STORAGE_PATH', 'instance/store.db')
+CRED_PATH = os.environ.get('FIREBASE_CREDENTIALS', 'serviceAccountKey.json')
+
+def resolve_backend(backend=None):
+    backend = backend or STORAGE_BACKEND
+    if backend == 'auto':
+        backend = 'firestore' if os.path.exists(CRED_PATH) else 'sqlite'
+    return backend
+
+def initialize_firebase(backend=None):
+    backend = resolve_backend(backend)
+
+    if backend != 'firestore':
+        db = create_store(backend, path=STORAGE_PATH)
+        print(f"✅ Using local {backend} storage.")
+        return db
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
 
-def initialize_firebase():
-    global db
     if not firebase_admin._apps:
-        cred_path = 'serviceAccountKey.json'
-        
-        if os.path.exists(cred_path):
-            cred = credentials.Certificate(cred_path)
+        if os.path.exists(CRED_PATH):
+            cred = credentials.Certificate(CRED_PATH)
             firebase_admin.initialize_app(cred)
-            db = firestore.client()
+            db = create_store('firestore', client=firestore.client())
             print("✅ Firebase initialized successfully.")
         else:
             print("WARNING: serviceAccountKey.json not found. Firebase features will not work.")
             db = None # Application should handle this gracefully (e.g. show setup page)
     else:
-        db = firestore.client()
+        db = create_store('firestore', client=firestore.client())
 
     return db
 
-# Initialize on import so 'db' is available
-initialize_firebase()
+class LazyStore:
+    """Stands in for the store until something actually uses it.
+
+    Importing this module (and so every route module) costs nothing: the
+    Firestore client or SQLite file is only opened by the first collection()
+    or batch() call, once per process. Truthiness only says whether a
+    backend is configured, so `if db:` checks never touch the store.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._store = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._store is not None
+
+    def resolve(self):
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = initialize_firebase(self.backend)
+        return self._store
+
+    def __bool__(self):
+        if self._store is not None:
+            return True
+        backend = resolve_backend(self.backend)
+        return backend != 'firestore' or os.path.exists(CRED_PATH)
+
+    def __getattr__(self, attr):
+        store = self.resolve()
+        if store is None:
+            raise RuntimeError('No store configured: serviceAccountKey.json not found')
+        return getattr(store, attr)
+
+
+db = LazyStore()
@@ -1,5 +1,10 @@
+import hashlib
+import json
 from datetime import datetime
 
+# Grow unit used when a request or reading does not name one
+DEFAULT_UNIT = 'default'
+
 class User:
     def __init__(self, email, password_hash, name, id=None):
         self.id = id
@@ -24,7 +29,7 @@ class User:
     def get_id(self): return str(self.id)
 
 class Plant:
-    def __init__(self, name, category="Leafy", control_pref=None, env_ranges=None, nutrient_ranges=None, id=None):
+    def __init__(self, name, category="Leafy", control_pref=None, env_ranges=None, nutrient_ranges=None, id=None, start_date=None, expected_days=60):
         self.id = id
         self.name = name
         self.category = category
@@ -47,8 +52,8 @@ class Plant:
             'safety_max_temp': 40.0,
             'safety_min_water': 15.0
         }
-        self.start_date = datetime.utcnow()
-        self.expected_days = 60
+        self.start_date = start_date or datetime.utcnow()
+        self.expected_days = expected_days
 
     def to_dict(self):
         return {
@@ -62,9 +67,21 @@ class Plant:
         }
 
 class SensorData:
-    def __init__(self, data_dict):
-        self.timestamp = datetime.utcnow()
+    # Fixed reading schema reported by the Pi
+    FIELDS = ('temperature', 'humidity', 'ph', 'tds', 'n_val', 'p_val', 'k_val',
+              'water_temp', 'water_level', 'light_intensity', 'cpu_temp', 'gas_status')
+
+    def __init__(self, data_dict, timestamp=None, unit_id=DEFAULT_UNIT, id=None):
+        self.timestamp = timestamp or datetime.utcnow()
         self.data = data_dict # Includes temp, ph, etc.
+        self.unit_id = unit_id # Partition key, not stored in the document
+        # Document id: the Pi's own id, else derived from the content so a
+        # re-sent reading overwrites itself instead of being stored twice
+        self.id = id or self.content_id()
+
+    def content_id(self):
+        key = json.dumps([self.unit_id, self.timestamp.isoformat(), sorted(self.data.items())])
+        return hashlib.sha1(key.encode()).hexdigest()[:20]
 
     def to_dict(self):
         return {
@@ -73,7 +90,10 @@ class SensorData:
         }
 
 class ControlStatus:
-    def __init__(self, name, id=None, is_on=False, settings=None, mode='manual', locked=False, locked_reason=None, last_active=None):
+    # 'manual' is switched by users only; the control loop drives the others
+    MODES = ('manual', 'auto', 'schedule')
+
+    def __init__(self, name, id=None, is_on=False, settings=None, mode='manual', locked=False, locked_reason=None, last_active=None, last_inactive=None):
         self.id = id or name # Use name as ID for controls usually
         self.name = name
         self.is_on = is_on
@@ -84,6 +104,7 @@ class ControlStatus:
         self.locked = locked
         self.locked_reason = locked_reason
         self.last_active = last_active
+        self.last_inactive = last_inactive  # when it last switched off
 
     def to_dict(self):
         return {
@@ -93,12 +114,14 @@ class ControlStatus:
             'mode': self.mode,
             'locked': self.locked,
             'locked_reason': self.locked_reason,
-            'last_active': self.last_active
+            'last_active': self.last_active,
+            'last_inactive': self.last_inactive
         }
 
 class ControlLog:
-    def __init__(self, control_name, action, trigger='manual', details=None):
+    def __init__(self, control_name, action, trigger='manual', details=None, unit_id=DEFAULT_UNIT):
         self.timestamp = datetime.utcnow()
+        self.unit_id = unit_id
         self.control_name = control_name
         self.action = action
         self.trigger = trigger
@@ -114,14 +137,21 @@ class ControlLog:
         }
 
 class TankLevel:
-    def __init__(self, name, level_percent=100.0):
+    def __init__(self, name, level_percent=100.0, capacity_ml=None, pump=None, refilled_at=None):
         self.name = name
+        # Level measured at refilled_at; the tank model subtracts pump usage since
         self.level_percent = level_percent
+        self.capacity_ml = capacity_ml
+        self.pump = pump  # control that draws from this tank, default <x>_pump for <x>_tank
+        self.refilled_at = refilled_at
 
     def to_dict(self):
         return {
             'name': self.name,
-            'level_percent': self.level_percent
+            'level_percent': self.level_percent,
+            'capacity_ml': self.capacity_ml,
+            'pump': self.pump,
+            'refilled_at': self.refilled_at
         }
 
 
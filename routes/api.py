@@ -1,40 +1,150 @@
-from flask import Blueprint, jsonify, request
-from models import SensorData, ControlStatus, ControlLog
+from flask import Blueprint, Response, g, jsonify, request, current_app, send_file, url_for
+from models import ControlStatus, ControlLog
 from firebase_config import db
-from flask_login import login_required
+from storage import Query
+from services.export import ExportError, export_filename, export_stream
+from services.ingest import ingest_buffer, decode_payload, parse_reading, parse_timestamp, IngestError
+from services.logs import log_writer
+from services.alerts import alert_engine
+from services.broker import broker, format_sse
+from services.controls import MAX_BATCH_CHANGES, control_state, switch_control, switch_controls, estop_timings
+from services.controller import control_loop
+from services.images import image_store, analysis_jobs, ImageError, JobsBusy
+from services.rollups import rollups, resolve_sensor, resolve_range, DEFAULT_POINTS, MAX_POINTS, RANGES
+from services.recent import recent_readings
+from services.tanks import tank_model
+from services.units import unit_registry, unit_collection, valid_unit_id
+from flask_login import login_required, current_user
 import datetime
-import random
+import json
+import os
+import time
 
 api = Blueprint('api', __name__)
 
 @api.route('/api/sensor-data', methods=['GET'])
 @login_required
 def get_sensor_data():
-    # Simulate hardware pushing data to Firestore
-    # In production, Pi would write to Firestore directly or via a specific API key
-    
-    new_data = {
-        'temperature': random.uniform(20, 30),
-        'humidity': random.uniform(40, 70),
-        'ph': random.uniform(5.5, 6.5),
-        'tds': random.uniform(800, 1200),
-        'n_val': random.uniform(100, 200),
-        'p_val': random.uniform(30, 50),
-        'k_val': random.uniform(100, 300),
-        'water_temp': random.uniform(18, 25),
-        'water_level': random.uniform(80, 100),
-        'light_intensity': random.uniform(1000, 5000),
-        'cpu_temp': random.uniform(40, 60),
-        'gas_status': 0
-    }
-    
-    if db:
-        # Create SensorData object
-        record = SensorData(new_data)
-        db.collection('sensor_data').add(record.to_dict())
-        return jsonify(new_data)
-        
-    return jsonify(new_data) # Fallback if no DB
+    # Pure read: readings arrive through POST /api/sensor-data
+    latest = ingest_buffer.latest(g.unit)
+    if not latest:
+        return jsonify({})
+    return jsonify(latest.data)
+
+@api.route('/api/sensor-data', methods=['POST'])
+def ingest_sensor_data():
+    # The Pi authenticates with a shared key, browsers with their session
+    api_key = current_app.config.get('INGEST_API_KEY')
+    if not current_user.is_authenticated:
+        if not api_key or request.headers.get('X-API-Key') != api_key:
+            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+    # Edge spools upload gzip-compressed batches
+    try:
+        payload = decode_payload(request.get_data(), request.headers.get('Content-Encoding'))
+    except IngestError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if payload is None:
+        return jsonify({'success': False, 'error': 'Expected a JSON reading or list of readings'}), 400
+
+    readings = payload if isinstance(payload, list) else [payload]
+    if len(readings) > current_app.config.get('INGEST_MAX_READINGS', 1000):
+        return jsonify({'success': False, 'error': 'Too many readings in one request'}), 413
+
+    # A reading may name its own unit_id; otherwise it belongs to the request's unit
+    records = []
+    try:
+        for reading in readings:
+            unit_id = reading.get('unit_id', g.unit) if isinstance(reading, dict) else g.unit
+            if not valid_unit_id(unit_id) or not unit_registry.exists(unit_id):
+                return jsonify({'success': False, 'error': f'Unknown unit: {unit_id}'}), 404
+            records.append(parse_reading(reading, unit_id=unit_id))
+    except IngestError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    accepted = ingest_buffer.add(records)
+    return jsonify({'success': True, 'accepted': accepted}), 202
+
+@api.route('/api/sensor-history', methods=['GET'])
+@login_required
+def get_sensor_history():
+    field = resolve_sensor(request.args.get('sensor', ''))
+    if not field:
+        return jsonify({'success': False, 'error': 'Unknown sensor'}), 400
+
+    range_key = resolve_range(request.args.get('range', '1H'))
+    if not range_key:
+        return jsonify({'success': False, 'error': 'Range must be one of 1H, 24H, 7D, 30D'}), 400
+
+    points = request.args.get('points', DEFAULT_POINTS, type=int)
+    points = max(2, min(points, MAX_POINTS))
+
+    # Served from the in-memory window at full resolution when it reaches back far enough
+    now = datetime.datetime.utcnow()
+    since = now - datetime.timedelta(seconds=RANGES[range_key][1])
+    window = recent_readings.unit(g.unit)
+    if window.covers(since):
+        return jsonify(window.history(field, since, points, range_key, now=now))
+    return jsonify(rollups.history(field, range_key, points=points, unit_id=g.unit, now=now))
+
+@api.route('/api/sensor-stats', methods=['GET'])
+@login_required
+def get_sensor_stats():
+    # min/max/avg/last of every field over the last `window` seconds, from memory
+    seconds = max(1, min(request.args.get('window', 3600, type=int), 7 * 86400))
+    since = datetime.datetime.utcnow() - datetime.timedelta(seconds=seconds)
+    window = recent_readings.unit(g.unit)
+    return jsonify({
+        'window': seconds,
+        'complete': window.covers(since),
+        'fields': window.summary(since=since)
+    })
+
+@api.route('/api/alerts', methods=['GET'])
+@login_required
+def get_alerts():
+    if request.args.get('active'):
+        alerts = alert_engine.active(g.unit)
+    else:
+        limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+        alerts = alert_engine.history(limit=limit, unit_id=g.unit)
+
+    for alert in alerts:
+        for key in ('started_at', 'cleared_at'):
+            if isinstance(alert.get(key), datetime.datetime):
+                alert[key] = alert[key].isoformat()
+    return jsonify({'alerts': alerts})
+
+@api.route('/api/stream', methods=['GET'])
+@login_required
+def stream():
+    # Server-Sent Events: control changes and new sensor readings for one unit
+    unit_id = g.unit
+    last_id = request.headers.get('Last-Event-ID', request.args.get('lastEventId'))
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        last_id = None
+
+    def generate():
+        yield "retry: 3000\n\n"
+        cursor = last_id
+        if cursor is None or not broker.can_resume(cursor):
+            cursor = broker.last_id
+            if last_id is not None:
+                # Missed events were dropped from history: client refetches once
+                yield format_sse(cursor, 'reset', '{}')
+            latest = ingest_buffer.latest(unit_id)
+            if latest:
+                yield format_sse(cursor, 'sensor', json.dumps(latest.data))
+
+        for item in broker.listen(cursor, unit_id=unit_id):
+            yield ": keepalive\n\n" if item is None else format_sse(*item)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 @api.route('/api/controls', methods=['GET', 'POST'])
 @login_required
@@ -42,96 +152,113 @@ def update_control():
     if not db:
         return jsonify({'success': False, 'error': 'Database not connected'}), 500
 
-    controls_ref = db.collection('control_status')
-    
     if request.method == 'POST':
         data = request.json
         name = data.get('name')
         state = data.get('state') # True/False
         
-        doc_ref = controls_ref.document(name)
-        doc = doc_ref.get()
+        status, message = switch_control(
+            db, name, state, ingest_buffer.latest(g.unit), current_app.config['SENSOR_MAX_AGE'],
+            trigger="manual", details="User toggled via UI", unit_id=g.unit
+        )
+        if status == 'not_found':
+            return jsonify({'success': False, 'error': message}), 404
+        if status == 'blocked':
+            return jsonify({"success": False, "message": message}), 403
         
-        if doc.exists:
-            control_data = doc.to_dict()
-            
-            # --- Advanced Safety Logic ---
-            
-            # 1. Check Locks
-            if control_data.get('locked', False) and state:
-                return jsonify({
-                    "success": False, 
-                    "message": f"Action Blocked: {control_data.get('locked_reason', 'Safety Lock Active')}"
-                }), 403
-
-            # 2. Get Latest Sensor Data for Interlocks
-            sensor_query = db.collection('sensor_data').order_by('timestamp', direction=firestore.Query.DESCENDING).limit(1).stream()
-            latest_sensor = next(sensor_query, None)
-            sensor_val = latest_sensor.to_dict() if latest_sensor else {}
-
-            # 3. Water Level Protection (Pumps)
-            if 'pump' in name and sensor_val.get('water_level', 100) < 15.0:
-                 return jsonify({
-                    "success": False, 
-                    "message": "Action Blocked: Low Water Level (Run Dry Protection)"
-                }), 403
-
-            # 4. pH Interlock (Simultaneous Dosing)
-            if 'ph' in name:
-                opposite = 'ph_down_pump' if 'up' in name else 'ph_up_pump'
-                opp_doc = controls_ref.document(opposite).get()
-                if opp_doc.exists and opp_doc.to_dict().get('is_on', False) and state:
-                     return jsonify({
-                        "success": False, 
-                        "message": "Action Blocked: Cannot dose pH Up and Down simultaneously."
-                    }), 403
-            
-            # --- Apply Change ---
-            
-            update_data = {'is_on': state}
-            if state:
-                update_data['last_active'] = datetime.datetime.utcnow()
-            
-            doc_ref.update(update_data)
-            
-            # --- Log Action ---
-            log_entry = ControlLog(
-                control_name=name,
-                action="ON" if state else "OFF",
-                trigger="manual",
-                details="User toggled via UI"
-            )
-            db.collection('control_logs').add(log_entry.to_dict())
-            
-            return jsonify({'success': True, 'new_state': state})
-            
-        return jsonify({'success': False, 'error': 'Control not found'}), 404
+        return jsonify({'success': True, 'new_state': state})
         
-    # GET - return all states
-    docs = controls_ref.stream()
-    # Return simple key-value for frontend compatibility or full objects? 
-    # The frontend expects {name: state}.
-    res = {}
-    for doc in docs:
-        d = doc.to_dict()
-        res[d['name']] = d['is_on']
-    return jsonify(res)
+    # GET - return all states from memory, or 304 when unchanged
+    controls = control_state.unit(g.unit)
+    etag = controls.etag()
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    since = request.args.get('since', type=int)
+    if since is not None:
+        # Delta mode: only controls changed after `since`
+        changed = controls.delta(since)
+        res = {
+            'version': controls.version,
+            'full': changed is None,
+            'controls': controls.states() if changed is None else changed
+        }
+    else:
+        # The frontend expects {name: state}.
+        res = controls.states()
+
+    response = jsonify(res)
+    response.set_etag(etag)
+    response.headers['X-Control-Version'] = str(controls.version)
+    response.headers['Vary'] = 'Cookie, X-Unit-Id'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@api.route('/api/controls/batch', methods=['POST'])
+@login_required
+def update_controls_batch():
+    # {"changes": [{"name", "state"}, ...], "atomic": false}: one interlock
+    # pass and one commit for the lot. Atomic batches are all-or-nothing.
+    if not db:
+        return jsonify({'success': False, 'error': 'Database not connected'}), 500
+
+    data = request.get_json(silent=True) or {}
+    changes = data.get('changes')
+    if not isinstance(changes, list) or not changes:
+        return jsonify({'success': False, 'error': "'changes' must be a non-empty list"}), 400
+    if len(changes) > MAX_BATCH_CHANGES:
+        return jsonify({'success': False, 'error': f"At most {MAX_BATCH_CHANGES} changes per batch"}), 400
+    pairs = []
+    for change in changes:
+        if (not isinstance(change, dict) or not isinstance(change.get('name'), str)
+                or not isinstance(change.get('state'), bool)):
+            return jsonify({'success': False, 'error': "Each change needs a 'name' and a boolean 'state'"}), 400
+        pairs.append((change['name'], change['state']))
+    if len({name for name, _ in pairs}) < len(pairs):
+        return jsonify({'success': False, 'error': 'Each control may appear only once per batch'}), 400
+
+    atomic = bool(data.get('atomic', False))
+    try:
+        applied, results = switch_controls(
+            db, pairs, ingest_buffer.latest(g.unit), current_app.config['SENSOR_MAX_AGE'],
+            atomic=atomic, trigger="manual", details="User batch via UI", unit_id=g.unit
+        )
+    except Exception as e:
+        print(f"⚠️ Batch control commit failed: {e}")
+        return jsonify({'success': False, 'error': 'Database commit failed; nothing was applied'}), 500
+
+    ok = all(r['status'] == 'ok' for r in results)
+    body = {
+        'success': ok,
+        'applied': sum(r['status'] == 'ok' for r in results) if applied else 0,
+        'results': results
+    }
+    if atomic and not ok:
+        return jsonify(body), 409
+    return jsonify(body)
 
 @api.route('/api/controls/mode', methods=['POST'])
 @login_required
 def update_control_mode():
     if not db: return jsonify({'success': False}), 500
     
-    data = request.json
-    mode = data.get('mode') # manual, auto, schedule
-    
-    # Update all controls to this mode
-    # In a batch would be better, but loop is fine for < 20 docs
+    data = request.get_json(silent=True) or {}
+    mode = data.get('mode')
+    if mode not in ControlStatus.MODES:
+        return jsonify({'success': False, 'error': f"Mode must be one of {', '.join(ControlStatus.MODES)}"}), 400
+
+    # Update all controls to this mode in one commit
     batch = db.batch()
-    docs = db.collection('control_status').stream()
+    docs = unit_collection(db, g.unit, 'control_status').stream()
     for doc in docs:
         batch.update(doc.reference, {'mode': mode})
     batch.commit()
+    controls = control_state.unit(g.unit)
+    for name in controls.names():
+        controls.apply(name, {'mode': mode})
+    broker.publish('mode', {'mode': mode}, unit_id=g.unit)
     
     return jsonify({"success": True, "mode": mode})
 
@@ -139,53 +266,294 @@ def update_control_mode():
 @login_required
 def emergency_stop():
     if not db: return jsonify({'success': False}), 500
-    
-    # Find all active
-    active_docs = db.collection('control_status').where('is_on', '==', True).stream()
-    count = 0
-    batch = db.batch()
-    
-    for doc in active_docs:
-        batch.update(doc.reference, {'is_on': False})
-        
-        # Log
-        log = ControlLog(
-            control_name=doc.id,
-            action="OFF",
-            trigger="emergency",
-            details="Emergency Stop Triggered"
-        )
-        db.collection('control_logs').add(log.to_dict())
-        count += 1
-        
-    batch.commit()
-    return jsonify({"success": True, "message": f"Stopped {count} active devices."})
+
+    phases = {}
+    started = time.perf_counter()
+    mark = started
+
+    def phase(label):
+        nonlocal mark
+        now = time.perf_counter()
+        phases[label] = round((now - mark) * 1000, 3)
+        mark = now
+
+    controls = control_state.unit(g.unit)
+    with controls.lock:
+        # 1. De-energize in memory first: interlocks and the stream see it now
+        active = controls.active()
+        running = {name: controls.get(name) for name in active}
+        names = controls.names()
+        stopped_at = datetime.datetime.utcnow()
+        for name in active:
+            controls.apply(name, {'is_on': False, 'last_inactive': stopped_at})
+        phase('memory')
+
+        # 2. Tell subscribers (dashboards, the Pi) before touching the store
+        stopped = {name: False for name in active}
+        if stopped:
+            broker.publish('controls', stopped, unit_id=g.unit)
+        phase('publish')
+
+        # 3. One atomic batch: every control off (covers devices switched on
+        # by other workers since our table was loaded) plus a log per device
+        batch = db.batch()
+        controls_ref = unit_collection(db, g.unit, 'control_status')
+        logs_ref = unit_collection(db, g.unit, 'control_logs')
+        for name in names:
+            fields = {'is_on': False, 'last_inactive': stopped_at} if name in running else {'is_on': False}
+            batch.update(controls_ref.document(name), fields)
+        for name in active:
+            log = ControlLog(
+                control_name=name,
+                action="OFF",
+                trigger="emergency",
+                details="Emergency Stop Triggered",
+                unit_id=g.unit
+            )
+            batch.set(logs_ref.document(), log.to_dict())
+        tanks = tank_model.unit(g.unit)
+        usage = {}
+        for control in running.values():
+            usage.update(tanks.run_ended(control, stopped_at))
+        tanks.write(batch, usage)
+        phase('build')
+
+        try:
+            batch.commit()
+            committed = True
+            tanks.apply(usage)
+        except Exception as e:
+            committed = False
+            print(f"⚠️ Emergency stop commit failed: {e}")
+        phase('commit')
+
+    phases['total'] = round((time.perf_counter() - started) * 1000, 3)
+    estop_timings.record(phases)
+
+    if not committed:
+        return jsonify({
+            "success": False,
+            "message": "Devices stopped in memory but the database commit failed.",
+            "timings_ms": phases
+        }), 500
+    return jsonify({"success": True, "message": f"Stopped {len(active)} active devices.", "timings_ms": phases})
+
+@api.route('/api/controls/emergency-stop/timings', methods=['GET'])
+@login_required
+def emergency_stop_timings():
+    return jsonify(estop_timings.to_dict())
+
+@api.route('/api/tanks/forecast', methods=['GET'])
+@login_required
+def tanks_forecast():
+    # Estimated levels from the running usage aggregates, no log scans
+    forecast = tank_model.unit(g.unit).forecast(control_state.unit(g.unit), ingest_buffer.latest(g.unit))
+    return jsonify({'tanks': forecast, 'generated_at': datetime.datetime.utcnow().isoformat() + 'Z'})
+
+@api.route('/api/tanks/<name>/refill', methods=['POST'])
+@login_required
+def refill_tank(name):
+    if not db: return jsonify({'success': False}), 500
+    data = request.get_json(silent=True) or {}
+    try:
+        level = float(data.get('level_percent', 100.0))
+        capacity = float(data['capacity_ml']) if data.get('capacity_ml') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'level_percent and capacity_ml must be numbers'}), 400
+    if not 0 <= level <= 100 or (capacity is not None and capacity <= 0):
+        return jsonify({'success': False, 'error': 'level_percent must be 0-100 and capacity_ml positive'}), 400
+
+    if not tank_model.unit(g.unit).refill(name, level, capacity_ml=capacity):
+        return jsonify({'success': False, 'error': 'Tank not found'}), 404
+    return jsonify({'success': True, 'name': name, 'level_percent': level})
+
+@api.route('/api/units', methods=['GET', 'POST'])
+@login_required
+def units():
+    if request.method == 'POST':
+        if not db: return jsonify({'success': False}), 500
+        data = request.get_json(silent=True) or {}
+        try:
+            unit_id = unit_registry.register(data.get('id'), data.get('name'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        return jsonify({'success': True, 'id': unit_id}), 201
+
+    return jsonify({'units': unit_registry.all(), 'current': g.unit})
+
+@api.route('/api/controller', methods=['GET'])
+@login_required
+def controller_status():
+    return jsonify(control_loop.to_dict())
+
+@api.route('/api/control-logs', methods=['GET'])
+@login_required
+def get_control_logs():
+    if not db: return jsonify({'success': False}), 500
+
+    limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+    logs_ref = unit_collection(db, g.unit, 'control_logs')
+    query = logs_ref
+
+    # Filters (served by the (control_name|trigger, timestamp) indexes)
+    if request.args.get('control'):
+        query = query.where('control_name', '==', request.args['control'])
+    if request.args.get('trigger'):
+        query = query.where('trigger', '==', request.args['trigger'])
+    try:
+        if request.args.get('start'):
+            query = query.where('timestamp', '>=', parse_timestamp(request.args['start']))
+        if request.args.get('end'):
+            query = query.where('timestamp', '<', parse_timestamp(request.args['end']))
+    except IngestError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    query = query.order_by('timestamp', direction=Query.DESCENDING)
+
+    # Cursor is the id of the last log on the previous page
+    cursor = request.args.get('cursor')
+    if cursor:
+        cursor_doc = logs_ref.document(cursor).get()
+        if not cursor_doc.exists:
+            return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
+        query = query.start_after(cursor_doc)
+
+    docs = list(query.limit(limit + 1).stream())
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+
+    logs = []
+    for doc in docs:
+        entry = doc.to_dict()
+        entry['id'] = doc.id
+        entry['timestamp'] = entry['timestamp'].isoformat()
+        logs.append(entry)
+
+    return jsonify({
+        'logs': logs,
+        'next_cursor': docs[-1].id if has_more else None
+    })
+
+@api.route('/api/export/<dataset>', methods=['GET'])
+@login_required
+def export_dataset(dataset):
+    # Streams the whole range as gzip; resume with cursor=<id of the last row received>
+    if not db: return jsonify({'success': False}), 500
+
+    fmt = request.args.get('format', 'csv')
+    try:
+        start = parse_timestamp(request.args['start']) if request.args.get('start') else None
+        end = parse_timestamp(request.args['end']) if request.args.get('end') else None
+        chunks = export_stream(db, dataset, g.unit, fmt, start=start, end=end, cursor=request.args.get('cursor'))
+    except (ExportError, IngestError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    response = current_app.response_class(chunks, mimetype='application/gzip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{export_filename(dataset, g.unit, fmt)}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@api.route('/api/control-logs/stats', methods=['GET'])
+@login_required
+def control_log_stats():
+    return jsonify({**log_writer.stats, 'depth': log_writer.depth()})
 
 @api.route('/api/upload-image', methods=['POST'])
 @login_required
 def upload_image():
-    return jsonify({'success': True, 'message': 'Image uploaded successfully'}) # Mock
+    # Multipart 'image' field (spooled to disk by Werkzeug) or a raw image body
+    upload = request.files.get('image')
+    stream = upload.stream if upload else request.stream
+
+    try:
+        image_id, _, size, created = image_store.save_stream(stream)
+    except ImageError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    image_store.request_thumbnail(image_id)
+    return jsonify(_image_payload(image_id, size=size, duplicate=not created))
 
 @api.route('/api/capture-system-camera', methods=['GET'])
 @login_required
 def capture_system_camera():
-    return jsonify({
-        'success': True, 
-        'image_url': '/static/images/mock_pi_capture.jpg',
-        'timestamp': datetime.datetime.now().isoformat()
-    })
+    command = current_app.config.get('CAMERA_COMMAND')
+    if command:
+        # The camera can take seconds: capture as a job and let the page poll
+        try:
+            job = analysis_jobs.capture(command, image_store, unit_id=g.unit)
+        except JobsBusy as e:
+            return jsonify({'success': False, 'error': str(e)}), 503, {'Retry-After': '5'}
+        return jsonify({
+            'success': True,
+            'job_id': job['id'],
+            'status': job['status'],
+            'status_url': url_for('api.get_analysis_job', job_id=job['id'])
+        }), 202
+
+    # No camera configured: serve the bundled sample frame
+    sample = os.path.join(current_app.static_folder, 'images', 'mock_pi_capture.jpg')
+    try:
+        image_id, _, size, created = image_store.save_file(sample)
+    except ImageError as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    image_store.request_thumbnail(image_id)
+    return jsonify(_image_payload(image_id, size=size, duplicate=not created))
+
+@api.route('/api/images/<image_id>', methods=['GET'])
+@login_required
+def get_image(image_id):
+    path = image_store.find(image_id)
+    if not path:
+        return jsonify({'success': False, 'error': 'Image not found'}), 404
+    # Content addressed: the bytes behind an id never change
+    return send_file(os.path.abspath(path), max_age=31536000, etag=image_id)
+
+@api.route('/api/images/<image_id>/thumb', methods=['GET'])
+@login_required
+def get_image_thumb(image_id):
+    path = image_store.thumb_path(image_id)
+    if not image_store.find(image_id) or not os.path.exists(path):
+        return jsonify({'success': False, 'error': 'Thumbnail not ready'}), 404
+    return send_file(os.path.abspath(path), max_age=31536000, etag=f"{image_id}-thumb")
 
 @api.route('/api/analyze-image', methods=['POST'])
 @login_required
 def analyze_image():
-    # Simulate an AI analysis call
-    issues = [
-        {"health": "Healthy", "issue": "None", "confidence": 0.98, "cause": "Optimal conditions", "recommendation": "Maintain current nutrient levels"},
-        {"health": "Unhealthy", "issue": "Nitrogen Deficiency", "confidence": 0.87, "cause": "Low nitrogen availability", "recommendation": "Increase nitrogen concentration"},
-        {"health": "Unhealthy", "issue": "Powdery Mildew", "confidence": 0.76, "cause": "High humidity & poor airflow", "recommendation": "Improve ventilation and reduce humidity"},
-        {"health": "Unhealthy", "issue": "pH Imbalance", "confidence": 0.92, "cause": "pH outside optimal range of 5.5-6.5", "recommendation": "Calibrate sensors and adjust pH using reagents"}
-    ]
-    result = random.choice(issues)
-    result['sensor_validated'] = True # simplified
-    return jsonify(result)
+    data = request.get_json(silent=True) or {}
+    image_id = data.get('image_id')
+    path = image_store.find(image_id)
+    if not path:
+        return jsonify({'success': False, 'error': 'Upload the image first (unknown image_id)'}), 400
+
+    try:
+        job = analysis_jobs.submit(image_id, path, unit_id=g.unit)
+    except JobsBusy as e:
+        return jsonify({'success': False, 'error': str(e)}), 503, {'Retry-After': '5'}
+    return jsonify({
+        'success': True,
+        'job_id': job['id'],
+        'status': job['status'],
+        'status_url': url_for('api.get_analysis_job', job_id=job['id'])
+    }), 202
 
+@api.route('/api/analysis-jobs/<job_id>', methods=['GET'])
+@login_required
+def get_analysis_job(job_id):
+    job = analysis_jobs.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    if job['kind'] == 'capture' and job['status'] == 'done':
+        job['result'] = _image_payload(job['image_id'], size=job['result']['size'],
+                                       duplicate=job['result']['duplicate'])
+    return jsonify(job)
+
+def _image_payload(image_id, **extra):
+    return {
+        'success': True,
+        'image_id': image_id,
+        'image_url': url_for('api.get_image', image_id=image_id),
+        'thumb_url': url_for('api.get_image_thumb', image_id=image_id),
+        'timestamp': datetime.datetime.now().isoformat(),
+        **extra
+    }
@@ -3,6 +3,7 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import login_user, login_required, logout_user, current_user
 from models import User
 from firebase_config import db
+from services.users import user_cache
 
 auth = Blueprint('auth', __name__)
 
@@ -32,6 +33,7 @@ def login():
                     name=user_data['name'], 
                     id=user_doc.id # Use doc ID
                 )
+                user_cache.put(user_obj)
                 login_user(user_obj, remember=True)
                 return redirect(url_for('views.monitor'))
             else:
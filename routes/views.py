@@ -1,7 +1,13 @@
-from flask import Blueprint, render_template, request, redirect, url_for
+from flask import Blueprint, g, render_template, request, redirect, url_for
 from flask_login import login_required, current_user
-from models import Plant, ControlStatus, TankLevel
+from models import ControlStatus, TankLevel
 from firebase_config import db
+from services.controls import control_state
+from services.ingest import ingest_buffer
+from services.plants import plant_registry
+from services.tanks import tank_model
+from services.units import unit_collection
+from storage import read_pool
 
 views = Blueprint('views', __name__)
 
@@ -14,27 +20,17 @@ def home():
 @views.route('/monitor')
 @login_required
 def monitor():
-    plant = None
-    if db:
-        plant_docs = db.collection('plants').limit(1).stream()
-        p_doc = next(plant_docs, None)
-        if p_doc:
-            plant = Plant(**p_doc.to_dict(), id=p_doc.id)
-            
+    plant = plant_registry.unit(g.unit).active()
     return render_template('monitor.html', user=current_user, plant=plant)
 
 @views.route('/graph/<sensor_type>')
 @login_required
 def graph(sensor_type):
+    registry = plant_registry.unit(g.unit)
     plant = None
     controls = []
     
     if db:
-        # Plant
-        plant_docs = db.collection('plants').limit(1).stream()
-        p_doc = next(plant_docs, None)
-        if p_doc: plant = Plant(**p_doc.to_dict(), id=p_doc.id)
-
         # Fetched mapped controls
         control_map = {
             'temperature': ['environmental_fans', 'cpu_fans'],
@@ -47,85 +43,78 @@ def graph(sensor_type):
         
         target_names = control_map.get(sensor_type, [])
         if target_names:
-            # Firestore 'in' query supports max 10
-            docs = db.collection('control_status').where('name', 'in', target_names).stream()
+            # Firestore 'in' query supports max 10. Read alongside the plant.
+            query = unit_collection(db, g.unit, 'control_status').where('name', 'in', target_names)
+            plant, docs = read_pool.gather(registry.active, lambda: list(query.stream()))
             controls = [ControlStatus(**d.to_dict(), id=d.id) for d in docs]
 
+    if plant is None:
+        plant = registry.active()
+
     return render_template('graph.html', user=current_user, sensor_type=sensor_type, plant=plant, controls=controls)
 
 @views.route('/controls')
 @login_required
 def controls():
+    registry = plant_registry.unit(g.unit)
     plant = None
     controls = []
     
     if db:
-        # Plant
-        plant_docs = db.collection('plants').limit(1).stream()
-        p_doc = next(plant_docs, None)
-        if p_doc: plant = Plant(**p_doc.to_dict(), id=p_doc.id)
-        
         # Controls
-        # Stream all to get advanced fields
-        docs = db.collection('control_status').stream()
+        # Stream all to get advanced fields, alongside the plant
+        query = unit_collection(db, g.unit, 'control_status')
+        plant, docs = read_pool.gather(registry.active, lambda: list(query.stream()))
         controls = [ControlStatus(**d.to_dict(), id=d.id) for d in docs]
         
         # Sort by name or custom order if needed
         controls.sort(key=lambda x: x.name)
 
+    if plant is None:
+        plant = registry.active()
     return render_template('controls.html', user=current_user, controls=controls, plant=plant)
 
 @views.route('/profile')
 @login_required
 def profile():
-    plant = None
-    if db:
-        plant_docs = db.collection('plants').limit(1).stream()
-        p_doc = next(plant_docs, None)
-        if p_doc: plant = Plant(**p_doc.to_dict(), id=p_doc.id)
+    plant = plant_registry.unit(g.unit).active()
     return render_template('profile.html', user=current_user, plant=plant)
 
 @views.route('/developer')
 @views.route('/developer/<plant_id>')
 @login_required
 def developer(plant_id=None):
-    plants = []
-    active_plant = None
-    
-    if db:
-        p_docs = db.collection('plants').stream()
-        plants = [Plant(**d.to_dict(), id=d.id) for d in p_docs]
-        
-        if plant_id:
-            # Find specific
-            active_plant = next((p for p in plants if str(p.id) == plant_id), None)
-        elif plants:
-            active_plant = plants[0]
+    registry = plant_registry.unit(g.unit)
+    plants = registry.all()
+    active_plant = registry.get(plant_id) if plant_id else registry.active()
 
     return render_template('developer.html', user=current_user, plants=plants, plant=active_plant)
 
 @views.route('/tanks')
 @login_required
 def tanks():
+    registry = plant_registry.unit(g.unit)
     plant = None
     tanks = []
+    forecast = []
     
     if db:
-        # Plant
-        p_doc = next(db.collection('plants').limit(1).stream(), None)
-        if p_doc: plant = Plant(**p_doc.to_dict(), id=p_doc.id)
-        
-        # Tanks
-        t_docs = db.collection('tanks').stream()
-        tanks = [TankLevel(**d.to_dict()) for d in t_docs]
+        # Estimated levels from the tank model, alongside the plant
+        model = tank_model.unit(g.unit)
+        plant, forecast = read_pool.gather(
+            registry.active,
+            lambda: model.forecast(control_state.unit(g.unit), ingest_buffer.latest(g.unit)))
+        tanks = [TankLevel(name=t['name'], level_percent=t['level_percent'], capacity_ml=t['capacity_ml'])
+                 for t in forecast]
 
-    return render_template('tanks.html', user=current_user, tanks=tanks, plant=plant)
+    if plant is None:
+        plant = registry.active()
+
+    forecasts = {t['name']: t for t in forecast}
+    return render_template('tanks.html', user=current_user, tanks=tanks, plant=plant, forecasts=forecasts)
 
 @views.route('/ai-scan')
 @login_required
 def ai_scan():
-    plant = None
-    if db:
-        p_doc = next(db.collection('plants').limit(1).stream(), None)
-        if p_doc: plant = Plant(**p_doc.to_dict(), id=p_doc.id)
+    plant = plant_registry.unit(g.unit).active()
     return render_template('ai_scan.html', user=current_user, plant=plant)
@@ -0,0 +1,303 @@
+import atexit
+import queue
+import threading
+
+import numpy as np
+
+from models import DEFAULT_UNIT
+from services.units import unit_collection
+from storage import Query
+
+OK, WARNING, CRITICAL = 0, 1, 2
+SEVERITY = {WARNING: 'warning', CRITICAL: 'critical'}
+
+# Fields with rules, in array order
+ALERT_FIELDS = ('temperature', 'humidity', 'ph', 'tds', 'n_val', 'p_val', 'k_val',
+                'water_level', 'cpu_temp', 'gas_status')
+
+# Warning band inside each limit, and hysteresis needed to step back down,
+# both as a fraction of the range width (or of the bound for one-sided rules)
+WARNING_MARGIN = 0.10
+HYSTERESIS = 0.02
+
+
+def plant_limits(plant):
+    env = plant.env_ranges if plant else {}
+    nut = plant.nutrient_ranges if plant else {}
+    return {
+        'temperature': (env.get('temp_min', 20.0), env.get('temp_max', 30.0)),
+        'humidity': (env.get('humidity_min', 40.0), env.get('humidity_max', 70.0)),
+        'ph': (nut.get('ph_min', 5.5), nut.get('ph_max', 6.5)),
+        'tds': (nut.get('tds_min', 800.0), nut.get('tds_max', 1200.0)),
+        'n_val': (nut.get('n_min', 100.0), nut.get('n_max', 200.0)),
+        'p_val': (nut.get('p_min', 30.0), nut.get('p_max', 50.0)),
+        'k_val': (nut.get('k_min', 100.0), nut.get('k_max', 300.0)),
+        'water_level': (40.0, np.inf),
+        'cpu_temp': (-np.inf, 65.0),
+        'gas_status': (-np.inf, 0.5),
+    }
+
+
+class UnitAlerts:
+    """Alert state for one unit: limits, debounce counters, active alerts."""
+
+    def __init__(self, unit_id):
+        self.unit_id = unit_id
+        self.plant = None
+        n = len(ALERT_FIELDS)
+        self.state = np.zeros(n, dtype=np.int8)
+        self.pending = np.zeros(n, dtype=np.int8)
+        self.count = np.zeros(n, dtype=np.int32)
+        self.active = {}  # field -> alert dict
+        self.set_limits(plant_limits(None))
+
+    def set_limits(self, limits):
+        self.lo = np.array([limits[f][0] for f in ALERT_FIELDS], dtype=np.float64)
+        self.hi = np.array([limits[f][1] for f in ALERT_FIELDS], dtype=np.float64)
+        width = self.hi - self.lo
+        one_sided = ~np.isfinite(width)
+        bound = np.where(np.isfinite(self.lo), np.abs(self.lo), np.abs(self.hi))
+        scale = np.where(one_sided, bound, width)
+        self.margin = scale * WARNING_MARGIN
+        self.hyst = scale * HYSTERESIS
+
+    def levels(self, values, state):
+        # Raw level per field for one reading, given the current state
+        in_alert = state >= WARNING
+        in_critical = state == CRITICAL
+        crit = (values < self.lo + self.hyst * in_critical) | (values > self.hi - self.hyst * in_critical)
+        warn = ((values < self.lo + self.margin + self.hyst * in_alert) |
+                (values > self.hi - self.margin - self.hyst * in_alert))
+        return np.where(crit, CRITICAL, np.where(warn, WARNING, OK)).astype(np.int8)
+
+
+class AlertEngine:
+    """Evaluates readings against the active plant's ranges.
+
+    Limits live in NumPy arrays indexed like ALERT_FIELDS, so a batch is
+    evaluated field-parallel: per reading, one set of vector ops covers
+    every sensor. A level change must persist for `debounce` consecutive
+    readings before it is raised or cleared, and leaving a band requires
+    moving HYSTERESIS back inside it. State is kept per unit; transitions
+    are persisted to the unit's `alerts` and published on the event stream.
+
+    Ingest hands batches to submit(), which only queues them: a background
+    thread evaluates them in order, so store reads (restoring a unit's
+    alerts, loading its plant) and alert commits never run on the request
+    that posted the readings. `_lock` guards the in-memory state only; all
+    store I/O happens outside it.
+    """
+
+    def __init__(self, debounce=3, max_queue=1000):
+        self.debounce = debounce
+        self.store = None
+        self.publish = None
+        self.plants = None
+        self._units = {}  # unit_id -> UnitAlerts
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._stop = threading.Event()
+        self.stats = {'queued': 0, 'evaluated': 0, 'dropped': 0, 'errors': 0}
+
+    def configure(self, store, plants=None, publish=None, debounce=None):
+        self.store = store
+        self.plants = plants
+        self.publish = publish
+        if debounce: self.debounce = debounce
+        with self._lock:
+            self._units = {}
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='alert-engine', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.drain()
+
+    def submit(self, records):
+        # Ingest subscriber: never blocks or raises into the posting request
+        if not records:
+            return
+        if not self._thread or not self._thread.is_alive():
+            self._evaluate_safely(records)
+            return
+        try:
+            self._queue.put_nowait(records)
+            self.stats['queued'] += 1
+        except queue.Full:
+            self.stats['dropped'] += 1
+            print(f"⚠️ Alert queue full, skipped {len(records)} readings")
+
+    def drain(self):
+        # Evaluate everything currently queued
+        while True:
+            try:
+                records = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self._evaluate_safely(records)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                records = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._evaluate_safely(records)
+
+    def _evaluate_safely(self, records):
+        try:
+            self.evaluate(records)
+        except Exception as e:
+            self.stats['errors'] += 1
+            print(f"⚠️ Alert evaluation failed: {e}")
+
+    def _unit(self, unit_id):
+        unit = self._units.get(unit_id)
+        if unit is None:
+            # Restore outside the lock; the first one stored wins
+            fresh = UnitAlerts(unit_id)
+            if self.store:
+                self._restore(fresh)
+            with self._lock:
+                unit = self._units.setdefault(unit_id, fresh)
+        return unit
+
+    def _refresh_limits(self, unit):
+        # Plant lookup (may load from the store) before taking the lock
+        plant = self.plants.unit(unit.unit_id).active() if self.plants else None
+        with self._lock:
+            if plant is not unit.plant:
+                unit.plant = plant
+                unit.set_limits(plant_limits(plant))
+
+    def _restore(self, unit):
+        # Resume active alerts after a restart so they are not raised twice
+        alerts_ref = unit_collection(self.store, unit.unit_id, 'alerts')
+        for doc in alerts_ref.where('active', '==', True).stream():
+            alert = doc.to_dict()
+            alert['id'] = doc.id
+            if alert.get('key') in ALERT_FIELDS:
+                i = ALERT_FIELDS.index(alert['key'])
+                unit.state[i] = CRITICAL if alert['severity'] == 'critical' else WARNING
+                unit.pending[i] = unit.state[i]
+                unit.active[alert['key']] = alert
+
+    def evaluate(self, records):
+        if not records:
+            return []
+        by_unit = {}
+        for record in records:
+            by_unit.setdefault(record.unit_id, []).append(record)
+
+        changed = []
+        for unit_id, unit_records in by_unit.items():
+            unit = self._unit(unit_id)
+            self._refresh_limits(unit)
+            with self._lock:
+                writes, unit_changed = self._evaluate_unit(unit, unit_records)
+            self._commit(unit, writes, unit_changed)
+            changed.extend(unit_changed)
+        self.stats['evaluated'] += len(records)
+        return changed
+
+    def _evaluate_unit(self, unit, records):
+        # Caller holds the lock
+
+        # readings x fields, NaN where a reading lacks a field
+        matrix = np.array(
+            [[r.data.get(f, np.nan) for f in ALERT_FIELDS] for r in records],
+            dtype=np.float64
+        )
+
+        transitions = []
+        for row, record in zip(matrix, records):
+            present = ~np.isnan(row)
+            level = np.where(present, unit.levels(row, unit.state), unit.state)
+
+            same = level == unit.pending
+            unit.count = np.where(same, unit.count + 1, 1)
+            unit.pending = level
+            changed = present & (unit.count >= self.debounce) & (level != unit.state)
+
+            for i in np.flatnonzero(changed):
+                transitions.append((ALERT_FIELDS[i], int(unit.state[i]), int(level[i]), float(row[i]), record.timestamp))
+            unit.state = np.where(changed, level, unit.state).astype(np.int8)
+
+        return self._apply(unit, transitions)
+
+    def _apply(self, unit, transitions):
+        # Caller holds the lock. Returns ([(doc id, doc)] to write, changed alerts)
+        if not transitions:
+            return [], []
+        alerts_ref = unit_collection(self.store, unit.unit_id, 'alerts') if self.store else None
+        writes = []
+        changed = []
+
+        for field, old, new, value, timestamp in transitions:
+            i = ALERT_FIELDS.index(field)
+            alert = unit.active.get(field)
+            if new == OK:
+                if not alert:
+                    continue
+                alert.update({'active': False, 'cleared_at': timestamp, 'value': value})
+                del unit.active[field]
+            elif alert:
+                alert.update({'severity': SEVERITY[new], 'value': value})
+            else:
+                alert = {
+                    'id': alerts_ref.document().id if alerts_ref else f'{field}-{timestamp.timestamp()}',
+                    'key': field,
+                    'severity': SEVERITY[new],
+                    'direction': 'high' if value > unit.hi[i] - unit.margin[i] else 'low',
+                    'value': value,
+                    'min': float(unit.lo[i]) if np.isfinite(unit.lo[i]) else None,
+                    'max': float(unit.hi[i]) if np.isfinite(unit.hi[i]) else None,
+                    'plant_id': unit.plant.id if unit.plant else None,
+                    'started_at': timestamp,
+                    'cleared_at': None,
+                    'active': True
+                }
+                unit.active[field] = alert
+
+            writes.append((alert['id'], {k: v for k, v in alert.items() if k != 'id'}))
+            changed.append(dict(alert))
+        return writes, changed
+
+    def _commit(self, unit, writes, changed):
+        # Outside the lock: persist and publish one unit's transitions
+        if writes and self.store:
+            alerts_ref = unit_collection(self.store, unit.unit_id, 'alerts')
+            batch = self.store.batch()
+            for doc_id, doc in writes:
+                batch.set(alerts_ref.document(doc_id), doc)
+            try:
+                batch.commit()
+            except Exception as e:
+                print(f"⚠️ Alert commit failed: {e}")
+        if self.publish:
+            for alert in changed:
+                self.publish('alert', alert, unit_id=unit.unit_id)
+
+    def active(self, unit_id=DEFAULT_UNIT):
+        unit = self._unit(unit_id)
+        with self._lock:
+            return [dict(a) for a in unit.active.values()]
+
+    def history(self, limit=50, unit_id=DEFAULT_UNIT):
+        if not self.store:
+            return []
+        docs = (unit_collection(self.store, unit_id, 'alerts')
+                .order_by('started_at', direction=Query.DESCENDING).limit(limit).stream())
+        return [{**d.to_dict(), 'id': d.id} for d in docs]
+
+
+alert_engine = AlertEngine()
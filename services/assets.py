@@ -0,0 +1,262 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: builds are not serialized across processes
+    fcntl = None
+
+from flask import url_for as flask_url_for
+from flask import abort, request, send_from_directory
+
+TEXT_TYPES = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map')
+IMAGE_TYPES = ('.jpg', '.jpeg', '.png')
+IMAGE_WIDTHS = (480, 960)
+MIN_COMPRESS_BYTES = 512
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def fingerprint(name, digest, suffix=None):
+    # css/style.css -> css/style.<digest>.css ; suffix replaces the extension
+    base, ext = os.path.splitext(name)
+    return f"{base}.{digest}{suffix or ext}"
+
+
+def _brotli():
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+
+def _compress(path):
+    # Precompressed siblings (.gz, .br) that the asset route can serve as-is
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < MIN_COMPRESS_BYTES:
+        return []
+    written = []
+    with open(path + '.gz', 'wb') as f:
+        # mtime=0 keeps the output byte-identical across builds
+        with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=9, mtime=0) as gz:
+            gz.write(data)
+    written.append('gzip')
+    brotli = _brotli()
+    if brotli:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+        written.append('br')
+    return written
+
+
+def _image_variants(source, out_dir, name, digest):
+    # {"<width|orig>.<fmt>": relative path} for resized JPEG/WebP copies
+    try:
+        from PIL import Image
+    except ImportError:
+        return {}
+    variants = {}
+    with Image.open(source) as img:
+        img = img.convert('RGB')
+        widths = [w for w in IMAGE_WIDTHS if w < img.width] + [None]
+        for width in widths:
+            frame = img if width is None else img.resize((width, round(img.height * width / img.width)))
+            label = 'orig' if width is None else str(width)
+            for fmt, ext, options in (('webp', '.webp', {'quality': 80, 'method': 6}),
+                                      ('jpeg', '.jpg', {'quality': 82, 'optimize': True, 'progressive': True})):
+                if width is None and fmt == 'jpeg':
+                    continue  # the fingerprinted original already covers this
+                rel = fingerprint(name, digest, f".{label}{ext}")
+                target = os.path.join(out_dir, rel)
+                if not os.path.exists(target):
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    frame.save(target + '.tmp', fmt.upper(), **options)
+                    os.replace(target + '.tmp', target)
+                variants[f"{label}.{ext[1:]}"] = rel
+    return variants
+
+
+class AssetManifest:
+    """Fingerprinted copies of the static folder.
+
+    build() copies every static file to <out_dir>/<name>.<sha256[:12]>.<ext>,
+    writes .gz/.br siblings for text assets and resized/WebP variants for
+    images, and records the mapping in manifest.json. Unchanged files are
+    skipped, so running it on every startup only costs one hash pass. The
+    asset route serves these names with immutable cache headers; a changed
+    file gets a new name, so browsers never revalidate.
+
+    Builds hold an exclusive lock on <out_dir>/.build.lock, so processes
+    starting together take turns and the later ones find the work done.
+    """
+
+    def __init__(self):
+        self.static_folder = None
+        self.out_dir = None
+        self.url_prefix = '/assets'
+        self.entries = {}
+        self._owners = {}  # fingerprinted path -> entry
+
+    def configure(self, static_folder, out_dir, url_prefix=None):
+        self.static_folder = static_folder
+        self.out_dir = out_dir
+        if url_prefix: self.url_prefix = url_prefix
+        self.load()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.out_dir, 'manifest.json')
+
+    def load(self):
+        try:
+            with open(self.manifest_path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+        self._index()
+        return self.entries
+
+    def _index(self):
+        self._owners = {}
+        for entry in self.entries.values():
+            for rel in [entry['path'], *entry['variants'].values()]:
+                self._owners[rel] = entry
+
+    @contextmanager
+    def _build_lock(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        with open(os.path.join(self.out_dir, '.build.lock'), 'w') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def build(self):
+        with self._build_lock():
+            # Another process may have built while we waited
+            self.load()
+            return self._build()
+
+    def _build(self):
+        entries = {}
+        for folder, _, files in os.walk(self.static_folder):
+            for filename in sorted(files):
+                source = os.path.join(folder, filename)
+                name = os.path.relpath(source, self.static_folder).replace(os.sep, '/')
+                entries[name] = self._build_file(source, name)
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(entries, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+        self._prune(entries)
+        self.entries = entries
+        self._index()
+        return entries
+
+    def _build_file(self, source, name):
+        digest = file_digest(source)
+        previous = self.entries.get(name)
+        if previous and previous.get('digest') == digest and os.path.exists(os.path.join(self.out_dir, previous['path'])):
+            return previous
+
+        rel = fingerprint(name, digest)
+        target = os.path.join(self.out_dir, rel)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(source, target)
+        entry = {'digest': digest, 'path': rel, 'encodings': [], 'variants': {}}
+        ext = os.path.splitext(name)[1].lower()
+        if ext in TEXT_TYPES:
+            entry['encodings'] = _compress(target)
+        elif ext in IMAGE_TYPES:
+            entry['variants'] = _image_variants(source, self.out_dir, name, digest)
+        return entry
+
+    def _prune(self, entries):
+        # Drop outputs no manifest entry points at any more (old fingerprints)
+        keep = {'manifest.json', '.build.lock'}
+        for entry in entries.values():
+            for rel in [entry['path'], *entry['variants'].values()]:
+                keep.update({rel, rel + '.gz', rel + '.br'})
+        for folder, _, files in os.walk(self.out_dir):
+            for filename in files:
+                if filename.endswith('.tmp'):
+                    continue  # an in-flight write (e.g. a build without flock)
+                path = os.path.join(folder, filename)
+                if os.path.relpath(path, self.out_dir).replace(os.sep, '/') not in keep:
+                    os.remove(path)
+
+    def url(self, filename, variant=None):
+        # Hashed URL for a static file, or None if it has not been built
+        entry = self.entries.get(filename)
+        if not entry:
+            return None
+        rel = entry['variants'].get(variant) if variant else entry['path']
+        return f"{self.url_prefix}/{rel}" if rel else None
+
+    def serve(self, filename):
+        entry = self._owners.get(filename)
+        if entry is None:
+            abort(404)
+
+        encoding = None
+        accepted = request.accept_encodings
+        available = entry['encodings'] if filename == entry['path'] else []
+        for candidate in ('br', 'gzip'):
+            if candidate in available and accepted[candidate]:
+                encoding = candidate
+                break
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        served = filename + ('.br' if encoding == 'br' else '.gz' if encoding else '')
+        response = send_from_directory(self.out_dir, served, mimetype=mimetype, max_age=31536000)
+        response.headers['Cache-Control'] = IMMUTABLE
+        if available:
+            response.headers['Vary'] = 'Accept-Encoding'
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+    def url_for(self, endpoint, **values):
+        """Drop-in for flask.url_for in templates.
+
+        url_for('static', filename=...) returns the fingerprinted URL when the
+        file is in the manifest (pass variant='480.webp' for an image
+        variant) and falls back to Flask's static handler otherwise.
+        """
+        if endpoint == 'static':
+            hashed = self.url(values.get('filename'), values.pop('variant', None))
+            if hashed:
+                return hashed
+        return flask_url_for(endpoint, **values)
+
+    def init_app(self, app):
+        app.add_url_rule(f"{self.url_prefix}/<path:filename>", 'assets', self.serve)
+        app.jinja_env.globals['url_for'] = self.url_for
+
+        @app.cli.command('build-assets')
+        def build_assets():
+            """Fingerprint and precompress static files."""
+            entries = self.build()
+            print(f"Built {len(entries)} assets into {self.out_dir}")
+
+
+assets = AssetManifest()
@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+from collections import deque
+
+
+def _json_default(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+class Broker:
+    """In-process fan-out for Server-Sent Events.
+
+    Every published event gets a monotonically increasing id and is kept in
+    a bounded history so reconnecting clients can resume from their
+    Last-Event-ID. Subscribers share one condition variable; a publish wakes
+    them all and each one reads the events past its own cursor. Events
+    published for a unit are only delivered to listeners of that unit.
+    """
+
+    def __init__(self, history=1000, keepalive=15.0):
+        self.keepalive = keepalive
+        self._events = deque(maxlen=history)
+        self._next_id = 1
+        self._cond = threading.Condition()
+        self.subscribers = 0
+
+    def publish(self, event, data, unit_id=None):
+        with self._cond:
+            event_id = self._next_id
+            self._next_id += 1
+            self._events.append((event_id, event, json.dumps(data, default=_json_default), unit_id))
+            self._cond.notify_all()
+        return event_id
+
+    @property
+    def last_id(self):
+        return self._next_id - 1
+
+    def _since(self, cursor):
+        # Caller holds the condition. Ids are consecutive, so index directly.
+        if not self._events:
+            return []
+        first_id = self._events[0][0]
+        start = max(cursor + 1 - first_id, 0)
+        return list(self._events)[start:]
+
+    def can_resume(self, cursor):
+        with self._cond:
+            first_id = self._events[0][0] if self._events else self._next_id
+            return first_id <= cursor + 1 <= self._next_id
+
+    def listen(self, cursor=None, unit_id=None):
+        # Yields (id, event, payload) tuples, or None on keepalive timeouts.
+        # Events tagged with another unit are skipped.
+        if cursor is None:
+            cursor = self.last_id
+        with self._cond:
+            self.subscribers += 1
+        last_sent = time.monotonic()
+        try:
+            while True:
+                with self._cond:
+                    events = self._since(cursor)
+                    if not events:
+                        self._cond.wait(self.keepalive)
+                        events = self._since(cursor)
+                for event_id, event, payload, unit in events:
+                    cursor = event_id
+                    if unit is None or unit == unit_id:
+                        last_sent = time.monotonic()
+                        yield event_id, event, payload
+                if time.monotonic() - last_sent >= self.keepalive:
+                    # Quiet for us, even if other units are busy
+                    last_sent = time.monotonic()
+                    yield None
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+
+def format_sse(event_id, event, payload):
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n"
+
+
+broker = Broker()
+
+
+def publish_readings(records):
+    # Ingest subscriber: one event per unit in each accepted batch, carrying
+    # that unit's newest reading in the same shape as GET /api/sensor-data
+    newest = {}
+    for record in records:
+        if record.unit_id not in newest or record.timestamp >= newest[record.unit_id].timestamp:
+            newest[record.unit_id] = record
+    for unit_id, record in newest.items():
+        broker.publish('sensor', record.data, unit_id=unit_id)
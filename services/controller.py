@@ -0,0 +1,255 @@
+import datetime
+import threading
+import time
+
+from models import DEFAULT_UNIT
+from services.controls import control_state, switch_control
+from services.metrics import Histogram
+from storage import naive_utc
+
+DOSING_PUMPS = {
+    # pump: (reading field, range key prefix, direction it corrects)
+    'ph_up_pump': ('ph', 'ph', 'low'),
+    'ph_down_pump': ('ph', 'ph', 'high'),
+    'n_pump': ('n_val', 'n', 'low'),
+    'p_pump': ('p_val', 'p', 'low'),
+    'k_pump': ('k_val', 'k', 'low'),
+}
+MIXERS = ('circulation_pump', 'stirring_motor')
+
+# Used when a control has no settings['schedule']
+DEFAULT_SCHEDULES = {
+    'grow_light': [{'start': '06:00', 'end': '20:00'}],
+}
+
+DEFAULT_MAX_DOSE_SECONDS = 30
+# Settle time after a dose before the same pump may dose again (mixing, sensor lag)
+DEFAULT_MIN_OFF_SECONDS = 300
+CPU_FAN_ON, CPU_FAN_OFF = 55.0, 50.0
+
+
+def _minutes(hhmm):
+    hours, minutes = hhmm.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def in_schedule(windows, now):
+    # windows: [{'start': 'HH:MM', 'end': 'HH:MM'}], may wrap past midnight
+    minute = now.hour * 60 + now.minute
+    for window in windows:
+        start, end = _minutes(window['start']), _minutes(window['end'])
+        if start <= end and start <= minute < end:
+            return True
+        if start > end and (minute >= start or minute < end):
+            return True
+    return False
+
+
+def schedule_decision(name, control, now):
+    windows = (control.get('settings') or {}).get('schedule') or DEFAULT_SCHEDULES.get(name)
+    if not windows:
+        return None
+    return in_schedule(windows, now)
+
+
+def auto_decision(name, control, reading, plant, controls, now):
+    """Desired state for one control in 'auto' mode, or None to leave it.
+
+    Dosing starts outside the plant's range and stops at the midpoint or
+    after settings['max_on_seconds'], whichever comes first. A pump then
+    stays off for settings['min_off_seconds'] so the dose can mix in and
+    register before the next reading can re-arm it.
+    """
+    if reading is None or plant is None:
+        return None
+    data = reading.data
+    env, nut, pref = plant.env_ranges, plant.nutrient_ranges, plant.control_pref
+    settings = control.get('settings') or {}
+
+    # Safety overrides
+    if 'pump' in name and data.get('water_level', 100) < pref.get('safety_min_water', 15.0):
+        return False
+    too_hot = data.get('temperature', 0) > pref.get('safety_max_temp', 40.0)
+
+    if name in DOSING_PUMPS:
+        field, key, corrects = DOSING_PUMPS[name]
+        if key == 'ph' and not pref.get('auto_ph_correction', True):
+            return None
+        value = data.get(field)
+        if value is None:
+            return None
+        low, high = nut[f'{key}_min'], nut[f'{key}_max']
+        mid = (low + high) / 2
+
+        if control.get('is_on'):
+            started = naive_utc(control.get('last_active'))
+            max_on = settings.get('max_on_seconds', DEFAULT_MAX_DOSE_SECONDS)
+            if started and (now - started).total_seconds() >= max_on:
+                return False
+            return value < mid if corrects == 'low' else value > mid
+        stopped = naive_utc(control.get('last_inactive'))
+        min_off = settings.get('min_off_seconds', DEFAULT_MIN_OFF_SECONDS)
+        if stopped and (now - stopped).total_seconds() < min_off:
+            return False
+        return value < low if corrects == 'low' else value > high
+
+    if name in MIXERS:
+        # Mix while anything is dosing
+        return any(controls.get(p, {}).get('is_on') for p in DOSING_PUMPS)
+
+    if name == 'environmental_fans':
+        temp, humidity = data.get('temperature'), data.get('humidity')
+        if temp is None and humidity is None:
+            return None
+        hot = temp is not None and temp > env['temp_max']
+        humid = humidity is not None and humidity > env['humidity_max']
+        if too_hot or hot or humid:
+            return True
+        if control.get('is_on'):
+            # Hysteresis: run until both are back under the midpoint
+            cool = temp is None or temp <= (env['temp_min'] + env['temp_max']) / 2
+            dry = humidity is None or humidity <= (env['humidity_min'] + env['humidity_max']) / 2
+            return not (cool and dry)
+        return False
+
+    if name == 'cpu_fans':
+        cpu = data.get('cpu_temp')
+        if cpu is None:
+            return None
+        return cpu > settings.get('off_below', CPU_FAN_OFF) if control.get('is_on') else cpu > settings.get('on_above', CPU_FAN_ON)
+
+    if name == 'grow_light':
+        if too_hot:
+            return False
+        return schedule_decision(name, control, datetime.datetime.now())
+
+    return None
+
+
+class ControlLoop:
+    """Fixed-rate loop acting on controls in 'auto' and 'schedule' mode.
+
+    Ticks are scheduled on a monotonic grid (start + n * interval) so delays
+    do not accumulate; how late each tick starts is recorded as jitter.
+    Every switch goes through switch_control, i.e. the same interlocks,
+    logging and push as a manual toggle. Each tick visits every unit in
+    turn. Run it in one process only.
+    """
+
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self.store = None
+        self.plants = None
+        self.readings = None
+        self.units = None
+        self.ready = None
+        self.max_age = 60.0
+        self._thread = None
+        self._stop = threading.Event()
+        self.jitter = Histogram()
+        self.duration = Histogram()
+        self.stats = {'ticks': 0, 'actions': 0, 'blocked': 0, 'errors': 0}
+
+    def configure(self, store, plants, readings, units=None, max_age=None, interval=None, ready=None):
+        self.store = store
+        self.plants = plants
+        self.readings = readings
+        self.units = units
+        # Called before the first tick, e.g. to wait for seeding
+        self.ready = ready
+        if max_age is not None: self.max_age = max_age
+        if interval: self.interval = interval
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='control-loop', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+
+    @property
+    def running(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def tick(self, now=None):
+        now = now or datetime.datetime.utcnow()
+        unit_ids = self.units.ids() if self.units else [DEFAULT_UNIT]
+        actions = []
+        for unit_id in unit_ids:
+            try:
+                actions.extend(self.tick_unit(unit_id, now))
+            except Exception as e:
+                # One unit's failure must not stall the others
+                self.stats['errors'] += 1
+                print(f"⚠️ Control loop tick failed for unit {unit_id}: {e}")
+        return actions
+
+    def tick_unit(self, unit_id, now):
+        local_now = datetime.datetime.now()
+        reading = self.readings.latest(unit_id) if self.readings else None
+        plant = self.plants.unit(unit_id).active() if self.plants else None
+
+        table = control_state.unit(unit_id)
+        controls = {name: table.get(name) for name in table.names()}
+        actions = []
+        for name, control in controls.items():
+            mode = control.get('mode', 'manual')
+            if mode == 'auto':
+                desired = auto_decision(name, control, reading, plant, controls, now)
+            elif mode == 'schedule':
+                desired = schedule_decision(name, control, local_now)
+            else:
+                continue
+
+            if desired is None or desired == control.get('is_on'):
+                continue
+
+            status, message = switch_control(
+                self.store, name, desired, reading, self.max_age,
+                trigger=mode, details=f"{mode.title()} controller", unit_id=unit_id
+            )
+            if status == 'ok':
+                controls[name] = table.get(name)
+                actions.append((unit_id, name, desired))
+                self.stats['actions'] += 1
+            elif status == 'blocked':
+                self.stats['blocked'] += 1
+        return actions
+
+    def _run(self):
+        if self.ready:
+            self.ready()
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self.jitter.observe((started - next_tick) * 1000)
+            try:
+                self.tick()
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"⚠️ Control loop tick failed: {e}")
+            self.stats['ticks'] += 1
+            self.duration.observe((time.monotonic() - started) * 1000)
+
+            next_tick += self.interval
+            if next_tick < time.monotonic():
+                # Overran: skip missed ticks rather than bursting to catch up
+                next_tick = time.monotonic()
+            self._stop.wait(max(0.0, next_tick - time.monotonic()))
+
+    def to_dict(self):
+        return {
+            'running': self.running,
+            'interval': self.interval,
+            **self.stats,
+            'jitter_ms': self.jitter.to_dict(),
+            'duration_ms': self.duration.to_dict()
+        }
+
+
+control_loop = ControlLoop()
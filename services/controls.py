@@ -0,0 +1,296 @@
+import copy
+import datetime
+import threading
+import time
+import uuid
+
+from models import DEFAULT_UNIT, ControlLog
+from services.broker import broker
+from services.logs import log_writer
+from services.tanks import tank_model
+from services.units import UnitScoped, unit_collection
+
+# Run-dry protection threshold (%), matches Plant.control_pref default
+MIN_WATER_LEVEL = 15.0
+
+
+class ControlStateTable:
+    """In-memory copy of a unit's control_status, kept current on every write.
+
+    Loaded with one stream on first use and refreshed after `ttl` seconds
+    so writes from other worker processes are picked up. Toggles hold
+    `lock` across interlock evaluation and the write, so two requests can
+    no longer both pass the pH interlock.
+
+    Every change bumps `version`; `_changed` remembers the version at which
+    each control last changed so clients can ask for deltas.
+    """
+
+    def __init__(self, unit_id=DEFAULT_UNIT, store=None, ttl=60.0):
+        self.unit_id = unit_id
+        self.ttl = ttl
+        self.store = store
+        self.lock = threading.RLock()
+        self._controls = None
+        self._loaded_at = 0.0
+        self._changed = {}
+        self.version = 0
+        # Versions are per process; the epoch keeps ETags from colliding
+        self.epoch = uuid.uuid4().hex[:8]
+
+    def _table(self):
+        if self._controls is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return self._controls
+        with self.lock:
+            if self._controls is None or time.monotonic() - self._loaded_at >= self.ttl:
+                controls = {}
+                if self.store:
+                    for doc in unit_collection(self.store, self.unit_id, 'control_status').stream():
+                        controls[doc.id] = doc.to_dict()
+                old = self._controls or {}
+                for name in set(old) | set(controls):
+                    if old.get(name) != controls.get(name):
+                        self._bump(name)
+                self._controls = controls
+                self._loaded_at = time.monotonic()
+            return self._controls
+
+    def _bump(self, name):
+        self.version += 1
+        self._changed[name] = self.version
+
+    def get(self, name):
+        control = self._table().get(name)
+        return copy.deepcopy(control) if control is not None else None
+
+    def names(self):
+        return list(self._table())
+
+    def active(self):
+        return [doc_id for doc_id, c in self._table().items() if c.get('is_on')]
+
+    def states(self):
+        return {c['name']: c['is_on'] for c in self._table().values()}
+
+    def apply(self, name, fields):
+        # Call after the store write succeeded
+        with self.lock:
+            control = self._table().get(name)
+            if control is not None and any(control.get(k) != v for k, v in fields.items()):
+                control.update(fields)
+                self._bump(name)
+
+    def etag(self):
+        self._table()
+        return f"{self.epoch}-{self.version}"
+
+    def delta(self, since):
+        # {name: is_on} for controls changed after `since`, or None when the
+        # client's version is from the future (server restart) and needs a
+        # full state instead
+        table = self._table()
+        with self.lock:
+            if since > self.version:
+                return None
+            return {
+                table[name]['name']: table[name]['is_on']
+                for name, version in self._changed.items()
+                if version > since and name in table
+            }
+
+
+# control_state.unit(unit_id) -> that unit's ControlStateTable
+control_state = UnitScoped(ControlStateTable)
+
+
+def switch_control(store, name, state, reading, max_age, trigger='manual', details=None, unit_id=DEFAULT_UNIT):
+    """Apply one toggle: interlocks, store write, memory table, log, push.
+
+    Returns (status, message) where status is 'ok', 'not_found' or 'blocked'.
+    """
+    controls = control_state.unit(unit_id)
+    with controls.lock:
+        control = controls.get(name)
+        if control is None:
+            return 'not_found', 'Control not found'
+
+        # --- Advanced Safety Logic (memory only, no store reads) ---
+        blocked = check_interlocks(name, state, controls, reading, max_age)
+        if blocked:
+            return 'blocked', blocked
+
+        # --- Apply Change ---
+        now = datetime.datetime.utcnow()
+        update_data = {'is_on': state}
+        if state:
+            update_data['last_active'] = now
+        elif control.get('is_on'):
+            update_data['last_inactive'] = now
+
+        # A running pump's run ends here (OFF, or ON restarting last_active):
+        # fold it into its tanks' usage in the same commit
+        tanks = tank_model.unit(unit_id)
+        usage = tanks.run_ended(control, now)
+        batch = store.batch()
+        batch.update(unit_collection(store, unit_id, 'control_status').document(name), update_data)
+        tanks.write(batch, usage)
+        batch.commit()
+        controls.apply(name, update_data)
+        tanks.apply(usage)
+
+    # --- Log Action (written in the background) ---
+    log_writer.enqueue(ControlLog(
+        control_name=name,
+        action="ON" if state else "OFF",
+        trigger=trigger,
+        details=details,
+        unit_id=unit_id
+    ))
+    broker.publish('controls', {name: state}, unit_id=unit_id)
+    return 'ok', None
+
+
+# Most toggles one batch request may carry (2 writes each, under the 500 cap)
+MAX_BATCH_CHANGES = 100
+
+
+def switch_controls(store, changes, reading, max_age, atomic=False, trigger='manual', details=None,
+                    unit_id=DEFAULT_UNIT):
+    """Apply many toggles: one interlock pass, one store commit, one push.
+
+    `changes` is a list of (name, state). Interlocks run once, under the
+    table lock, against a snapshot of the unit's controls with the batch's
+    own earlier changes applied: every OFF first (never blocked), then each
+    ON in order, so "pH Down off, pH Up on" passes while "pH Up on, pH Down
+    on" blocks the second. Accepted updates and their ControlLog entries go
+    out in a single batch commit; the memory table only changes once it
+    succeeded. Pump runs that end are folded into tank usage in the same
+    commit. With `atomic`, any blocked or unknown control rejects the
+    whole batch and nothing is written.
+
+    Returns (applied, results) where results holds one
+    {'name', 'state', 'status', 'message'} per change, status 'ok' (applied),
+    'not_found', 'blocked' or, for the changes that passed in a rejected
+    atomic batch, 'not_applied'.
+    """
+    controls = control_state.unit(unit_id)
+    results = [{'name': name, 'state': state, 'status': 'ok', 'message': None} for name, state in changes]
+    with controls.lock:
+        snapshot = {name: controls.get(name) for name in controls.names()}
+        ordered = [r for r in results if not r['state']] + [r for r in results if r['state']]
+        for result in ordered:
+            name = result['name']
+            if snapshot.get(name) is None:
+                result['status'], result['message'] = 'not_found', 'Control not found'
+                continue
+            blocked = check_interlocks(name, result['state'], snapshot, reading, max_age)
+            if blocked:
+                result['status'], result['message'] = 'blocked', blocked
+                continue
+            snapshot[name]['is_on'] = result['state']
+
+        accepted = [r for r in results if r['status'] == 'ok']
+        if not accepted:
+            return False, results
+        if atomic and len(accepted) < len(results):
+            for result in accepted:
+                result['status'], result['message'] = 'not_applied', 'Atomic batch rejected'
+            return False, results
+
+        now = datetime.datetime.utcnow()
+        tanks = tank_model.unit(unit_id)
+        batch = store.batch()
+        controls_ref = unit_collection(store, unit_id, 'control_status')
+        logs_ref = unit_collection(store, unit_id, 'control_logs')
+        updates = []
+        usage = {}
+        for result in accepted:
+            usage.update(tanks.run_ended(controls.get(result['name']), now))
+            update_data = {'is_on': result['state']}
+            if result['state']:
+                update_data['last_active'] = now
+            elif (controls.get(result['name']) or {}).get('is_on'):
+                update_data['last_inactive'] = now
+            batch.update(controls_ref.document(result['name']), update_data)
+            log = ControlLog(
+                control_name=result['name'],
+                action="ON" if result['state'] else "OFF",
+                trigger=trigger,
+                details=details,
+                unit_id=unit_id
+            )
+            batch.set(logs_ref.document(), log.to_dict())
+            updates.append((result['name'], update_data))
+        tanks.write(batch, usage)
+        batch.commit()
+
+        for name, update_data in updates:
+            controls.apply(name, update_data)
+        tanks.apply(usage)
+
+    broker.publish('controls', {r['name']: r['state'] for r in accepted}, unit_id=unit_id)
+    return True, results
+
+
+class PhaseTimings:
+    """Last and worst-case duration (ms) of each phase of a timed operation."""
+
+    def __init__(self):
+        self.count = 0
+        self.last = {}
+        self.worst = {}
+        self._lock = threading.Lock()
+
+    def record(self, phases):
+        with self._lock:
+            self.count += 1
+            self.last = dict(phases)
+            for phase, ms in phases.items():
+                self.worst[phase] = max(self.worst.get(phase, 0.0), ms)
+
+    def to_dict(self):
+        with self._lock:
+            return {'count': self.count, 'last_ms': dict(self.last), 'worst_ms': dict(self.worst)}
+
+
+estop_timings = PhaseTimings()
+
+
+def reading_age(reading, now=None):
+    if reading is None:
+        return None
+    now = now or datetime.datetime.utcnow()
+    return (now - reading.timestamp).total_seconds()
+
+
+def check_interlocks(name, state, controls, reading, max_age):
+    """Return a block message for turning `name` on, or None if allowed.
+
+    Turning a device off is never blocked. Pumps fail safe: with no reading
+    or one older than `max_age` seconds the water level is unknown.
+    """
+    if not state:
+        return None
+
+    control = controls.get(name) or {}
+
+    # 1. Check Locks
+    if control.get('locked', False):
+        return f"Action Blocked: {control.get('locked_reason', 'Safety Lock Active')}"
+
+    # 2. Water Level Protection (Pumps)
+    if 'pump' in name:
+        age = reading_age(reading)
+        if age is None or age > max_age:
+            return "Action Blocked: No recent sensor data (Run Dry Protection)"
+        if reading.data.get('water_level', 100) < MIN_WATER_LEVEL:
+            return "Action Blocked: Low Water Level (Run Dry Protection)"
+
+    # 3. pH Interlock (Simultaneous Dosing)
+    if 'ph' in name:
+        opposite = 'ph_down_pump' if 'up' in name else 'ph_up_pump'
+        opp = controls.get(opposite)
+        if opp and opp.get('is_on', False):
+            return "Action Blocked: Cannot dose pH Up and Down simultaneously."
+
+    return None
@@ -0,0 +1,226 @@
+import csv
+import datetime
+import io
+import json
+import struct
+import zlib
+
+import numpy as np
+
+from models import SensorData
+from services.units import unit_collection
+from storage import naive_utc
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# dataset -> [(column, type)]; 'f8' float64 (NaN = missing), 'ts' int64 µs since epoch, 'str' text
+DATASETS = {
+    'sensor_data': [('id', 'str'), ('timestamp', 'ts')] + [(f, 'f8') for f in SensorData.FIELDS],
+    'control_logs': [('id', 'str'), ('timestamp', 'ts'), ('control_name', 'str'), ('action', 'str'),
+                     ('trigger', 'str'), ('details', 'str')],
+}
+FORMATS = ('csv', 'columnar')
+
+PAGE_SIZE = 1000
+COLUMNAR_MAGIC = b'HXC1'
+
+
+class ExportError(ValueError):
+    pass
+
+
+def iter_rows(store, dataset, unit_id, start=None, end=None, cursor=None, page_size=PAGE_SIZE):
+    """Yield (doc_id, data) oldest first, one store page at a time.
+
+    Only `page_size` documents are held at once whatever the range. The
+    cursor is the id of the last row a client received (the first column of
+    every format), so an interrupted export resumes right after it.
+    """
+    if dataset not in DATASETS:
+        raise ExportError(f"Unknown dataset '{dataset}', expected one of {tuple(DATASETS)}")
+    collection = unit_collection(store, unit_id, dataset)
+    query = collection
+    if start:
+        query = query.where('timestamp', '>=', start)
+    if end:
+        query = query.where('timestamp', '<', end)
+    query = query.order_by('timestamp')
+
+    after = None
+    if cursor:
+        after = collection.document(cursor).get()
+        if not after.exists:
+            raise ExportError('Invalid cursor')
+
+    while True:
+        page = query.start_after(after) if after is not None else query
+        docs = list(page.limit(page_size).stream())
+        for doc in docs:
+            yield doc.id, doc.to_dict()
+        if len(docs) < page_size:
+            return
+        after = docs[-1]
+
+
+def _cell(kind, value):
+    if value is None:
+        return ''
+    if kind == 'ts':
+        return naive_utc(value).isoformat() + 'Z'
+    return value
+
+
+def csv_chunks(columns, rows, rows_per_chunk=500):
+    # Header, then CSV text in chunks of `rows_per_chunk` rows
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow([name for name, _ in columns])
+    count = 0
+    for doc_id, data in rows:
+        writer.writerow([doc_id] + [_cell(kind, data.get(name)) for name, kind in columns[1:]])
+        count += 1
+        if count % rows_per_chunk == 0:
+            yield buf.getvalue().encode()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode()
+
+
+def _column_bytes(kind, values):
+    if kind == 'f8':
+        return np.array([np.nan if v is None else v for v in values], dtype='<f8').tobytes()
+    if kind == 'ts':
+        micros = [(naive_utc(v) - EPOCH) // datetime.timedelta(microseconds=1) for v in values]
+        return np.array(micros, dtype='<i8').tobytes()
+    text = json.dumps(values, separators=(',', ':')).encode()
+    return struct.pack('<I', len(text)) + text
+
+
+def columnar_chunks(columns, rows, rows_per_block=2048, meta=None):
+    """Blocks of typed arrays, one array per column.
+
+    Layout (little endian): b'HXC1', u32 header length, JSON header
+    {"columns": [[name, type], ...], ...}; then per block u32 row count n
+    and each column in order: f8 -> n float64, ts -> n int64 µs since the
+    epoch, str -> u32 length + a JSON array of n strings/nulls. A block
+    with n = 0 ends the stream. read_columnar() decodes it.
+    """
+    header = json.dumps({'columns': columns, **(meta or {})}).encode()
+    yield COLUMNAR_MAGIC + struct.pack('<I', len(header)) + header
+
+    block = []
+
+    def flush():
+        parts = [struct.pack('<I', len(block))]
+        ids = [doc_id for doc_id, _ in block]
+        parts.append(_column_bytes('str', ids))
+        for name, kind in columns[1:]:
+            parts.append(_column_bytes(kind, [data.get(name) for _, data in block]))
+        return b''.join(parts)
+
+    for row in rows:
+        block.append(row)
+        if len(block) == rows_per_block:
+            yield flush()
+            block = []
+    if block:
+        yield flush()
+    yield struct.pack('<I', 0)
+
+
+def read_columnar(stream):
+    """Yield one {column: numpy array / list} dict per block of an
+    uncompressed columnar export read from a binary file object."""
+    if stream.read(4) != COLUMNAR_MAGIC:
+        raise ExportError('Not a columnar export')
+    (length,) = struct.unpack('<I', stream.read(4))
+    columns = json.loads(stream.read(length))['columns']
+    while True:
+        (n,) = struct.unpack('<I', stream.read(4))
+        if not n:
+            return
+        block = {}
+        for name, kind in columns:
+            if kind == 'f8':
+                block[name] = np.frombuffer(stream.read(8 * n), dtype='<f8')
+            elif kind == 'ts':
+                block[name] = np.frombuffer(stream.read(8 * n), dtype='<i8').astype('datetime64[us]')
+            else:
+                (size,) = struct.unpack('<I', stream.read(4))
+                block[name] = json.loads(stream.read(size))
+        yield block
+
+
+def gzip_chunks(chunks, level=6):
+    # Compress a byte stream incrementally into one gzip member
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def export_stream(store, dataset, unit_id, fmt='csv', start=None, end=None, cursor=None):
+    """gzip-compressed export of one dataset as an iterator of byte chunks.
+
+    Validation (dataset, format, cursor) happens before the first chunk so
+    callers can still report errors instead of a truncated file.
+    """
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format '{fmt}', expected one of {FORMATS}")
+    rows = iter_rows(store, dataset, unit_id, start=start, end=end, cursor=cursor)
+    try:
+        first = next(rows)
+    except StopIteration:
+        first = None
+
+    def all_rows():
+        if first is not None:
+            yield first
+            yield from rows
+
+    columns = DATASETS[dataset]
+    if fmt == 'csv':
+        chunks = csv_chunks(columns, all_rows())
+    else:
+        meta = {'dataset': dataset, 'unit': unit_id}
+        chunks = columnar_chunks(columns, all_rows(), meta=meta)
+    return gzip_chunks(chunks)
+
+
+def export_filename(dataset, unit_id, fmt):
+    suffix = 'csv.gz' if fmt == 'csv' else 'hxc.gz'
+    return f"{dataset}-{unit_id}-{datetime.datetime.utcnow():%Y%m%dT%H%M%S}.{suffix}"
+
+
+def init_app(app):
+    import sys
+
+    import click
+
+    @app.cli.command('export')
+    @click.argument('dataset', type=click.Choice(list(DATASETS)))
+    @click.option('--unit', 'unit_id', default='default')
+    @click.option('--start', help='ISO timestamp, inclusive')
+    @click.option('--end', help='ISO timestamp, exclusive')
+    @click.option('--format', 'fmt', type=click.Choice(FORMATS), default='csv')
+    @click.option('--cursor', help='id of the last row already exported, to resume')
+    @click.option('--output', '-o', help='file to write (default: stdout)')
+    def export(dataset, unit_id, start, end, fmt, cursor, output):
+        """Stream a dataset for a time range as gzip CSV or columnar blocks."""
+        from firebase_config import db
+        from services.ingest import IngestError, parse_timestamp
+        try:
+            start = parse_timestamp(start) if start else None
+            end = parse_timestamp(end) if end else None
+            chunks = export_stream(db, dataset, unit_id, fmt, start=start, end=end, cursor=cursor)
+        except (ExportError, IngestError) as e:
+            raise click.ClickException(str(e))
+        out = open(output, 'wb') if output else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if output:
+                out.close()
@@ -0,0 +1,297 @@
+import atexit
+import datetime
+import hashlib
+import os
+import signal
+import subprocess
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from models import DEFAULT_UNIT
+
+CHUNK_SIZE = 64 * 1024
+THUMB_SIZE = 256
+
+# Magic bytes -> extension; anything else is rejected
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+)
+
+
+class ImageError(ValueError):
+    pass
+
+
+class JobsBusy(RuntimeError):
+    pass
+
+
+def sniff_extension(head):
+    for magic, ext in SIGNATURES:
+        if head.startswith(magic):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def make_thumbnail(source, target, size=THUMB_SIZE):
+    # Runs in a worker process; Pillow is only needed here
+    from PIL import Image
+    with Image.open(source) as img:
+        img.draft('RGB', (size, size))  # JPEG: decode at reduced scale
+        img = img.convert('RGB')
+        img.thumbnail((size, size))
+        tmp = f"{target}.{os.getpid()}.tmp"
+        img.save(tmp, 'JPEG', quality=80)
+    os.replace(tmp, target)
+    return target
+
+
+class ImageStore:
+    """Content-addressed image files: <root>/<aa>/<sha256>.<ext>.
+
+    Uploads are streamed to a temp file in fixed-size chunks while being
+    hashed, then renamed into place; a duplicate costs one hash pass and no
+    extra disk. Thumbnails are rendered in a process pool.
+    """
+
+    def __init__(self, root='instance/images', max_bytes=20 * 1024 * 1024, thumb_workers=2):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.thumb_workers = thumb_workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._index = {}  # digest -> path, filled lazily
+
+    def configure(self, root=None, max_bytes=None):
+        if root: self.root = root
+        if max_bytes: self.max_bytes = max_bytes
+        os.makedirs(os.path.join(self.root, 'tmp'), exist_ok=True)
+        os.makedirs(os.path.join(self.root, 'thumbs'), exist_ok=True)
+
+    def _executor(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.thumb_workers)
+                atexit.register(self._pool.shutdown, wait=False)
+            return self._pool
+
+    def save_stream(self, stream):
+        # Returns (digest, path, size, created)
+        digest = hashlib.sha256()
+        size = 0
+        head = b''
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if len(head) < 16:
+                        head += chunk[:16]
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ImageError('Image too large')
+                    digest.update(chunk)
+                    out.write(chunk)
+
+            ext = sniff_extension(head)
+            if size == 0 or ext is None:
+                raise ImageError('Unsupported image format (JPEG, PNG or WebP expected)')
+
+            image_id = digest.hexdigest()
+            path = self._path(image_id, ext)
+            created = not os.path.exists(path)
+            if created:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            else:
+                os.remove(tmp_path)
+            self._index[image_id] = path
+            return image_id, path, size, created
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def save_file(self, path):
+        with open(path, 'rb') as f:
+            return self.save_stream(f)
+
+    def discard(self, image_id):
+        # Drop a file that turned out to be bad (e.g. a truncated capture)
+        path = self._index.pop(image_id, None)
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    def _path(self, image_id, ext):
+        return os.path.join(self.root, image_id[:2], f"{image_id}.{ext}")
+
+    def find(self, image_id):
+        if not image_id or len(image_id) != 64 or not all(c in '0123456789abcdef' for c in image_id):
+            return None
+        if image_id in self._index:
+            return self._index[image_id]
+        folder = os.path.join(self.root, image_id[:2])
+        for ext in ('jpg', 'png', 'webp'):
+            path = os.path.join(folder, f"{image_id}.{ext}")
+            if os.path.exists(path):
+                self._index[image_id] = path
+                return path
+        return None
+
+    def thumb_path(self, image_id):
+        return os.path.join(self.root, 'thumbs', f"{image_id}.jpg")
+
+    def request_thumbnail(self, image_id):
+        # Fire and forget; the thumb URL 404s until the worker finishes
+        source = self.find(image_id)
+        target = self.thumb_path(image_id)
+        if source and not os.path.exists(target):
+            try:
+                return self._executor().submit(make_thumbnail, source, target)
+            except Exception as e:
+                print(f"⚠️ Thumbnail scheduling failed: {e}")
+        return None
+
+
+image_store = ImageStore()
+
+
+def _kill_group(proc):
+    # The shell and everything it started, so none keeps stdout open
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (AttributeError, ProcessLookupError, PermissionError):
+        proc.kill()
+
+
+def capture_frame(command, store, timeout=30):
+    # Stream a camera command's stdout (e.g. `libcamera-still -o -`) into the store
+    proc = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+    # A hung camera is killed after `timeout`, which also ends a blocked read
+    watchdog = threading.Timer(timeout, _kill_group, (proc,))
+    watchdog.start()
+    try:
+        result = store.save_stream(proc.stdout)
+    finally:
+        watchdog.cancel()
+        proc.stdout.close()
+        try:
+            code = proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill_group(proc)
+            code = proc.wait()
+    if code != 0:
+        # Killed or failed: whatever was read may be a truncated frame
+        if result[3]:
+            store.discard(result[0])
+        raise ImageError('Camera command failed or timed out')
+    return result
+
+
+class AnalysisJobs:
+    """Asynchronous analysis and camera capture jobs keyed by job id.
+
+    Jobs run on a small worker pool so Flask workers return immediately.
+    At most `max_pending` jobs are queued or running at once; submitting
+    more raises JobsBusy. Finished jobs are kept in memory until there are
+    more than `max_jobs`, oldest first (a job still in flight is never
+    dropped); finished analyses are announced on the event stream as
+    'scan' events.
+    """
+
+    def __init__(self, workers=2, max_jobs=500, max_pending=16):
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.max_pending = max_pending
+        self.analyzer = None  # callable(path, unit_id) -> result dict, see services.vision
+        self.publish = None
+        self._jobs = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def configure(self, analyzer=None, publish=None, workers=None, max_pending=None):
+        if analyzer: self.analyzer = analyzer
+        if publish: self.publish = publish
+        if workers: self.workers = workers
+        if max_pending: self.max_pending = max_pending
+
+    def submit(self, image_id, path, unit_id=DEFAULT_UNIT):
+        def analyze():
+            if self.analyzer is None:
+                raise RuntimeError('No image analyzer configured')
+            return self.analyzer(path, unit_id)
+        return self._submit('analysis', analyze, unit_id, image_id=image_id)
+
+    def capture(self, command, store, unit_id=DEFAULT_UNIT):
+        # Camera capture off the request thread; the result carries the image id
+        def run():
+            image_id, _, size, created = capture_frame(command, store)
+            store.request_thumbnail(image_id)
+            return {'image_id': image_id, 'size': size, 'duplicate': not created}
+        return self._submit('capture', run, unit_id, image_id=None)
+
+    def _submit(self, kind, fn, unit_id, image_id):
+        job = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'image_id': image_id,
+            'unit_id': unit_id,
+            'status': 'queued',
+            'result': None,
+            'error': None,
+            'created_at': datetime.datetime.utcnow().isoformat(),
+            'finished_at': None
+        }
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobsBusy(f"{self._pending} jobs already queued or running, try again shortly")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='analysis')
+            self._pending += 1
+            self._jobs[job['id']] = job
+            self._evict()
+        self._executor.submit(self._run, job, fn)
+        return dict(job)
+
+    def _evict(self):
+        # Oldest finished jobs first; queued/running ones stay pollable
+        excess = len(self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        finished = [job_id for job_id, job in self._jobs.items() if job['status'] in ('done', 'error')]
+        for job_id in finished[:excess]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _run(self, job, fn):
+        job['status'] = 'running'
+        try:
+            job['result'] = fn()
+            if job['kind'] == 'capture':
+                job['image_id'] = job['result']['image_id']
+            job['status'] = 'done'
+        except Exception as e:
+            job['error'] = str(e)
+            job['status'] = 'error'
+        job['finished_at'] = datetime.datetime.utcnow().isoformat()
+        with self._lock:
+            self._pending -= 1
+        if self.publish and job['kind'] == 'analysis':
+            self.publish('scan', dict(job), unit_id=job['unit_id'])
+
+
+analysis_jobs = AnalysisJobs()
@@ -0,0 +1,339 @@
+import atexit
+import datetime
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+
+from models import DEFAULT_UNIT, SensorData
+from services.spool import SpoolSyncer, StoreSink
+from services.units import unit_collection
+from storage import MAX_BATCH_WRITES, Query, naive_utc
+
+READING_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class IngestError(ValueError):
+    pass
+
+
+def parse_timestamp(value):
+    if value is None:
+        return datetime.datetime.utcnow()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            return datetime.datetime.utcfromtimestamp(value)
+        except (OverflowError, OSError, ValueError):
+            raise IngestError(f"Invalid timestamp: {value}")
+    try:
+        ts = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise IngestError(f"Invalid timestamp: {value}")
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def decode_payload(body, encoding=None, max_bytes=8 * 1024 * 1024):
+    # JSON body, optionally gzip-compressed (bulk uploads from an edge spool)
+    if encoding == 'gzip':
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = inflater.decompress(body, max_bytes)
+        except zlib.error:
+            raise IngestError("Body is not valid gzip")
+        if inflater.unconsumed_tail:
+            raise IngestError("Decompressed body is too large")
+    elif encoding not in (None, '', 'identity'):
+        raise IngestError(f"Unsupported Content-Encoding: {encoding}")
+    try:
+        return json.loads(body)
+    except ValueError:
+        return None
+
+
+def parse_reading(payload, unit_id=DEFAULT_UNIT):
+    if not isinstance(payload, dict):
+        raise IngestError("Each reading must be a JSON object")
+
+    data = {}
+    for field in SensorData.FIELDS:
+        if field not in payload:
+            continue
+        value = payload[field]
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise IngestError(f"Field '{field}' must be numeric")
+        try:
+            value = float(value)
+        except OverflowError:  # an integer too large for a float
+            raise IngestError(f"Field '{field}' must be finite")
+        if not math.isfinite(value):
+            raise IngestError(f"Field '{field}' must be finite")
+        data[field] = value
+
+    if not data:
+        raise IngestError("Reading has no known sensor fields")
+
+    reading_id = payload.get('id')
+    if reading_id is not None and not (isinstance(reading_id, str) and READING_ID_PATTERN.match(reading_id)):
+        raise IngestError("Reading id must be 1-64 letters, digits, '-' or '_'")
+    return SensorData(data, timestamp=parse_timestamp(payload.get('timestamp')), unit_id=unit_id, id=reading_id)
+
+
+class IngestBuffer:
+    """Write-behind buffer for sensor readings.
+
+    Readings are accepted into memory and committed to their unit's
+    `sensor_data` partition in batches once `max_batch` readings are pending or the oldest pending
+    reading is `max_age` seconds old. Subscribers see every accepted batch
+    immediately, before it reaches the store.
+
+    With a spool configured, readings are appended to it (durably, and
+    deduplicated by reading id) before add() returns instead of being held
+    in memory, and SpoolSyncer threads drain it to the store and, when set,
+    an upstream sink. Only readings new to the spool reach subscribers.
+    """
+
+    def __init__(self, max_batch=100, max_age=5.0, latest_ttl=5.0):
+        self.max_batch = max_batch
+        self.max_age = max_age
+        self.latest_ttl = latest_ttl
+        self.store = None
+        self._pending = []
+        self._oldest = None
+        self._latest = {}  # unit_id -> newest SensorData
+        self._latest_checked = {}  # unit_id -> monotonic time of the last store read
+        self._subscribers = []
+        self._flush_hooks = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self.spool = None
+        self.syncers = []  # store syncer first, then upstream
+        self.stats = {'accepted': 0, 'duplicates': 0, 'flushed': 0, 'commits': 0, 'errors': 0,
+                      'subscriber_errors': 0}
+
+    def configure(self, store, max_batch=None, max_age=None, spool=None, upstream=None, max_backoff=300.0):
+        self.store = store
+        if max_batch: self.max_batch = max_batch
+        if max_age: self.max_age = max_age
+        for syncer in self.syncers:
+            syncer.stop()
+        self.spool = spool
+        self.syncers = []
+        if spool:
+            sinks = ([StoreSink(store)] if store else []) + ([upstream] if upstream else [])
+            self.syncers = [
+                SpoolSyncer(spool, sink, batch_size=MAX_BATCH_WRITES, max_age=self.max_age, max_backoff=max_backoff,
+                            on_synced=self._after_flush if sink.name == 'store' else None)
+                for sink in sinks
+            ]
+            for syncer in self.syncers:
+                syncer.cursors = [s.cursor for s in self.syncers]
+                if self._running:
+                    syncer.start()
+
+    def subscribe(self, callback):
+        # callback(records) with a list of SensorData, oldest first
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
+
+    def on_flush(self, callback):
+        # callback() runs on the flushing thread after readings are committed
+        if callback not in self._flush_hooks:
+            self._flush_hooks.append(callback)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        if self.spool:
+            for syncer in self.syncers:
+                syncer.start()
+        else:
+            self._thread = threading.Thread(target=self._run, name='sensor-ingest', daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        for syncer in self.syncers:
+            syncer.stop()
+        if self._thread:
+            self._thread.join(timeout=self.max_age + 1)
+        self.flush()
+
+    def add(self, records):
+        records = sorted(records, key=lambda r: r.timestamp)
+        if not records:
+            return 0
+
+        if self.spool:
+            # Durable before the caller is acknowledged; re-sent readings drop out here
+            fresh = self.spool.append(records)
+            self.stats['duplicates'] += len(records) - len(fresh)
+            records = fresh
+            if not records:
+                return 0
+
+        with self._cond:
+            if not self.spool:
+                if not self._pending:
+                    self._oldest = time.monotonic()
+                self._pending.extend(records)
+            for record in records:
+                latest = self._latest.get(record.unit_id)
+                if latest is None or record.timestamp >= latest.timestamp:
+                    self._latest[record.unit_id] = record
+            self.stats['accepted'] += len(records)
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify()
+        for syncer in self.syncers:
+            syncer.notify()
+
+        for callback in self._subscribers:
+            try:
+                callback(records)
+            except Exception as e:
+                # Accepted already: a failing subscriber must not fail the request
+                self.stats['subscriber_errors'] += 1
+                print(f"⚠️ Ingest subscriber {getattr(callback, '__qualname__', callback)} failed: {e}")
+
+        # No flusher thread (e.g. CLI / tests): write through
+        if not self._running:
+            self.flush()
+        return len(records)
+
+    def latest(self, unit_id=DEFAULT_UNIT):
+        # In-memory reading first. The store is read on a cold start and,
+        # at most every `latest_ttl` seconds, while the cached reading is
+        # older than that: with several workers, readings may be posted to
+        # another process.
+        latest = self._latest.get(unit_id)
+        now = time.monotonic()
+        stale = latest is None or (datetime.datetime.utcnow() - latest.timestamp).total_seconds() > self.latest_ttl
+        if stale and self.store and now - self._latest_checked.get(unit_id, -math.inf) >= self.latest_ttl:
+            self._latest_checked[unit_id] = now
+            doc = next(unit_collection(self.store, unit_id, 'sensor_data')
+                       .order_by('timestamp', direction=Query.DESCENDING).limit(1).stream(), None)
+            if doc:
+                data = doc.to_dict()
+                timestamp = naive_utc(data.pop('timestamp'))
+                stored = SensorData(data, timestamp=timestamp, unit_id=unit_id, id=doc.id)
+                with self._cond:
+                    current = self._latest.get(unit_id)
+                    if current is None or stored.timestamp > current.timestamp:
+                        self._latest[unit_id] = stored
+                    latest = self._latest[unit_id]
+        return latest
+
+    def pending(self):
+        if self.spool and self.syncers:
+            return self.spool.pending(self.syncers[0].cursor)
+        with self._cond:
+            return len(self._pending)
+
+    def flush(self):
+        if self.spool:
+            # Syncs every sink now; the store syncer runs the flush hooks
+            synced = [syncer.sync() for syncer in self.syncers]
+            return synced[0] if synced else 0
+
+        with self._flush_lock:
+            with self._cond:
+                records, self._pending = self._pending, []
+                self._oldest = None
+            if not records or not self.store:
+                return 0
+
+            collections = {}
+            for start in range(0, len(records), MAX_BATCH_WRITES):
+                chunk = records[start:start + MAX_BATCH_WRITES]
+                batch = self.store.batch()
+                for record in chunk:
+                    if record.unit_id not in collections:
+                        collections[record.unit_id] = unit_collection(self.store, record.unit_id, 'sensor_data')
+                    # Reading id as doc id: a re-sent reading overwrites itself
+                    batch.set(collections[record.unit_id].document(record.id), record.to_dict())
+                try:
+                    batch.commit()
+                except Exception as e:
+                    # Put the unwritten readings back for the next attempt
+                    with self._cond:
+                        self._pending[:0] = records[start:]
+                        self._oldest = self._oldest or time.monotonic()
+                    self.stats['errors'] += 1
+                    print(f"⚠️ Sensor flush failed: {e}")
+                    return start
+                self.stats['commits'] += 1
+                self.stats['flushed'] += len(chunk)
+
+            self._after_flush()
+            return len(records)
+
+    def _after_flush(self):
+        for callback in self._flush_hooks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️ Flush hook failed: {e}")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._due():
+                    timeout = self.max_age
+                    if self._oldest is not None:
+                        timeout = max(0.05, self._oldest + self.max_age - time.monotonic())
+                    self._cond.wait(timeout)
+                if not self._running:
+                    return
+            errors = self.stats['errors']
+            self.flush()
+            if self.stats['errors'] != errors:
+                # Back off instead of spinning on a store that is down
+                with self._cond:
+                    self._cond.wait(self.max_age)
+
+    def _due(self):
+        if not self._pending:
+            return False
+        return len(self._pending) >= self.max_batch or time.monotonic() - self._oldest >= self.max_age
+
+
+ingest_buffer = IngestBuffer()
+
+
+def simulate_reading(unit_id=DEFAULT_UNIT):
+    # Stand-in for the Pi when developing without hardware
+    return SensorData({
+        'temperature': random.uniform(20, 30),
+        'humidity': random.uniform(40, 70),
+        'ph': random.uniform(5.5, 6.5),
+        'tds': random.uniform(800, 1200),
+        'n_val': random.uniform(100, 200),
+        'p_val': random.uniform(30, 50),
+        'k_val': random.uniform(100, 300),
+        'water_temp': random.uniform(18, 25),
+        'water_level': random.uniform(80, 100),
+        'light_intensity': random.uniform(1000, 5000),
+        'cpu_temp': random.uniform(40, 60),
+        'gas_status': 0
+    }, unit_id=unit_id)
+
+
+def start_simulator(buffer, interval=3.0):
+    def run():
+        while True:
+            buffer.add([simulate_reading()])
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='sensor-simulator', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,123 @@
+import atexit
+import queue
+import threading
+import time
+
+from services.units import unit_collection
+from storage import MAX_BATCH_WRITES
+
+
+class ControlLogWriter:
+    """Background writer for ControlLog entries.
+
+    Request threads enqueue and return; a single thread drains the queue in
+    batch commits of up to 500 entries. When the queue is full, enqueue
+    waits up to `put_timeout` and then writes synchronously rather than
+    dropping the entry. Those waits are counted as backpressure. Each entry
+    is written to its unit's control_logs partition.
+    """
+
+    def __init__(self, max_queue=10000, put_timeout=0.05, retries=3):
+        self.store = None
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self.stats = {
+            'queued': 0, 'written': 0, 'commits': 0, 'errors': 0, 'dropped': 0,
+            'backpressure': 0, 'sync_writes': 0, 'max_depth': 0, 'last_commit_ms': 0.0
+        }
+
+    def configure(self, store):
+        self.store = store
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='control-log-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def enqueue(self, log):
+        entry = (log.unit_id, log.to_dict())
+        if not self._thread or not self._thread.is_alive():
+            self._write([entry])
+            return
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.stats['backpressure'] += 1
+            try:
+                self._queue.put(entry, timeout=self.put_timeout)
+            except queue.Full:
+                self.stats['sync_writes'] += 1
+                self._write([entry])
+                return
+        self.stats['queued'] += 1
+        self.stats['max_depth'] = max(self.stats['max_depth'], self._queue.qsize())
+
+    def flush(self):
+        # Drain everything currently queued
+        while True:
+            entries = self._drain(block=False)
+            if not entries:
+                return
+            self._write(entries)
+
+    def _drain(self, block):
+        entries = []
+        try:
+            entries.append(self._queue.get(timeout=0.5) if block else self._queue.get_nowait())
+            while len(entries) < MAX_BATCH_WRITES:
+                entries.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return entries
+
+    def _write(self, entries):
+        if not self.store or not entries:
+            return
+        with self._flush_lock:
+            started = time.perf_counter()
+            refs = {}
+            for unit_id, _ in entries:
+                if unit_id not in refs:
+                    refs[unit_id] = unit_collection(self.store, unit_id, 'control_logs')
+            for attempt in range(self.retries + 1):
+                # Firestore batches cannot be re-committed, rebuild per attempt
+                batch = self.store.batch()
+                for unit_id, entry in entries:
+                    batch.set(refs[unit_id].document(), entry)
+                try:
+                    batch.commit()
+                    break
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    if attempt == self.retries:
+                        self.stats['dropped'] += len(entries)
+                        print(f"⚠️ Control log commit failed, dropped {len(entries)} entries: {e}")
+                        return
+                    time.sleep(0.5 * 2 ** attempt)
+            self.stats['commits'] += 1
+            self.stats['written'] += len(entries)
+            self.stats['last_commit_ms'] = round((time.perf_counter() - started) * 1000, 3)
+
+    def _run(self):
+        while not self._stop.is_set():
+            entries = self._drain(block=True)
+            self._write(entries)
+
+
+log_writer = ControlLogWriter()
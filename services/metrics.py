@@ -0,0 +1,323 @@
+import bisect
+import contextvars
+import threading
+import time
+from collections import deque
+
+# Upper bounds in milliseconds
+DEFAULT_BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Histogram:
+    """Cumulative-bucket histogram of millisecond durations."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value_ms):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value_ms)] += 1
+            self.count += 1
+            self.sum += value_ms
+            self.max = max(self.max, value_ms)
+
+    def to_dict(self):
+        with self._lock:
+            cumulative, total = {}, 0
+            for bound, n in zip(self.buckets + ('+Inf',), self.counts):
+                total += n
+                cumulative[str(bound)] = total
+            return {
+                'count': self.count,
+                'sum_ms': round(self.sum, 3),
+                'max_ms': round(self.max, 3),
+                'buckets': cumulative
+            }
+
+
+STORE_OPS = ('get', 'query', 'write', 'commit')
+
+# Stats of the request being handled on this thread/context, if any
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+def _labels(**labels):
+    inner = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels.items())
+    return '{' + inner + '}' if inner else ''
+
+
+class RequestStats:
+    """Breakdown of one request: store calls, template and user-load time."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.store = {op: [0, 0.0, 0] for op in STORE_OPS}  # op -> [calls, ms, docs]
+        self.template_ms = 0.0
+        self.load_user_ms = 0.0
+        self._template_started = []
+
+    def to_dict(self):
+        return {
+            'store': {op: {'calls': c, 'ms': round(ms, 3), 'docs': d} for op, (c, ms, d) in self.store.items() if c},
+            'template_ms': round(self.template_ms, 3),
+            'load_user_ms': round(self.load_user_ms, 3)
+        }
+
+
+class Metrics:
+    """Process-wide request, store and template metrics.
+
+    Request hooks open a RequestStats for the current context; the
+    InstrumentedStore and template signals add to it, and to process-wide
+    totals, so every store call is attributed to the request that made it
+    (background threads count towards the totals only). Rendered as
+    Prometheus text by render(); requests slower than `slow_ms` are logged
+    with their breakdown and kept in `slow`.
+    """
+
+    def __init__(self, slow_ms=500.0, slow_history=100):
+        self.slow_ms = slow_ms
+        self.slow = deque(maxlen=slow_history)
+        self._lock = threading.Lock()
+        self._requests = {}     # (endpoint, method, status) -> count
+        self._latency = {}      # endpoint -> Histogram
+        self._per_request = {}  # (endpoint, op) -> [calls, docs]
+        self._store = {op: Histogram() for op in STORE_OPS}
+        self._store_docs = dict.fromkeys(STORE_OPS, 0)
+        self._templates = {}    # template -> Histogram
+        self._load_user = Histogram()
+        self._startup = {}      # phase -> ms
+        self._collectors = []
+
+    def configure(self, slow_ms=None):
+        if slow_ms is not None: self.slow_ms = slow_ms
+
+    def collector(self, fn):
+        # fn() -> [(name, type, help, [(labels dict, value), ...]), ...]
+        if fn not in self._collectors:
+            self._collectors.append(fn)
+        return fn
+
+    # --- Recording ---
+
+    def record_store(self, op, ms, docs):
+        self._store[op].observe(ms)
+        with self._lock:
+            self._store_docs[op] += docs
+        stats = _current.get()
+        if stats is not None:
+            entry = stats.store[op]
+            entry[0] += 1
+            entry[1] += ms
+            entry[2] += docs
+
+    def begin_request(self):
+        stats = RequestStats()
+        return stats, _current.set(stats)
+
+    def end_request(self, stats, token, endpoint, method, status, path):
+        _current.reset(token)
+        elapsed = (time.perf_counter() - stats.started) * 1000
+        endpoint = endpoint or 'unmatched'
+        with self._lock:
+            key = (endpoint, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            if endpoint not in self._latency:
+                self._latency[endpoint] = Histogram()
+            for op, (calls, _, docs) in stats.store.items():
+                totals = self._per_request.setdefault((endpoint, op), [0, 0])
+                totals[0] += calls
+                totals[1] += docs
+        self._latency[endpoint].observe(elapsed)
+
+        if elapsed >= self.slow_ms:
+            entry = {'endpoint': endpoint, 'method': method, 'path': path, 'status': status,
+                     'ms': round(elapsed, 3), **stats.to_dict()}
+            self.slow.append(entry)
+            calls = ', '.join(f"{op} {c}x/{ms:.1f}ms" for op, (c, ms, _) in stats.store.items() if c) or 'no store calls'
+            print(f"🐢 Slow request {method} {path} {status} {elapsed:.1f}ms "
+                  f"({calls}; templates {stats.template_ms:.1f}ms; load_user {stats.load_user_ms:.1f}ms)")
+        return elapsed
+
+    def template_started(self):
+        stats = _current.get()
+        if stats is not None:
+            stats._template_started.append(time.perf_counter())
+
+    def template_finished(self, name):
+        stats = _current.get()
+        if stats is None or not stats._template_started:
+            return
+        ms = (time.perf_counter() - stats._template_started.pop()) * 1000
+        if not stats._template_started:
+            stats.template_ms += ms  # nested renders (includes) count once
+        with self._lock:
+            if name not in self._templates:
+                self._templates[name] = Histogram()
+        self._templates[name].observe(ms)
+
+    def record_startup(self, phase, ms):
+        with self._lock:
+            self._startup[phase] = ms
+
+    def record_load_user(self, ms):
+        self._load_user.observe(ms)
+        stats = _current.get()
+        if stats is not None:
+            stats.load_user_ms += ms
+
+    # --- Exposition ---
+
+    @staticmethod
+    def _histogram(lines, name, help_text, series):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in series:
+            data = histogram.to_dict()
+            for bound, count in data['buckets'].items():
+                lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {count}")
+            lines.append(f"{name}_sum{_labels(**labels)} {data['sum_ms']}")
+            lines.append(f"{name}_count{_labels(**labels)} {data['count']}")
+
+    def render(self):
+        lines = []
+        with self._lock:
+            requests = sorted(self._requests.items())
+            latency = sorted(self._latency.items())
+            per_request = sorted(self._per_request.items())
+            templates = sorted(self._templates.items())
+            store_docs = dict(self._store_docs)
+            startup = sorted(self._startup.items())
+
+        lines += ["# HELP hydro_http_requests_total Requests handled, by endpoint and status.",
+                  "# TYPE hydro_http_requests_total counter"]
+        for (endpoint, method, status), n in requests:
+            lines.append(f"hydro_http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {n}")
+        self._histogram(lines, 'hydro_http_request_duration_ms', 'Request latency in milliseconds.',
+                        [({'endpoint': e}, h) for e, h in latency])
+
+        lines += ["# HELP hydro_http_store_calls_total Store calls made while handling requests, by endpoint.",
+                  "# TYPE hydro_http_store_calls_total counter"]
+        for (endpoint, op), (calls, _) in per_request:
+            lines.append(f"hydro_http_store_calls_total{_labels(endpoint=endpoint, op=op)} {calls}")
+        lines += ["# HELP hydro_http_store_docs_total Documents read or written while handling requests, by endpoint.",
+                  "# TYPE hydro_http_store_docs_total counter"]
+        for (endpoint, op), (_, docs) in per_request:
+            lines.append(f"hydro_http_store_docs_total{_labels(endpoint=endpoint, op=op)} {docs}")
+
+        self._histogram(lines, 'hydro_store_call_duration_ms', 'Store round trips in milliseconds, all threads.',
+                        [({'op': op}, h) for op, h in self._store.items()])
+        lines += ["# HELP hydro_store_docs_total Documents read or written, all threads.",
+                  "# TYPE hydro_store_docs_total counter"]
+        for op, docs in store_docs.items():
+            lines.append(f"hydro_store_docs_total{_labels(op=op)} {docs}")
+
+        self._histogram(lines, 'hydro_template_render_ms', 'Template render time in milliseconds.',
+                        [({'template': t}, h) for t, h in templates])
+        self._histogram(lines, 'hydro_load_user_ms', 'Flask-Login user_loader time in milliseconds.',
+                        [({}, self._load_user)])
+
+        lines += ["# HELP hydro_startup_phase_ms Time spent in each create_app phase.",
+                  "# TYPE hydro_startup_phase_ms gauge"]
+        for phase, ms in startup:
+            lines.append(f"hydro_startup_phase_ms{_labels(phase=phase)} {round(ms, 3)}")
+
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                print(f"⚠️ Metrics collector failed: {e}")
+                continue
+            for name, kind, help_text, samples in families:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(**labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def service_collector():
+    # Cache and queue state of the in-process services
+    from services.ingest import ingest_buffer
+    from services.logs import log_writer
+    from services.plants import plant_registry
+    from services.users import user_cache
+    from services.controller import control_loop
+    from services.recent import recent_readings
+    from services.alerts import alert_engine
+
+    plants = {'hits': 0, 'loads': 0}
+    for registry in plant_registry.loaded().values():
+        for key in plants:
+            plants[key] += registry.stats[key]
+    spool = [({'sink': s.cursor}, ingest_buffer.spool.pending(s.cursor)) for s in ingest_buffer.syncers]
+    spool_errors = [({'sink': s.cursor}, s.stats['errors']) for s in ingest_buffer.syncers]
+    spool_dead = [({'sink': s.cursor}, s.stats['dead_lettered']) for s in ingest_buffer.syncers]
+    return [
+        ('hydro_spool_pending', 'gauge', 'Spooled readings not yet accepted by each sink.', spool),
+        ('hydro_spool_sync_errors_total', 'counter', 'Failed spool sync attempts per sink.', spool_errors),
+        ('hydro_spool_dead_lettered_total', 'counter', 'Readings a sink rejected for good, per sink.', spool_dead),
+        ('hydro_user_cache_total', 'counter', 'User cache lookups and evictions.',
+         [({'result': k}, v) for k, v in user_cache.stats.items()]),
+        ('hydro_plant_cache_total', 'counter', 'Plant registry hits and loads, all units.',
+         [({'result': k}, v) for k, v in plants.items()]),
+        ('hydro_ingest_pending', 'gauge', 'Readings buffered and not yet committed.',
+         [({}, ingest_buffer.pending())]),
+        ('hydro_ingest_total', 'counter', 'Ingest buffer activity.',
+         [({'event': k}, v) for k, v in ingest_buffer.stats.items()]),
+        ('hydro_control_log_queue_depth', 'gauge', 'Control log entries waiting for the writer.',
+         [({}, log_writer.depth())]),
+        ('hydro_control_log_total', 'counter', 'Control log writer activity.',
+         [({'event': k}, v) for k, v in log_writer.stats.items() if k not in ('max_depth', 'last_commit_ms')]),
+        ('hydro_alerts_total', 'counter', 'Alert engine activity (batches queued/dropped, readings evaluated).',
+         [({'event': k}, v) for k, v in alert_engine.stats.items()]),
+        ('hydro_recent_window_bytes', 'gauge', 'Memory held by each unit\'s recent-readings ring buffer.',
+         [({'unit': u}, w.nbytes) for u, w in recent_readings.loaded().items()]),
+        ('hydro_control_loop_total', 'counter', 'Control loop ticks and actions.',
+         [({'event': k}, v) for k, v in control_loop.stats.items()]),
+    ]
+
+
+def init_app(app):
+    from flask import Response, abort, before_render_template, g, jsonify, request, template_rendered
+
+    @app.before_request
+    def start_request_metrics():
+        g._metrics = metrics.begin_request()
+
+    @app.after_request
+    def finish_request_metrics(response):
+        started = g.pop('_metrics', None)
+        if started:
+            metrics.end_request(*started, request.endpoint, request.method, response.status_code, request.path)
+        return response
+
+    before_render_template.connect(lambda sender, **extra: metrics.template_started(), app, weak=False)
+    template_rendered.connect(
+        lambda sender, template, **extra: metrics.template_finished(template.name or 'string'), app, weak=False)
+
+    metrics.configure(slow_ms=app.config.get('SLOW_REQUEST_MS'))
+    metrics.collector(service_collector)
+
+    def authorized():
+        token = app.config.get('METRICS_TOKEN')
+        return not token or request.headers.get('Authorization') == f"Bearer {token}"
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        if not authorized():
+            abort(401)
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/metrics/slow')
+    def slow_requests():
+        if not authorized():
+            abort(401)
+        return jsonify({'threshold_ms': metrics.slow_ms, 'requests': list(metrics.slow)})
@@ -0,0 +1,77 @@
+import threading
+import time
+
+from models import DEFAULT_UNIT, Plant
+from services.units import UnitScoped, unit_collection
+
+
+class PlantRegistry:
+    """Read-through cache of one unit's plant profiles keyed by plant id.
+
+    The unit's `plants` collection is small and changes about once per
+    crop cycle, so it is loaded in one query and served from memory until
+    the TTL expires or a write through this registry invalidates it. The
+    active plant is the first one in the collection.
+    """
+
+    def __init__(self, unit_id=DEFAULT_UNIT, store=None, ttl=300.0):
+        self.unit_id = unit_id
+        self.ttl = ttl
+        self.store = store
+        self._plants = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'loads': 0}
+
+    def collection(self, name):
+        return unit_collection(self.store, self.unit_id, name)
+
+    def invalidate(self):
+        with self._lock:
+            self._plants = None
+
+    def _fresh(self):
+        return self._plants is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def _snapshot(self):
+        if self._fresh():
+            self.stats['hits'] += 1
+            return self._plants
+        with self._lock:
+            if not self._fresh():
+                self._load()
+            return self._plants
+
+    def _load(self):
+        plants = {}
+        if self.store:
+            for doc in self.collection('plants').stream():
+                plants[doc.id] = Plant(**doc.to_dict(), id=doc.id)
+        self._plants = plants
+        self._loaded_at = time.monotonic()
+        self.stats['loads'] += 1
+
+    def all(self):
+        return list(self._snapshot().values())
+
+    def get(self, plant_id):
+        return self._snapshot().get(str(plant_id)) if plant_id is not None else None
+
+    def active(self):
+        return next(iter(self._snapshot().values()), None)
+
+    # --- Writes (always invalidate) ---
+
+    def save(self, plant):
+        plants_ref = self.collection('plants')
+        if plant.id:
+            plants_ref.document(str(plant.id)).set(plant.to_dict())
+        else:
+            _, ref = plants_ref.add(plant.to_dict())
+            plant.id = ref.id
+        self.invalidate()
+        return plant
+
+
+# plant_registry.unit(unit_id) -> that unit's PlantRegistry
+plant_registry = UnitScoped(PlantRegistry)
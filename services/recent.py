@@ -0,0 +1,197 @@
+import datetime
+import threading
+
+import numpy as np
+
+from models import DEFAULT_UNIT, SensorData
+from services.rollups import EPOCH, history_response
+from services.units import UnitScoped
+
+FIELD_INDEX = {field: i for i, field in enumerate(SensorData.FIELDS)}
+
+
+def epoch_seconds(timestamp):
+    return (timestamp - EPOCH).total_seconds()
+
+
+class RecentWindow:
+    """Ring buffer of one unit's newest readings in fixed-schema arrays.
+
+    One float64 epoch-seconds slot and one float32 row of SensorData.FIELDS
+    (NaN = field not reported) per reading: a day at 1 Hz is ~4.8 MB
+    instead of 86,400 dicts. Appends are O(1) and overwrite the oldest
+    reading once `capacity` is reached; storage starts small and doubles
+    until then, so idle units cost next to nothing.
+
+    Window queries binary-search the (at most two) contiguous time-ordered
+    segments of the ring and reduce them with NumPy, without copying.
+    Readings older than the newest one already held (replays, late
+    uploads) are left to the store and rollups so the ring stays sorted.
+    """
+
+    def __init__(self, unit_id=DEFAULT_UNIT, capacity=86400, initial=1024):
+        self.unit_id = unit_id
+        self.capacity = capacity
+        size = min(initial, capacity)
+        self._ts = np.empty(size, dtype=np.float64)
+        self._values = np.empty((size, len(SensorData.FIELDS)), dtype=np.float32)
+        self._head = 0  # next slot to write
+        self._size = 0
+        self._lock = threading.Lock()
+        self.stats = {'appended': 0, 'late': 0}
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        return self._ts.nbytes + self._values.nbytes
+
+    def _grow(self):
+        # Only while not yet wrapped, so the data is contiguous at the front
+        size = min(self.capacity, len(self._ts) * 2)
+        ts = np.empty(size, dtype=np.float64)
+        values = np.empty((size, self._values.shape[1]), dtype=np.float32)
+        ts[:self._size] = self._ts[:self._size]
+        values[:self._size] = self._values[:self._size]
+        self._ts, self._values = ts, values
+        self._head = self._size
+
+    def append(self, record):
+        t = epoch_seconds(record.timestamp)
+        row = np.full(len(FIELD_INDEX), np.nan, dtype=np.float32)
+        for field, value in record.data.items():
+            index = FIELD_INDEX.get(field)
+            if index is not None:
+                row[index] = value
+        with self._lock:
+            if self._size and t < self._ts[self._head - 1]:
+                self.stats['late'] += 1
+                return False
+            if self._size == len(self._ts) and len(self._ts) < self.capacity:
+                self._grow()
+            self._ts[self._head] = t
+            self._values[self._head] = row
+            self._head = (self._head + 1) % len(self._ts)
+            self._size = min(self._size + 1, len(self._ts))
+            self.stats['appended'] += 1
+        return True
+
+    def extend(self, records):
+        for record in records:
+            if record.unit_id == self.unit_id:
+                self.append(record)
+
+    def _segments(self, since, until):
+        # [(ts, values)] slices inside [since, until), oldest first
+        if self._size < len(self._ts):
+            parts = [(0, self._size)]
+        else:
+            parts = [(self._head, len(self._ts)), (0, self._head)]
+        segments = []
+        for lo, hi in parts:
+            ts = self._ts[lo:hi]
+            a = np.searchsorted(ts, since, side='left') if since is not None else 0
+            b = np.searchsorted(ts, until, side='left') if until is not None else len(ts)
+            if b > a:
+                segments.append((ts[a:b], self._values[lo + a:lo + b]))
+        return segments
+
+    def oldest(self):
+        with self._lock:
+            if not self._size:
+                return None
+            index = 0 if self._size < len(self._ts) else self._head
+            return EPOCH + datetime.timedelta(seconds=float(self._ts[index]))
+
+    def covers(self, since):
+        oldest = self.oldest()
+        return oldest is not None and oldest <= since
+
+    def summary(self, fields=None, since=None, until=None):
+        """{field: {min, max, avg, last, count}} over [since, until).
+
+        Fields with no value in the window are omitted.
+        """
+        columns = [FIELD_INDEX[f] for f in (fields or SensorData.FIELDS)]
+        since = epoch_seconds(since) if since else None
+        until = epoch_seconds(until) if until else None
+        with self._lock:
+            segments = self._segments(since, until)
+            if not segments:
+                return {}
+            values = [seg[:, columns] for _, seg in segments]
+            present = [~np.isnan(v) for v in values]
+            count = sum(p.sum(axis=0) for p in present)
+            total = sum(np.nansum(v, axis=0, dtype=np.float64) for v in values)
+            mins = np.fmin.reduce([np.fmin.reduce(v, axis=0, initial=np.inf) for v in values])
+            maxs = np.fmax.reduce([np.fmax.reduce(v, axis=0, initial=-np.inf) for v in values])
+            # Newest non-NaN value per field: scan segments newest first
+            last = np.full(len(columns), np.nan)
+            for v, p in zip(reversed(values), reversed(present)):
+                missing = np.isnan(last) & p.any(axis=0)
+                if missing.any():
+                    newest = len(p) - 1 - np.argmax(p[::-1], axis=0)
+                    last[missing] = v[newest, np.arange(len(columns))][missing]
+
+        result = {}
+        for i, index in enumerate(columns):
+            if count[i]:
+                result[SensorData.FIELDS[index]] = {
+                    'min': round(float(mins[i]), 3),
+                    'max': round(float(maxs[i]), 3),
+                    'avg': round(float(total[i] / count[i]), 3),
+                    'last': round(float(last[i]), 3),
+                    'count': int(count[i])
+                }
+        return result
+
+    def series(self, field, since, until=None, bucket=60):
+        """(starts, mins, maxs, sums, counts) per `bucket` seconds, like
+        RollupManager.series(), computed from raw readings in the window."""
+        column = FIELD_INDEX[field]
+        since_s = epoch_seconds(since)
+        until_s = epoch_seconds(until) if until else None
+        with self._lock:
+            segments = self._segments(since_s, until_s)
+            ts = np.concatenate([t for t, _ in segments]) if segments else np.empty(0)
+            values = (np.concatenate([v[:, column] for _, v in segments]).astype(np.float64)
+                      if segments else np.empty(0))
+        keep = ~np.isnan(values)
+        ts, values = ts[keep], values[keep]
+        if not len(ts):
+            empty = np.empty(0)
+            return np.empty(0, dtype=np.int64), empty, empty, empty, empty
+
+        starts = (ts // bucket).astype(np.int64) * bucket
+        # Readings are time ordered, so each bucket is one contiguous run
+        edges = np.flatnonzero(np.diff(starts)) + 1
+        index = np.concatenate(([0], edges))
+        return (
+            starts[index],
+            np.minimum.reduceat(values, index),
+            np.maximum.reduceat(values, index),
+            np.add.reduceat(values, index),
+            np.diff(np.append(index, len(values))).astype(np.float64),
+        )
+
+    def history(self, field, since, points, range_key, now=None):
+        # Same shape as RollupManager.history(), from memory at the
+        # resolution the requested number of points allows
+        now = now or datetime.datetime.utcnow()
+        bucket = max(1, int((now - since).total_seconds() // points))
+        series = self.series(field, since, until=now, bucket=bucket)
+        return history_response(field, range_key, 'memory', series, points)
+
+
+# recent_readings.unit(unit_id) -> that unit's RecentWindow
+recent_readings = UnitScoped(RecentWindow)
+
+
+def record_recent(records):
+    # Ingest subscriber: route each reading to its unit's window
+    by_unit = {}
+    for record in records:
+        by_unit.setdefault(record.unit_id, []).append(record)
+    for unit_id, unit_records in by_unit.items():
+        recent_readings.unit(unit_id).extend(unit_records)
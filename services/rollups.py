@@ -0,0 +1,243 @@
+import copy
+import datetime
+import threading
+
+import numpy as np
+
+from models import DEFAULT_UNIT, SensorData
+from services.units import unit_collection
+from storage import MAX_BATCH_WRITES, read_pool
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Rollup tiers: name -> bucket width in seconds, stored in sensor_rollups_<name>.
+# Every tier costs a write per flushed bucket, so keep only those RANGES read.
+TIERS = {'1m': 60, '1h': 3600}
+
+# History range -> (tier read, span in seconds)
+RANGES = {
+    '1H': ('1m', 3600),
+    '24H': ('1m', 86400),
+    '7D': ('1h', 7 * 86400),
+    '30D': ('1h', 30 * 86400),
+}
+RANGE_ALIASES = {'1W': '7D', '1M': '30D'}
+
+# graph/<sensor_type> names that differ from the stored field names
+SENSOR_ALIASES = {'n': 'n_val', 'p': 'p_val', 'k': 'k_val', 'light': 'light_intensity', 'gas': 'gas_status'}
+
+DEFAULT_POINTS = 120
+MAX_POINTS = 1000
+
+
+def resolve_sensor(name):
+    field = SENSOR_ALIASES.get(name, name)
+    return field if field in SensorData.FIELDS else None
+
+
+def resolve_range(name):
+    name = RANGE_ALIASES.get(name, name)
+    return name if name in RANGES else None
+
+
+def bucket_start(timestamp, width):
+    seconds = int((timestamp - EPOCH).total_seconds())
+    return seconds - seconds % width
+
+
+def _merge_stats(into, other):
+    # Combine two {min, max, sum, count} aggregates
+    if not into:
+        into.update(other)
+        return into
+    into['min'] = min(into['min'], other['min'])
+    into['max'] = max(into['max'], other['max'])
+    into['sum'] += other['sum']
+    into['count'] += other['count']
+    return into
+
+
+def merge_bucket(into, other):
+    for field, stats in other.get('fields', {}).items():
+        _merge_stats(into['fields'].setdefault(field, {}), dict(stats))
+    return into
+
+
+def downsample(timestamps, mins, maxs, sums, counts, points):
+    """Min/max bucketing to at most `points` buckets.
+
+    Keeps the true envelope (min of mins, max of maxs) and count-weighted
+    averages, so spikes survive however far the series is reduced.
+    """
+    n = len(timestamps)
+    if n <= points:
+        return timestamps, mins, maxs, sums / np.maximum(counts, 1)
+
+    starts = np.linspace(0, n, points, endpoint=False).astype(np.int64)
+    starts = np.unique(starts)
+    return (
+        timestamps[starts],
+        np.minimum.reduceat(mins, starts),
+        np.maximum.reduceat(maxs, starts),
+        np.add.reduceat(sums, starts) / np.maximum(np.add.reduceat(counts, starts), 1),
+    )
+
+
+def history_response(field, range_key, tier, series, points):
+    # The /api/history payload for a (starts, mins, maxs, sums, counts)
+    # series, from the rollup tiers or the in-memory window alike
+    starts, mins, maxs, sums, counts = series
+    timestamps, mins, maxs, avgs = downsample(starts, mins, maxs, sums, counts, points)
+
+    stats = None
+    if len(starts):
+        stats = {
+            'min': float(mins.min()),
+            'max': float(maxs.max()),
+            'avg': float(sums.sum() / max(counts.sum(), 1)),
+        }
+    return {
+        'sensor': field,
+        'range': range_key,
+        'tier': tier,
+        'timestamps': [(EPOCH + datetime.timedelta(seconds=int(t))).isoformat() + 'Z' for t in timestamps],
+        'min': np.round(mins, 3).tolist(),
+        'max': np.round(maxs, 3).tolist(),
+        'avg': np.round(avgs, 3).tolist(),
+        'stats': stats
+    }
+
+
+class RollupManager:
+    """Incrementally maintained min/max/avg tiers over incoming readings.
+
+    Open buckets live in memory and are written to the store after each
+    ingest flush. A bucket first seen in this process (restart, late
+    readings) is merged with whatever the store already holds when it is
+    flushed, so the request path never reads the store. Buckets are kept
+    per unit and written to that unit's partition.
+    """
+
+    def __init__(self):
+        self.store = None
+        self._buckets = {}  # (unit_id, tier) -> {start: bucket}
+        self._dirty = set()  # (unit_id, tier, start)
+        self._lock = threading.Lock()
+
+    def configure(self, store):
+        self.store = store
+
+    def collection(self, tier, unit_id=DEFAULT_UNIT):
+        return unit_collection(self.store, unit_id, f'sensor_rollups_{tier}')
+
+    def add(self, records):
+        with self._lock:
+            for record in records:
+                for tier, width in TIERS.items():
+                    start = bucket_start(record.timestamp, width)
+                    buckets = self._buckets.setdefault((record.unit_id, tier), {})
+                    bucket = buckets.get(start)
+                    if bucket is None:
+                        bucket = {
+                            'timestamp': EPOCH + datetime.timedelta(seconds=start),
+                            'width': width,
+                            'fields': {},
+                            'merged': False
+                        }
+                        buckets[start] = bucket
+                    for field, value in record.data.items():
+                        _merge_stats(bucket['fields'].setdefault(field, {}),
+                                     {'min': value, 'max': value, 'sum': value, 'count': 1})
+                    self._dirty.add((record.unit_id, tier, start))
+
+    def flush(self):
+        if not self.store:
+            return 0
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            pending = [(key, self._buckets[key[:2]][key[2]]) for key in sorted(dirty)]
+
+        # One commit per MAX_BATCH_WRITES buckets (a backfill dirties many);
+        # a failed chunk and the ones after it stay dirty for the next flush
+        flushed = 0
+        try:
+            for offset in range(0, len(pending), MAX_BATCH_WRITES):
+                chunk = pending[offset:offset + MAX_BATCH_WRITES]
+                self._commit(chunk)
+                flushed += len(chunk)
+        except Exception:
+            with self._lock:
+                self._dirty.update(key for key, _ in pending[flushed:])
+            raise
+        finally:
+            self._evict()
+        return flushed
+
+    def _commit(self, chunk):
+        refs = [self.collection(tier, unit_id).document(str(start)) for (unit_id, tier, start), _ in chunk]
+        # Buckets first seen in this process are merged with the stored ones,
+        # read all at once
+        unmerged = [i for i, (_, bucket) in enumerate(chunk) if not bucket['merged']]
+        existing = dict(zip(unmerged, read_pool.gather(*[refs[i].get for i in unmerged])))
+
+        batch = self.store.batch()
+        with self._lock:
+            for i, (_, bucket) in enumerate(chunk):
+                if i in existing:
+                    if existing[i].exists:
+                        merge_bucket(bucket, existing[i].to_dict())
+                    bucket['merged'] = True
+                doc = {'timestamp': bucket['timestamp'], 'width': bucket['width'], 'fields': copy.deepcopy(bucket['fields'])}
+                batch.set(refs[i], doc)
+        batch.commit()
+
+    def _evict(self):
+        # Keep the newest bucket per unit and tier plus anything still unflushed
+        with self._lock:
+            for (unit_id, tier), buckets in self._buckets.items():
+                if len(buckets) <= 1:
+                    continue
+                newest = max(buckets)
+                for start in [s for s in buckets if s != newest and (unit_id, tier, s) not in self._dirty]:
+                    del buckets[start]
+
+    def series(self, field, range_key, unit_id=DEFAULT_UNIT, now=None):
+        tier, span = RANGES[range_key]
+        now = now or datetime.datetime.utcnow()
+        since = now - datetime.timedelta(seconds=span)
+
+        rows = {}
+        if self.store:
+            docs = self.collection(tier, unit_id).where('timestamp', '>=', since).order_by('timestamp').stream()
+            for doc in docs:
+                data = doc.to_dict()
+                stats = data.get('fields', {}).get(field)
+                if stats:
+                    rows[int(doc.id)] = dict(stats)
+
+        # Overlay buckets that have not reached the store yet
+        with self._lock:
+            for start, bucket in self._buckets.get((unit_id, tier), {}).items():
+                stats = bucket['fields'].get(field)
+                if not stats or EPOCH + datetime.timedelta(seconds=start) < since:
+                    continue
+                if bucket['merged'] or start not in rows:
+                    rows[start] = dict(stats)
+                else:
+                    _merge_stats(rows[start], stats)
+
+        starts = sorted(rows)
+        return tier, (
+            np.array(starts, dtype=np.int64),
+            np.array([rows[s]['min'] for s in starts], dtype=np.float64),
+            np.array([rows[s]['max'] for s in starts], dtype=np.float64),
+            np.array([rows[s]['sum'] for s in starts], dtype=np.float64),
+            np.array([rows[s]['count'] for s in starts], dtype=np.float64),
+        )
+
+    def history(self, field, range_key, points=DEFAULT_POINTS, unit_id=DEFAULT_UNIT, now=None):
+        tier, series = self.series(field, range_key, unit_id=unit_id, now=now)
+        return history_response(field, range_key, tier, series, points)
+
+
+rollups = RollupManager()
@@ -0,0 +1,422 @@
+import datetime
+import gzip
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from models import SensorData
+from services.units import unit_collection
+from storage import MAX_BATCH_WRITES
+
+
+def encode_reading(record):
+    return {'id': record.id, 'unit_id': record.unit_id, 'timestamp': record.timestamp.isoformat(), **record.data}
+
+
+class Spool:
+    """Durable, append-only local log of accepted readings (one SQLite file).
+
+    Readings are appended before the request is acknowledged and keyed by
+    reading id, so a reading the Pi re-sends after a timeout is dropped
+    here rather than stored or alerted on twice. Each sink drains the log
+    through its own named cursor (the seq it has acknowledged), so the
+    local store and an upstream relay progress independently. Synced rows
+    are kept for `retain` seconds so a cursor can be rewound and the
+    readings replayed after data loss upstream.
+    """
+
+    def __init__(self, path, retain=72 * 3600.0):
+        self.path = path
+        self.retain = retain
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS readings ('
+            ' seq INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' reading_id TEXT NOT NULL UNIQUE,'
+            ' unit_id TEXT NOT NULL,'
+            ' ts TEXT NOT NULL,'
+            ' data TEXT NOT NULL,'
+            ' appended REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS readings_ts ON readings (ts)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS cursors (name TEXT PRIMARY KEY, seq INTEGER NOT NULL)')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS dead_letters ('
+            ' cursor TEXT NOT NULL,'
+            ' reading_id TEXT NOT NULL,'
+            ' unit_id TEXT NOT NULL,'
+            ' ts TEXT NOT NULL,'
+            ' data TEXT NOT NULL,'
+            ' reason TEXT NOT NULL,'
+            ' failed REAL NOT NULL,'
+            ' PRIMARY KEY (cursor, reading_id))'
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def append(self, records):
+        """Append readings; returns the ones that were not already spooled."""
+        now = time.time()
+        fresh = []
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                for record in records:
+                    cur = self._conn.execute(
+                        'INSERT OR IGNORE INTO readings (reading_id, unit_id, ts, data, appended) VALUES (?, ?, ?, ?, ?)',
+                        (record.id, record.unit_id, record.timestamp.isoformat(), json.dumps(record.data), now)
+                    )
+                    if cur.rowcount:
+                        fresh.append(record)
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return fresh
+
+    def position(self, cursor):
+        with self._lock:
+            return self._position(cursor)
+
+    def _position(self, cursor):
+        row = self._conn.execute('SELECT seq FROM cursors WHERE name = ?', (cursor,)).fetchone()
+        return row[0] if row else 0
+
+    def read(self, cursor, limit):
+        # [(seq, SensorData)] after the cursor, oldest first
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT seq, reading_id, unit_id, ts, data FROM readings WHERE seq > ? ORDER BY seq LIMIT ?',
+                (self._position(cursor), limit)
+            ).fetchall()
+        return [
+            (seq, SensorData(json.loads(data), timestamp=datetime.datetime.fromisoformat(ts), unit_id=unit_id, id=reading_id))
+            for seq, reading_id, unit_id, ts, data in rows
+        ]
+
+    def ack(self, cursor, seq):
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO cursors (name, seq) VALUES (?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET seq = MAX(seq, excluded.seq)', (cursor, seq)
+            )
+
+    def dead_letter(self, cursor, rows, reason):
+        """Set aside readings a sink rejected for good and move the cursor
+        past them, in one transaction. They are kept (outside retention)
+        for inspection."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                for _, record in rows:
+                    self._conn.execute(
+                        'INSERT OR REPLACE INTO dead_letters (cursor, reading_id, unit_id, ts, data, reason, failed) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (cursor, record.id, record.unit_id, record.timestamp.isoformat(),
+                         json.dumps(record.data), reason, now)
+                    )
+                self._conn.execute(
+                    'INSERT INTO cursors (name, seq) VALUES (?, ?) '
+                    'ON CONFLICT(name) DO UPDATE SET seq = MAX(seq, excluded.seq)', (cursor, rows[-1][0])
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def pending(self, cursor):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM readings WHERE seq > ?', (self._position(cursor),)).fetchone()[0]
+
+    def backlog(self, cursor, at_least):
+        # Whether `at_least` readings are waiting, without counting a long backlog
+        with self._lock:
+            return self._conn.execute(
+                'SELECT 1 FROM readings WHERE seq > ? ORDER BY seq LIMIT 1 OFFSET ?',
+                (self._position(cursor), max(0, at_least - 1))
+            ).fetchone() is not None
+
+    def oldest_pending(self, cursor):
+        # Seconds since the oldest unsynced reading was appended, or None
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT appended FROM readings WHERE seq > ? ORDER BY seq LIMIT 1', (self._position(cursor),)
+            ).fetchone()
+        return time.time() - row[0] if row else None
+
+    def rewind(self, cursor, since=None):
+        """Move a cursor back so readings taken at or after `since` (all
+        retained readings when None) are sent again. Returns how many."""
+        with self._lock:
+            if since is None:
+                seq = 0
+            else:
+                row = self._conn.execute('SELECT MIN(seq) FROM readings WHERE ts >= ?', (since.isoformat(),)).fetchone()
+                seq = row[0] - 1 if row[0] is not None else self._position(cursor)
+            self._conn.execute(
+                'INSERT INTO cursors (name, seq) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET seq = excluded.seq',
+                (cursor, seq)
+            )
+            return self._conn.execute('SELECT COUNT(*) FROM readings WHERE seq > ?', (seq,)).fetchone()[0]
+
+    def prune(self, cursors):
+        # Drop readings every cursor has synced once they age out of retention
+        with self._lock:
+            synced = min((self._position(c) for c in cursors), default=0)
+            cur = self._conn.execute(
+                'DELETE FROM readings WHERE seq <= ? AND appended < ?', (synced, time.time() - self.retain)
+            )
+            return cur.rowcount
+
+    def stats(self):
+        with self._lock:
+            count, first, last = self._conn.execute('SELECT COUNT(*), MIN(seq), MAX(seq) FROM readings').fetchone()
+            cursors = dict(self._conn.execute('SELECT name, seq FROM cursors').fetchall())
+            dead = dict(self._conn.execute('SELECT cursor, COUNT(*) FROM dead_letters GROUP BY cursor').fetchall())
+        return {'path': self.path, 'readings': count, 'first_seq': first, 'last_seq': last, 'cursors': cursors,
+                'dead_letters': dead}
+
+
+class StoreSink:
+    """Writes readings to their unit's sensor_data partition, doc id = reading id."""
+
+    name = 'store'
+
+    def __init__(self, store):
+        self.store = store
+
+    def __call__(self, records):
+        collections = {}
+        for start in range(0, len(records), MAX_BATCH_WRITES):
+            batch = self.store.batch()
+            for record in records[start:start + MAX_BATCH_WRITES]:
+                if record.unit_id not in collections:
+                    collections[record.unit_id] = unit_collection(self.store, record.unit_id, 'sensor_data')
+                batch.set(collections[record.unit_id].document(record.id), record.to_dict())
+            batch.commit()
+
+
+class RejectedBatch(RuntimeError):
+    """A sink refused a batch in a way resending cannot fix (e.g. a 400)."""
+
+
+class HttpSink:
+    """Relays readings to another instance's POST /api/sensor-data as one
+    gzip-compressed JSON list per call. Reading ids travel with them, so a
+    batch re-sent after a lost response is deduplicated upstream.
+
+    4xx responses other than 408 and 429 raise RejectedBatch: the same
+    body would be refused again, so retrying would stall the cursor.
+    """
+
+    name = 'upstream'
+
+    def __init__(self, url, api_key=None, timeout=30.0):
+        self.url = url
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def __call__(self, records):
+        body = gzip.compress(json.dumps([encode_reading(r) for r in records]).encode(), compresslevel=6)
+        headers = {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}
+        if self.api_key:
+            headers['X-API-Key'] = self.api_key
+        req = urllib.request.Request(self.url, data=body, headers=headers, method='POST')
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                response.read()
+        except urllib.error.HTTPError as e:
+            message = f"upstream returned {e.code}: {e.read()[:200]!r}"
+            if 400 <= e.code < 500 and e.code not in (408, 429):
+                raise RejectedBatch(message) from e
+            raise RuntimeError(message) from e
+
+
+class SpoolSyncer:
+    """Drains one spool cursor into a sink in batches of up to `batch_size`.
+
+    The thread syncs when `batch_size` readings are waiting or the oldest
+    has waited `max_age` seconds. A backlog (catch-up after an outage) is
+    sent batch after batch without waiting. Failures back off
+    exponentially with jitter up to `max_backoff` seconds and nothing is
+    acknowledged until the sink accepted it. A batch the sink rejects for
+    good (RejectedBatch) is dead-lettered in the spool and skipped, so one
+    bad batch cannot hold back everything after it.
+    """
+
+    def __init__(self, spool, sink, batch_size=500, max_age=5.0, max_backoff=300.0, on_synced=None):
+        self.spool = spool
+        self.sink = sink
+        self.cursor = sink.name
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.max_backoff = max_backoff
+        self.on_synced = on_synced
+        self.cursors = [self.cursor]  # every cursor the spool must keep rows for
+        self._cond = threading.Condition()
+        self._sync_lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self._failures = 0
+        self._last_prune = 0.0
+        self.stats = {'synced': 0, 'batches': 0, 'errors': 0, 'dead_lettered': 0, 'pruned': 0,
+                      'last_error': None}
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"spool-{self.cursor}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=self.max_age + 1)
+
+    def notify(self):
+        with self._cond:
+            self._cond.notify()
+
+    def backoff(self):
+        if not self._failures:
+            return 0.0
+        delay = min(self.max_backoff, 2 ** (self._failures - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    def sync(self):
+        """Send everything pending now; returns readings synced, stops at the first failure."""
+        synced = 0
+        with self._sync_lock:
+            while True:
+                rows = self.spool.read(self.cursor, self.batch_size)
+                if not rows:
+                    break
+                try:
+                    self.sink([record for _, record in rows])
+                except RejectedBatch as e:
+                    self.spool.dead_letter(self.cursor, rows, str(e))
+                    self._failures = 0
+                    self.stats['dead_lettered'] += len(rows)
+                    self.stats['last_error'] = str(e)
+                    print(f"⚠️ Spool sync to {self.cursor} rejected {len(rows)} readings "
+                          f"(seq {rows[0][0]}-{rows[-1][0]}), dead-lettered: {e}")
+                    continue
+                except Exception as e:
+                    self._failures += 1
+                    self.stats['errors'] += 1
+                    self.stats['last_error'] = str(e)
+                    print(f"⚠️ Spool sync to {self.cursor} failed ({len(rows)} readings, retry in "
+                          f"{self.backoff():.0f}s): {e}")
+                    break
+                self.spool.ack(self.cursor, rows[-1][0])
+                self._failures = 0
+                synced += len(rows)
+                self.stats['synced'] += len(rows)
+                self.stats['batches'] += 1
+                if len(rows) < self.batch_size:
+                    break
+
+        if synced and self.on_synced:
+            try:
+                self.on_synced()
+            except Exception as e:
+                print(f"⚠️ Spool sync hook failed: {e}")
+        if time.monotonic() - self._last_prune > 60:
+            self._last_prune = time.monotonic()
+            self.stats['pruned'] += self.spool.prune(self.cursors)
+        return synced
+
+    def _wait(self):
+        # Seconds until a sync is due, 0 when it is due now
+        if self.spool.backlog(self.cursor, self.batch_size):
+            return 0.0
+        age = self.spool.oldest_pending(self.cursor)
+        if age is None:
+            return self.max_age
+        return max(0.0, self.max_age - age)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # While backing off, new readings do not cut the wait short
+                deadline = time.monotonic() + self.backoff() if self._failures else None
+                while self._running:
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                    else:
+                        remaining = self._wait()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(max(0.05, remaining))
+                if not self._running:
+                    return
+            self.sync()
+
+
+def init_app(app):
+    import click
+
+    @app.cli.group('spool')
+    def spool_cli():
+        """Inspect and replay the edge reading spool."""
+
+    def buffer():
+        from services.ingest import ingest_buffer
+        if not ingest_buffer.spool:
+            raise click.ClickException('No spool configured (set SPOOL_PATH)')
+        return ingest_buffer
+
+    @spool_cli.command('status')
+    def status():
+        """Show spooled readings and how far each sink has synced."""
+        ingest = buffer()
+        print(json.dumps({
+            **ingest.spool.stats(),
+            'pending': {s.cursor: ingest.spool.pending(s.cursor) for s in ingest.syncers}
+        }, indent=2))
+
+    @spool_cli.command('sync')
+    def sync():
+        """Drain every sink now (catch-up after an outage), batch after batch."""
+        for syncer in buffer().syncers:
+            total = 0
+            while True:
+                synced = syncer.sync()
+                total += synced
+                if not synced:
+                    break
+            left = syncer.spool.pending(syncer.cursor)
+            print(f"{syncer.cursor}: synced {total}, {left} pending")
+            if left:
+                raise click.ClickException(f"{syncer.cursor}: {syncer.stats['last_error']}")
+
+    @spool_cli.command('replay')
+    @click.option('--since', help='ISO timestamp of the first reading to resend (default: everything retained)')
+    @click.option('--sink', default=None, help='Only rewind this sink (store or upstream)')
+    def replay(since, sink):
+        """Rewind sinks so retained readings are sent again; duplicates are
+        overwritten upstream by reading id. Run 'spool sync' or start the app
+        to send them."""
+        from services.ingest import parse_timestamp
+        ingest = buffer()
+        start = parse_timestamp(since) if since else None
+        for syncer in ingest.syncers:
+            if sink and syncer.cursor != sink:
+                continue
+            print(f"{syncer.cursor}: {ingest.spool.rewind(syncer.cursor, start)} readings queued for replay")
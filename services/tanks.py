@@ -0,0 +1,305 @@
+import datetime
+import math
+import threading
+import time
+
+from models import DEFAULT_UNIT
+from services.units import UnitScoped, unit_collection
+from storage import naive_utc, read_pool
+
+# Used when a pump's settings carry no flow_ml_per_min / a tank no capacity_ml
+DEFAULT_FLOW_ML_PER_MIN = 100.0
+DEFAULT_CAPACITY_ML = 5000.0
+
+# Time constant of the exponentially weighted burn rate, and the shortest
+# span it is averaged over so a single early run doesn't read as a trend
+BURN_RATE_WINDOW = 7 * 86400.0
+MIN_RATE_SPAN = 86400.0
+
+
+def _iso(value):
+    return value.isoformat() + 'Z' if value else None
+
+
+def flow_rate(control):
+    # ml per second while the pump runs
+    settings = (control or {}).get('settings') or {}
+    try:
+        per_min = float(settings.get('flow_ml_per_min', DEFAULT_FLOW_ML_PER_MIN))
+    except (TypeError, ValueError):
+        per_min = DEFAULT_FLOW_ML_PER_MIN
+    return max(per_min, 0.0) / 60.0
+
+
+def tank_pump(name, tank):
+    if tank.get('pump'):
+        return tank['pump']
+    return name[:-len('_tank')] + '_pump' if name.endswith('_tank') else None
+
+
+def accrue(usage, ml, start, end, baseline=None):
+    """Usage aggregate with one pump run of `ml` over [start, end] added.
+
+    O(1) whatever the history: `consumed_ml` counts only the part after the
+    tank's last refill, `total_ml`/`run_seconds`/`runs` are lifetime totals
+    and `rate_ml` is an exponentially decayed sum (time constant
+    BURN_RATE_WINDOW) as of `rate_at`, from which burn_rate() derives ml/s.
+    """
+    usage = dict(usage)
+    span = (end - start).total_seconds()
+    counted = ml
+    if baseline and start < baseline:
+        counted = ml * max(0.0, (end - baseline).total_seconds()) / span if span > 0 else 0.0
+    usage['consumed_ml'] = usage.get('consumed_ml', 0.0) + counted
+    usage['total_ml'] = usage.get('total_ml', 0.0) + ml
+    usage['run_seconds'] = usage.get('run_seconds', 0.0) + span
+    usage['runs'] = usage.get('runs', 0) + 1
+    usage['rate_ml'] = _decayed(usage, end) + ml
+    usage['rate_at'] = end
+    usage.setdefault('since', start)
+    return usage
+
+
+def _decayed(usage, now):
+    rate_at = naive_utc(usage.get('rate_at'))
+    if not rate_at:
+        return 0.0
+    age = max(0.0, (now - rate_at).total_seconds())
+    return usage.get('rate_ml', 0.0) * math.exp(-age / BURN_RATE_WINDOW)
+
+
+def burn_rate(usage, now, running_ml=0.0):
+    # ml per second, averaged over the decay window (or the tracked span)
+    since = naive_utc(usage.get('since'))
+    if not since:
+        return 0.0
+    span = max((now - since).total_seconds(), MIN_RATE_SPAN)
+    weight = BURN_RATE_WINDOW * (1 - math.exp(-span / BURN_RATE_WINDOW))
+    return (_decayed(usage, now) + running_ml) / weight
+
+
+class TankModel:
+    """Estimated tank levels from pump run time, kept as running aggregates.
+
+    Each tank's level is the one last measured (`level_percent` at
+    `refilled_at`) minus what its pump has pumped since: run time x the
+    pump's `flow_ml_per_min` setting. Every run is folded into a small
+    tank_usage document when the pump switches off (or is switched on again,
+    which restarts `last_active`), in the same commit as the control write,
+    so forecasts never rescan control_logs. The run in progress comes from
+    ControlStatus.last_active.
+
+    Loaded with one read of tanks and tank_usage on first use and refreshed
+    after `ttl` seconds, like the control table. Callers that switch pumps
+    hold the control table lock, so runs are accrued one at a time.
+    """
+
+    def __init__(self, unit_id=DEFAULT_UNIT, store=None, ttl=60.0):
+        self.unit_id = unit_id
+        self.store = store
+        self.ttl = ttl
+        self._tanks = None
+        self._usage = None
+        self._loaded_at = 0.0
+        self._lock = threading.RLock()
+
+    def _load(self):
+        if self._tanks is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return self._tanks, self._usage
+        with self._lock:
+            if self._tanks is None or time.monotonic() - self._loaded_at >= self.ttl:
+                tanks, usage = {}, {}
+                if self.store:
+                    tanks_ref = unit_collection(self.store, self.unit_id, 'tanks')
+                    usage_ref = unit_collection(self.store, self.unit_id, 'tank_usage')
+                    tank_docs, usage_docs = read_pool.gather(
+                        lambda: list(tanks_ref.stream()), lambda: list(usage_ref.stream()))
+                    tanks = {d.id: d.to_dict() for d in tank_docs}
+                    usage = {d.id: d.to_dict() for d in usage_docs}
+                self._tanks, self._usage = tanks, usage
+                self._loaded_at = time.monotonic()
+            return self._tanks, self._usage
+
+    def invalidate(self):
+        with self._lock:
+            self._tanks = None
+
+    def _fed_by(self, pump):
+        tanks, _ = self._load()
+        return [name for name, tank in tanks.items() if tank_pump(name, tank) == pump]
+
+    def run_ended(self, control, at):
+        """{tank: usage doc} for the run of `control` that ends at `at`.
+
+        Empty when the control wasn't running or feeds no tank. Nothing
+        changes until apply() is called with the result after the commit.
+        """
+        if not control or not control.get('is_on') or not control.get('last_active'):
+            return {}
+        start = naive_utc(control['last_active'])
+        if at <= start:
+            return {}
+        tanks, usage = self._load()
+        ml = flow_rate(control) * (at - start).total_seconds()
+        return {
+            name: accrue(usage.get(name, {}), ml, start, at, naive_utc(tanks[name].get('refilled_at')))
+            for name in self._fed_by(control.get('name'))
+        }
+
+    def write(self, batch, changes):
+        ref = unit_collection(self.store, self.unit_id, 'tank_usage')
+        for name, usage in changes.items():
+            batch.set(ref.document(name), usage)
+
+    def apply(self, changes):
+        # Call after the commit carrying write(changes) succeeded
+        if not changes:
+            return
+        with self._lock:
+            _, usage = self._load()
+            usage.update(changes)
+
+    def refill(self, name, level_percent=100.0, capacity_ml=None, at=None):
+        """Record a measured level (a refill or a manual reading) as the new
+        baseline. Returns False for an unknown tank."""
+        at = at or datetime.datetime.utcnow()
+        with self._lock:
+            tanks, usage = self._load()
+            if name not in tanks:
+                return False
+            fields = {'level_percent': float(level_percent), 'refilled_at': at}
+            if capacity_ml is not None:
+                fields['capacity_ml'] = float(capacity_ml)
+            reset = dict(usage.get(name, {}), consumed_ml=0.0)
+
+            batch = self.store.batch()
+            batch.update(unit_collection(self.store, self.unit_id, 'tanks').document(name), fields)
+            batch.set(unit_collection(self.store, self.unit_id, 'tank_usage').document(name), reset)
+            batch.commit()
+
+            tanks[name] = dict(tanks[name], **fields)
+            usage[name] = reset
+        return True
+
+    def forecast(self, controls, reading=None, now=None):
+        """Per tank: estimated level, burn rate and time to empty.
+
+        `controls` is the unit's ControlStateTable (running pumps and their
+        flow settings). Tanks no pump draws from show their stored level,
+        or the water_level sensor for the main tank when a reading exists.
+        """
+        now = now or datetime.datetime.utcnow()
+        tanks, usage = self._load()
+        result = []
+        for name in sorted(tanks):
+            tank = tanks[name]
+            pump = tank_pump(name, tank)
+            control = controls.get(pump) if pump else None
+            capacity = float(tank.get('capacity_ml') or DEFAULT_CAPACITY_ML)
+            baseline = float(tank.get('level_percent', 100.0))
+            refilled_at = naive_utc(tank.get('refilled_at'))
+            stats = usage.get(name, {})
+
+            entry = {
+                'name': name,
+                'pump': pump if control else None,
+                'capacity_ml': capacity,
+                'refilled_at': _iso(refilled_at),
+                'running': bool(control and control.get('is_on')),
+                'source': 'static',
+                'level_percent': baseline,
+                'consumed_ml': None,
+                'burn_ml_per_day': None,
+                'time_to_empty_hours': None,
+                'empty_at': None
+            }
+
+            if control:
+                running_ml = counted_ml = 0.0
+                started = naive_utc(control.get('last_active'))
+                if entry['running'] and started and started < now:
+                    running_ml = flow_rate(control) * (now - started).total_seconds()
+                    if refilled_at and started < refilled_at:
+                        counted_ml = flow_rate(control) * max(0.0, (now - refilled_at).total_seconds())
+                    else:
+                        counted_ml = running_ml
+                if not stats.get('since') and running_ml:
+                    stats = dict(stats, since=started)
+                consumed = stats.get('consumed_ml', 0.0) + counted_ml
+                remaining = max(0.0, baseline / 100 * capacity - consumed)
+                rate = burn_rate(stats, now, running_ml)
+                entry.update({
+                    'source': 'model',
+                    'level_percent': round(remaining / capacity * 100, 1),
+                    'consumed_ml': round(consumed, 1),
+                    'burn_ml_per_day': round(rate * 86400, 1)
+                })
+                if rate > 0:
+                    seconds = remaining / rate
+                    entry['time_to_empty_hours'] = round(seconds / 3600, 1)
+                    entry['empty_at'] = _iso(now + datetime.timedelta(seconds=seconds))
+            elif 'main' in name and reading is not None and 'water_level' in reading.data:
+                entry['source'] = 'sensor'
+                entry['level_percent'] = float(reading.data['water_level'])
+
+            result.append(entry)
+        return result
+
+
+# tank_model.unit(unit_id) -> that unit's TankModel
+tank_model = UnitScoped(TankModel)
+
+
+def rebuild_usage(store, unit_id=DEFAULT_UNIT):
+    """Recompute every tank's usage aggregate from the full control_logs
+    history, once (a backfill after upgrading, or a repair). Uses each
+    pump's current flow setting for all of its past runs. Returns
+    {tank: usage doc}."""
+    from services.export import iter_rows
+
+    controls = {d.id: d.to_dict() for d in unit_collection(store, unit_id, 'control_status').stream()}
+    tanks = {d.id: d.to_dict() for d in unit_collection(store, unit_id, 'tanks').stream()}
+    fed = {}
+    for name, tank in tanks.items():
+        if tank_pump(name, tank) in controls:
+            fed.setdefault(tank_pump(name, tank), []).append(name)
+
+    usage = {name: {} for names in fed.values() for name in names}
+    started = {}
+    for _, log in iter_rows(store, 'control_logs', unit_id):
+        pump = log.get('control_name')
+        if pump not in fed:
+            continue
+        at = naive_utc(log['timestamp'])
+        start = started.pop(pump, None)
+        if start is not None and at > start:
+            ml = flow_rate(controls[pump]) * (at - start).total_seconds()
+            for name in fed[pump]:
+                usage[name] = accrue(usage[name], ml, start, at, naive_utc(tanks[name].get('refilled_at')))
+        if log.get('action') == 'ON':
+            started[pump] = at
+
+    batch = store.batch()
+    ref = unit_collection(store, unit_id, 'tank_usage')
+    for name, doc in usage.items():
+        batch.set(ref.document(name), doc)
+    batch.commit()
+    tank_model.unit(unit_id).invalidate()
+    return usage
+
+
+def init_app(app):
+    import click
+
+    @app.cli.group('tanks')
+    def tanks_cli():
+        """Tank consumption model."""
+
+    @tanks_cli.command('rebuild')
+    @click.option('--unit', 'unit_id', default=DEFAULT_UNIT)
+    def rebuild(unit_id):
+        """Backfill tank usage aggregates from the control log history."""
+        from firebase_config import db
+        for name, usage in sorted(rebuild_usage(db, unit_id).items()):
+            click.echo(f"{name}: {usage.get('runs', 0)} runs, {usage.get('total_ml', 0.0):.0f} ml total, "
+                       f"{usage.get('consumed_ml', 0.0):.0f} ml since refill")
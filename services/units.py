@@ -0,0 +1,282 @@
+import datetime
+import re
+import threading
+import time
+
+import click
+from flask import flash, g, jsonify, redirect, request, session, url_for
+
+from models import DEFAULT_UNIT, ControlStatus, Plant, TankLevel
+from storage import read_pool
+
+UNIT_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+DEFAULT_CONTROLS = ('n_pump', 'p_pump', 'k_pump', 'ph_up_pump', 'ph_down_pump',
+                    'circulation_pump', 'stirring_motor', 'oxygen_motor',
+                    'environmental_fans', 'cpu_fans', 'grow_light')
+DEFAULT_TANKS = ('n_tank', 'p_tank', 'k_tank', 'ph_up_tank', 'ph_down_tank', 'main_tank')
+
+# Bump when seed_unit() starts creating something existing units lack
+SEED_VERSION = 1
+
+
+def unit_path(unit_id, name):
+    """Collection path of `name` inside a unit's partition.
+
+    Each unit's data lives under units/<unit_id>/ (a subcollection in
+    Firestore, a key prefix in SQLite), so a per-unit query only reads that
+    unit's documents and index entries. The default unit keeps the original
+    top-level collections, so single-unit deployments need no migration.
+    """
+    if not unit_id or unit_id == DEFAULT_UNIT:
+        return name
+    return f"units/{unit_id}/{name}"
+
+
+def unit_collection(store, unit_id, name):
+    return store.collection(unit_path(unit_id, name))
+
+
+def valid_unit_id(unit_id):
+    return isinstance(unit_id, str) and bool(UNIT_ID_PATTERN.match(unit_id))
+
+
+class UnitScoped:
+    """One instance of a per-unit cache for each unit id, created on first use.
+
+    `factory(unit_id, **options)` builds the instance; configure() replaces
+    the options and drops every instance so they reload with them.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.options = {}
+        self._units = {}
+        self._lock = threading.Lock()
+
+    def configure(self, **options):
+        with self._lock:
+            self.options = options
+            self._units = {}
+
+    def unit(self, unit_id=DEFAULT_UNIT):
+        unit_id = unit_id or DEFAULT_UNIT
+        instance = self._units.get(unit_id)
+        if instance is None:
+            with self._lock:
+                instance = self._units.get(unit_id)
+                if instance is None:
+                    instance = self._units[unit_id] = self.factory(unit_id, **self.options)
+        return instance
+
+    def loaded(self):
+        with self._lock:
+            return dict(self._units)
+
+
+class UnitRegistry:
+    """The set of grow units, from the small top-level `units` collection.
+
+    Cached like the plant registry. The default unit always exists, with or
+    without a document.
+    """
+
+    def __init__(self, ttl=300.0):
+        self.ttl = ttl
+        self.store = None
+        self._units = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def configure(self, store, ttl=None):
+        self.store = store
+        if ttl is not None: self.ttl = ttl
+        self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self._units = None
+
+    def _snapshot(self):
+        units = self._units
+        if units is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return units
+        with self._lock:
+            if self._units is None or time.monotonic() - self._loaded_at >= self.ttl:
+                units = {DEFAULT_UNIT: {'id': DEFAULT_UNIT, 'name': 'Main Unit'}}
+                if self.store:
+                    for doc in self.store.collection('units').stream():
+                        units[doc.id] = {**doc.to_dict(), 'id': doc.id}
+                self._units = units
+                self._loaded_at = time.monotonic()
+            return self._units
+
+    def all(self):
+        return list(self._snapshot().values())
+
+    def ids(self):
+        return list(self._snapshot())
+
+    def exists(self, unit_id):
+        return unit_id in self._snapshot()
+
+    def register(self, unit_id, name=None):
+        if not valid_unit_id(unit_id):
+            raise ValueError('Unit id must be 1-64 letters, digits, "-" or "_"')
+        self.store.collection('units').document(unit_id).set({
+            'name': name or unit_id,
+            'created_at': datetime.datetime.utcnow()
+        }, merge=True)
+        seed_unit(self.store, unit_id)
+        self.invalidate()
+        return unit_id
+
+
+unit_registry = UnitRegistry()
+
+
+def seed_unit(store, unit_id=DEFAULT_UNIT):
+    """Create a unit's default plant, controls and tanks if it has none."""
+    from services.plants import plant_registry
+
+    label = '' if unit_id == DEFAULT_UNIT else f" ({unit_id})"
+    plants_ref = unit_collection(store, unit_id, 'plants')
+    controls_ref = unit_collection(store, unit_id, 'control_status')
+    tanks_ref = unit_collection(store, unit_id, 'tanks')
+    has_plants, has_controls, has_tanks = read_pool.gather(
+        *(lambda ref=ref: next(iter(ref.limit(1).stream()), None) is not None
+          for ref in (plants_ref, controls_ref, tanks_ref))
+    )
+
+    if not has_plants:
+        print(f"🌱 Seeding Default Plant{label}...")
+        plant_registry.unit(unit_id).save(Plant(name="Lettuce"))
+
+    if not has_controls:
+        print(f"🔌 Seeding Default Controls{label}...")
+        batch = store.batch()
+        for name in DEFAULT_CONTROLS:
+            # Use name as doc ID
+            batch.set(controls_ref.document(name), ControlStatus(name=name).to_dict())
+        batch.commit()
+
+    if not has_tanks:
+        print(f"🛢️ Seeding Default Tanks{label}...")
+        batch = store.batch()
+        for name in DEFAULT_TANKS:
+            batch.set(tanks_ref.document(name), TankLevel(name=name).to_dict())
+        batch.commit()
+
+
+def seed_all(store, force=False):
+    """Seed every registered unit once per SEED_VERSION.
+
+    system/seed records the version last applied, so after the first run
+    this is a single document read. Returns True if seeding ran.
+    """
+    marker = store.collection('system').document('seed')
+    if not force:
+        snapshot = marker.get()
+        if snapshot.exists and snapshot.to_dict().get('version', 0) >= SEED_VERSION:
+            return False
+    for unit_id in unit_registry.ids():
+        seed_unit(store, unit_id)
+    marker.set({'version': SEED_VERSION, 'seeded_at': datetime.datetime.utcnow()})
+    return True
+
+
+class Seeder:
+    """Runs seed_all() at most once per process, off the startup path.
+
+    start() checks the marker on a background thread so create_app() never
+    waits on the store; ensure() is what requests call, and only blocks if
+    that check is still in flight. A failed check is retried by the next
+    ensure().
+    """
+
+    def __init__(self):
+        self.store = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def configure(self, store):
+        self.store = store
+        self._done.clear()
+
+    def run(self, force=False):
+        with self._lock:
+            seeded = seed_all(self.store, force=force)
+            self._done.set()
+            return seeded
+
+    def ensure(self):
+        if self._done.is_set() or not self.store:
+            return
+        try:
+            self.run()
+        except Exception as e:
+            print(f"⚠️ Seeding failed, retrying on the next request: {e}")
+
+    def start(self):
+        threading.Thread(target=self.ensure, daemon=True, name='seed').start()
+
+
+seeder = Seeder()
+
+
+def resolve_unit():
+    # ?unit=, then X-Unit-Id, then the unit last picked on a page
+    unit_id = request.args.get('unit') or request.headers.get('X-Unit-Id') or session.get('unit') or DEFAULT_UNIT
+    if not unit_registry.exists(unit_id):
+        return None
+    if request.args.get('unit') and request.blueprint == 'views':
+        # Picking a unit on a page sticks for the pages' own API calls
+        session['unit'] = unit_id
+    return unit_id
+
+
+def init_app(app):
+    @app.before_request
+    def seed_before_first_request():
+        if app.config.get('AUTO_SEED'):
+            seeder.ensure()
+
+    @app.before_request
+    def select_unit():
+        if request.endpoint in ('static', 'assets'):
+            return None
+        g.unit = resolve_unit()
+        if g.unit is not None:
+            return None
+        stale = 'unit' in request.args or 'unit' in session
+        session.pop('unit', None)
+        if request.path.startswith('/api/'):
+            return jsonify({'success': False, 'error': 'Unknown unit'}), 404
+        # Pages fall back to the default unit, dropping the bad ?unit= from the URL
+        g.unit = DEFAULT_UNIT
+        if stale and request.method == 'GET' and request.endpoint:
+            flash('Unknown unit, showing the main unit instead.', category='error')
+            args = {k: v for k, v in request.args.items() if k != 'unit'}
+            return redirect(url_for(request.endpoint, **(request.view_args or {}), **args))
+        return None
+
+    @app.context_processor
+    def inject_units():
+        return {'unit_id': g.get('unit', DEFAULT_UNIT), 'units': unit_registry.all()}
+
+    @app.cli.command('add-unit')
+    @click.argument('unit_id')
+    @click.argument('name', required=False)
+    def add_unit(unit_id, name):
+        """Register a grow unit and seed its plant, controls and tanks."""
+        unit_registry.register(unit_id, name)
+        print(f"Registered unit {unit_id}")
+
+    @app.cli.command('seed')
+    @click.option('--force', is_flag=True, help='Re-check every unit even if the marker is current.')
+    def seed(force):
+        """Create missing default plants, controls and tanks for every unit."""
+        if seeder.run(force=force):
+            print(f"Seeded {len(unit_registry.ids())} unit(s) to version {SEED_VERSION}")
+        else:
+            print(f"Already at seed version {SEED_VERSION}")
@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import OrderedDict
+
+from models import User
+
+
+class UserCache:
+    """Bounded LRU of User objects for Flask-Login's user_loader.
+
+    Nothing in the app writes user documents after sign-up, so entries only
+    expire after `ttl` seconds, which picks up changes made by hand.
+    """
+
+    def __init__(self, max_size=1024, ttl=300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.store = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    def configure(self, store, max_size=None, ttl=None):
+        self.store = store
+        if max_size: self.max_size = max_size
+        if ttl is not None: self.ttl = ttl
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get(self, user_id):
+        user_id = str(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                user, expires = entry
+                if now < expires:
+                    self._entries.move_to_end(user_id)
+                    self.stats['hits'] += 1
+                    return user
+                del self._entries[user_id]
+                self.stats['expirations'] += 1
+            self.stats['misses'] += 1
+
+        user = self._load(user_id)
+        if user is not None:
+            self.put(user)
+        return user
+
+    def put(self, user):
+        with self._lock:
+            self._entries[str(user.id)] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(str(user.id))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def _load(self, user_id):
+        if not self.store:
+            return None
+        doc = self.store.collection('users').document(user_id).get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        return User(email=data['email'], password_hash=data['password_hash'], name=data['name'], id=user_id)
+
+
+user_cache = UserCache()
@@ -0,0 +1,222 @@
+import atexit
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from models import DEFAULT_UNIT
+from services.alerts import plant_limits
+from services.controls import reading_age
+
+# Frames are scored at a fixed low resolution so a batch stacks into one array
+FRAME_SIZE = 128
+CHUNK_FRAMES = 16
+
+# Feature columns returned by frame_features()
+FEATURES = ('green_coverage', 'yellow_ratio', 'white_ratio')
+
+MIN_COVERAGE = 0.05     # below this share of green/yellow pixels there is no plant in view
+CHLOROSIS_RATIO = 0.12  # yellow share of leaf area that counts as chlorosis
+MILDEW_RATIO = 0.06     # white share of leaf area that counts as powdery patches
+
+ISSUES = {
+    'healthy': {"health": "Healthy", "issue": "None", "cause": "Optimal conditions", "recommendation": "Maintain current nutrient levels"},
+    'nitrogen': {"health": "Unhealthy", "issue": "Nitrogen Deficiency", "cause": "Low nitrogen availability", "recommendation": "Increase nitrogen concentration"},
+    'mildew': {"health": "Unhealthy", "issue": "Powdery Mildew", "cause": "High humidity & poor airflow", "recommendation": "Improve ventilation and reduce humidity"},
+    'ph': {"health": "Unhealthy", "issue": "pH Imbalance", "cause": "pH outside optimal range of {ph_min}-{ph_max}", "recommendation": "Calibrate sensors and adjust pH using reagents"},
+    'no_plant': {"health": "Unknown", "issue": "No Plant Detected", "cause": "Too little leaf area in frame", "recommendation": "Re-centre the camera on the plant and rescan"},
+    'unreadable': {"health": "Unknown", "issue": "Unreadable Image", "cause": "The image could not be decoded", "recommendation": "Upload a JPEG, PNG or WebP photo"},
+}
+
+
+def load_frame(path, size=FRAME_SIZE):
+    # Decode straight to a small RGB array; JPEG draft mode skips most of the IDCT work
+    from PIL import Image
+    with Image.open(path) as img:
+        img.draft('RGB', (size * 2, size * 2))
+        img = img.convert('RGB').resize((size, size))
+        return np.asarray(img, dtype=np.uint8)
+
+
+def _enclosed(mask, reach=8):
+    # True where `mask` occurs within `reach` pixels on both sides, left/right
+    # or above/below. Pale background beside a leaf edge only has leaf on one side.
+    left = np.zeros_like(mask); right = np.zeros_like(mask)
+    up = np.zeros_like(mask); down = np.zeros_like(mask)
+    for step in range(1, reach + 1):
+        left[..., :, step:] |= mask[..., :, :-step]
+        right[..., :, :-step] |= mask[..., :, step:]
+        up[..., step:, :] |= mask[..., :-step, :]
+        down[..., :-step, :] |= mask[..., step:, :]
+    return (left & right) | (up & down)
+
+
+def frame_features(frames):
+    """Colour statistics for a stack of RGB frames, shape (N, H, W, 3) uint8.
+
+    Returns an (N, len(FEATURES)) float array. Pixels are classified in HSV
+    space: green leaf, yellow (chlorotic) leaf, and bright unsaturated
+    "white" pixels; only white pixels enclosed by leaf tissue count, so a
+    pale background does not read as mildew.
+    """
+    rgb = np.asarray(frames, dtype=np.float32) / 255.0
+    if rgb.ndim == 3:
+        rgb = rgb[np.newaxis]
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+
+    value = rgb.max(axis=-1)
+    delta = value - rgb.min(axis=-1)
+    saturation = np.divide(delta, value, out=np.zeros_like(value), where=value > 0)
+
+    safe = np.where(delta > 0, delta, 1.0)
+    hue = np.select(
+        [value == r, value == g],
+        [((g - b) / safe) % 6.0, (b - r) / safe + 2.0],
+        (r - g) / safe + 4.0
+    ) * 60.0
+    hue[delta == 0] = 0.0
+
+    green = (hue >= 70) & (hue <= 170) & (saturation > 0.20) & (value > 0.15)
+    yellow = (hue >= 40) & (hue < 70) & (saturation > 0.25) & (value > 0.30)
+    leaf = green | yellow
+    white = (saturation < 0.12) & (value > 0.80) & _enclosed(leaf)
+
+    pixels = value.shape[1] * value.shape[2]
+    leaf_count = leaf.sum(axis=(1, 2)).astype(np.float64)
+    white_count = white.sum(axis=(1, 2))
+    features = np.empty((rgb.shape[0], len(FEATURES)))
+    features[:, 0] = leaf_count / pixels
+    features[:, 1] = yellow.sum(axis=(1, 2)) / np.maximum(leaf_count, 1)
+    features[:, 2] = white_count / np.maximum(leaf_count + white_count, 1)
+    return features
+
+
+def score_paths(paths, size=FRAME_SIZE):
+    # Worker entry point: decode a chunk of files and score them as one stack.
+    # Unreadable files come back as a row of NaN.
+    frames, ok = [], []
+    for path in paths:
+        try:
+            frames.append(load_frame(path, size))
+            ok.append(True)
+        except ImportError:
+            raise
+        except Exception:
+            ok.append(False)
+    features = np.full((len(paths), len(FEATURES)), np.nan)
+    if frames:
+        features[np.array(ok)] = frame_features(np.stack(frames))
+    return features
+
+
+def _confidence(score):
+    # score is the measured ratio over its threshold; 1.0 -> 0.5, large -> 0.99
+    return float(np.clip(1.0 - 0.5 / max(score, 1.0), 0.5, 0.99))
+
+
+def classify(features, reading=None, limits=None):
+    """Map one feature row (see FEATURES) to an issue category.
+
+    `reading` is the latest SensorData when it is fresh enough to trust, or
+    None. sensor_validated is True only when that reading agrees with the
+    visual diagnosis: pH out of range for a pH imbalance, humidity above
+    the plant's maximum for mildew, low nitrogen for a deficiency, and pH
+    and humidity both in range for a healthy leaf.
+    """
+    limits = limits or plant_limits(None)
+    ph_min, ph_max = limits['ph']
+    sensors = reading.to_dict() if reading else {}
+    ph = sensors.get('ph')
+    humidity = sensors.get('humidity')
+    n_val = sensors.get('n_val')
+    ph_ok = ph is not None and ph_min <= ph <= ph_max
+    humidity_ok = humidity is not None and humidity <= limits['humidity'][1]
+
+    metrics = {name: round(float(v), 4) for name, v in zip(FEATURES, features)}
+    if np.isnan(features).any():
+        key, confidence, validated = 'unreadable', 0.0, False
+        metrics = {}
+    elif features[0] < MIN_COVERAGE:
+        key, confidence, validated = 'no_plant', _confidence(MIN_COVERAGE / max(features[0], 1e-6)), False
+    else:
+        chlorosis = features[1] / CHLOROSIS_RATIO
+        mildew = features[2] / MILDEW_RATIO
+        if max(chlorosis, mildew) < 1.0:
+            key, confidence = 'healthy', _confidence(1.0 / max(chlorosis, mildew, 1e-6))
+            validated = ph_ok and humidity_ok
+        elif mildew >= chlorosis:
+            key, confidence = 'mildew', _confidence(mildew)
+            validated = humidity is not None and not humidity_ok
+        elif ph is not None and not ph_ok:
+            # Yellowing with pH out of range: nutrient lockout rather than a true deficiency
+            key, confidence, validated = 'ph', _confidence(chlorosis), True
+        else:
+            key, confidence = 'nitrogen', _confidence(chlorosis)
+            validated = n_val is not None and n_val < limits['n_val'][0]
+
+    result = dict(ISSUES[key])
+    result['cause'] = result['cause'].format(ph_min=ph_min, ph_max=ph_max)
+    if key in ('nitrogen', 'mildew', 'ph') and confidence < 0.75:
+        result['health'] = 'Moderate'
+    result['confidence'] = round(confidence, 2)
+    result['sensor_validated'] = bool(validated)
+    result['metrics'] = metrics
+    return result
+
+
+class LeafAnalyzer:
+    """Deterministic leaf health scoring from colour statistics.
+
+    A single image is scored in the calling thread. analyze_batch() splits
+    the paths into chunks of CHUNK_FRAMES, decodes and scores each chunk as
+    one NumPy stack in a process pool, then classifies every frame against
+    the same sensor snapshot.
+    """
+
+    def __init__(self, workers=2, max_age=300.0):
+        self.workers = workers
+        self.max_age = max_age
+        self.plants = None
+        self.readings = None
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def configure(self, plants, readings, max_age=None, workers=None):
+        self.plants = plants
+        self.readings = readings
+        if max_age is not None: self.max_age = max_age
+        if workers: self.workers = workers
+
+    def _executor(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                atexit.register(self._pool.shutdown, wait=False)
+            return self._pool
+
+    def context(self, unit_id=DEFAULT_UNIT):
+        # (reading, limits) to validate against; stale readings are ignored
+        reading = self.readings.latest(unit_id) if self.readings else None
+        age = reading_age(reading)
+        if age is None or age > self.max_age:
+            reading = None
+        plant = self.plants.unit(unit_id).active() if self.plants else None
+        return reading, plant_limits(plant)
+
+    def __call__(self, path, unit_id=DEFAULT_UNIT):
+        reading, limits = self.context(unit_id)
+        return classify(score_paths([path])[0], reading, limits)
+
+    def analyze_batch(self, paths, pool=True, unit_id=DEFAULT_UNIT):
+        if not paths:
+            return []
+        chunks = [paths[i:i + CHUNK_FRAMES] for i in range(0, len(paths), CHUNK_FRAMES)]
+        if pool and len(chunks) > 1:
+            features = np.vstack(list(self._executor().map(score_paths, chunks)))
+        else:
+            features = np.vstack([score_paths(chunk) for chunk in chunks])
+        reading, limits = self.context(unit_id)
+        return [classify(row, reading, limits) for row in features]
+
+
+leaf_analyzer = LeafAnalyzer()
@@ -10,66 +10,57 @@ class NotificationManager {
     init() {
         this.render();
         this.updateBadge();
-        // Check for alerts every 5 seconds if not already polling elsewhere
-        // For this app, fetchSensorData usually handles the data flow
+        // Alerts arrive over the event stream (see DOMContentLoaded below)
     }
 
-    generateAlerts(data) {
-        let newAlerts = false;
-        for (const [key, value] of Object.entries(data)) {
-            const range = GLOBAL_IDEALS[key];
-            if (!range) continue;
-
-            let severity = null;
-            let type = '';
-            let action = '';
-
-            const val = parseFloat(value);
-            if (isNaN(val)) continue;
+    // Alerts are raised and cleared by the server (see /api/alerts)
+    applyAlert(alert) {
+        if (!alert.active) {
+            this.removeNotification(alert.key);
+            return;
+        }
 
-            if (val > range.max) {
-                severity = 'critical';
-                type = 'HIGH';
-                action = this.getActionSuggestion(key, 'high');
-            } else if (val < range.min) {
-                severity = 'critical';
-                type = 'LOW';
-                action = this.getActionSuggestion(key, 'low');
-            } else if (val > range.max * 0.9 || val < range.min * 1.1) {
-                // Warning zone (within 10% of limits)
-                severity = 'warning';
-                type = val > range.max * 0.9 ? 'TRENDING HIGH' : 'TRENDING LOW';
-                action = 'Monitor closely';
-            }
+        const type = alert.severity === 'critical'
+            ? (alert.direction === 'high' ? 'HIGH' : 'LOW')
+            : (alert.direction === 'high' ? 'TRENDING HIGH' : 'TRENDING LOW');
+        const range = `${alert.min ?? '-'} - ${alert.max ?? '-'}`;
+        const notif = {
+            id: alert.key,
+            key: alert.key,
+            title: `${alert.key.toUpperCase()} ${type}`,
+            value: Number(alert.value).toFixed(1),
+            range: range,
+            severity: alert.severity,
+            action: alert.severity === 'critical' ? this.getActionSuggestion(alert.key, alert.direction) : 'Monitor closely',
+            timestamp: alert.started_at,
+            unread: true
+        };
 
-            if (severity) {
-                if (this.addNotification({
-                    id: `${key}_${severity}`,
-                    key: key,
-                    title: `${key.toUpperCase()} ${type}`,
-                    value: val.toFixed(1) + (range.unit || ''),
-                    range: `${range.min} - ${range.max}${range.unit || ''}`,
-                    severity: severity,
-                    action: action,
-                    timestamp: new Date().toISOString(),
-                    unread: true
-                })) {
-                    newAlerts = true;
-                }
-            } else {
-                // Clear notification if property returned to normal
-                this.removeNotification(`${key}_critical`);
-                this.removeNotification(`${key}_warning`);
-            }
+        const existing = this.notifications.find(n => n.id === notif.id);
+        if (existing && existing.severity !== notif.severity) {
+            this.removeNotification(notif.id);
         }
-
-        if (newAlerts) {
+        if (this.addNotification(notif)) {
             this.playAlertAnimation();
         }
         this.render();
         this.save();
     }
 
+    async loadActiveAlerts() {
+        try {
+            const response = await fetch('/api/alerts?active=1');
+            const result = await response.json();
+            const activeKeys = new Set(result.alerts.map(a => a.key));
+            this.notifications = this.notifications.filter(n => activeKeys.has(n.id));
+            result.alerts.forEach(a => this.applyAlert(a));
+            this.render();
+            this.save();
+        } catch (e) {
+            console.warn('Could not load alerts', e);
+        }
+    }
+
     getActionSuggestion(key, state) {
         const actions = {
             temperature: { high: 'Turn ON Environmental Fan', low: 'Increase Heater Power' },
@@ -186,46 +177,31 @@ class NotificationManager {
     }
 }
 
+// --- Live Updates (Server-Sent Events) ---
+// One shared EventSource per page; the browser reconnects on its own and
+// resumes with Last-Event-ID, so pages never poll.
+const hydroStream = {
+    source: null,
+    on(type, handler) {
+        if (!this.source) {
+            this.source = new EventSource('/api/stream');
+        }
+        this.source.addEventListener(type, (e) => handler(JSON.parse(e.data)));
+    }
+};
+
 // Global instance
 let notificationManager;
 
 document.addEventListener('DOMContentLoaded', function () {
     notificationManager = new NotificationManager();
 
-    // Start polling if we are NOT on the monitor page (which has its own poll)
-    // Actually, it's safer to have a global poll that only runs if no other poll is active
-    // but for this implementation, we'll just hook into the existing fetch cycle in main.js
-
-    // Check if we need to start a global fetch loop
-    // If there is no fetchSensorData running elsewhere, start one
-    if (typeof fetchSensorData === 'function') {
-        const originalFetch = fetchSensorData;
-        window.fetchSensorData = async function () {
-            try {
-                const response = await fetch('/api/sensor-data');
-                const data = await response.json();
-
-                // Route to notification manager
-                if (notificationManager) {
-                    notificationManager.generateAlerts(data);
-                }
-
-                // Call original dashboard update if it exists
-                if (typeof updateDashboard === 'function') {
-                    updateDashboard(data);
-                }
-
-                return data;
-            } catch (error) {
-                console.error('Fetch failed:', error);
-            }
-        };
-
-        // If not on monitor page, start our own interval
-        if (!window.location.pathname.includes('/monitor')) {
-            setInterval(window.fetchSensorData, 5000);
-            window.fetchSensorData();
-        }
+    // Alerts are pushed by the server on every page that has the bell
+    if (notificationManager.bell) {
+        notificationManager.loadActiveAlerts();
+        hydroStream.on('alert', (alert) => notificationManager.applyAlert(alert));
+        hydroStream.on('reset', () => notificationManager.loadActiveAlerts());
+        hydroStream.on('sensor', updateDashboard);
     }
 });
 
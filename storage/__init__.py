@@ -0,0 +1,18 @@
+from .base import MAX_BATCH_WRITES, Query, NotFound, Store, naive_utc
+from .memory import MemoryStore
+from .sqlite import SqliteStore
+from .firestore import FirestoreStore
+from .instrumented import InstrumentedStore
+from .concurrent import ReadPool, read_pool
+
+BACKENDS = ('firestore', 'sqlite', 'memory')
+
+
+def create_store(backend, path=None, client=None):
+    if backend == 'memory':
+        return MemoryStore()
+    if backend == 'sqlite':
+        return SqliteStore(path or 'instance/store.db')
+    if backend == 'firestore':
+        return FirestoreStore(client)
+    raise ValueError(f"Unknown storage backend '{backend}', expected one of {BACKENDS}")
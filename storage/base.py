@@ -0,0 +1,223 @@
+import copy
+import datetime
+import threading
+import uuid
+
+# Firestore rejects batches larger than 500 writes
+MAX_BATCH_WRITES = 500
+
+
+class NotFound(Exception):
+    pass
+
+
+def new_document_id():
+    # Firestore style 20 char auto id
+    return uuid.uuid4().hex[:20]
+
+
+def get_field(data, path):
+    # Resolve dotted field paths ('settings.flow_rate') against nested dicts
+    value = data
+    for part in path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            raise KeyError(path)
+        value = value[part]
+    return value
+
+
+def apply_update(data, fields):
+    # Firestore update() semantics: dotted keys address nested fields
+    for path, value in fields.items():
+        target = data
+        parts = path.split('.')
+        for part in parts[:-1]:
+            if not isinstance(target.get(part), dict):
+                target[part] = {}
+            target = target[part]
+        target[parts[-1]] = value
+    return data
+
+
+def naive_utc(value):
+    # Firestore hands back aware datetimes, models use naive utcnow()
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def matches(data, field, op, value):
+    try:
+        current = naive_utc(get_field(data, field))
+    except KeyError:
+        return False
+    value = naive_utc(value)
+    try:
+        if op == '==': return current == value
+        if op == '!=': return current != value
+        if op == '<': return current < value
+        if op == '<=': return current <= value
+        if op == '>': return current > value
+        if op == '>=': return current >= value
+        if op == 'in': return current in value
+        if op == 'not-in': return current not in value
+        if op == 'array-contains': return isinstance(current, list) and value in current
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported operator: {op}")
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return get_field(self._data or {}, field)
+
+
+class DocumentReference:
+    def __init__(self, store, collection, doc_id):
+        self._store = store
+        self.id = doc_id
+        self.parent = CollectionReference(store, collection)
+
+    @property
+    def path(self):
+        return f"{self.parent.id}/{self.id}"
+
+    def get(self):
+        return DocumentSnapshot(self, self._store._get(self.parent.id, self.id))
+
+    def set(self, data, merge=False):
+        self._store._commit([('set', self.parent.id, self.id, data, merge)])
+
+    def update(self, data):
+        self._store._commit([('update', self.parent.id, self.id, data, False)])
+
+    def delete(self):
+        self._store._commit([('delete', self.parent.id, self.id, None, False)])
+
+
+class Query:
+    ASCENDING = 'ASCENDING'
+    DESCENDING = 'DESCENDING'
+
+    def __init__(self, store, collection, filters=(), orders=(), limit_to=None, cursor=None):
+        self._store = store
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit_to
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        state = {
+            'filters': self._filters, 'orders': self._orders,
+            'limit_to': self._limit, 'cursor': self._cursor
+        }
+        state.update(changes)
+        return Query(self._store, self._collection, **state)
+
+    def where(self, field, op, value):
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field, direction),))
+
+    def limit(self, count):
+        return self._copy(limit_to=count)
+
+    def start_after(self, cursor):
+        # Accepts a snapshot (tie-breaks on doc id) or a {field: value} dict
+        if isinstance(cursor, DocumentSnapshot):
+            values = [cursor.get(f) for f, _ in self._orders]
+            return self._copy(cursor=(values, cursor.id))
+        return self._copy(cursor=([cursor[f] for f, _ in self._orders], None))
+
+    def stream(self):
+        return iter(self._store._run_query(self))
+
+    def get(self):
+        return list(self.stream())
+
+
+class CollectionReference(Query):
+    def __init__(self, store, name):
+        super().__init__(store, name)
+        self.id = name
+
+    def document(self, doc_id=None):
+        return DocumentReference(self._store, self.id, doc_id or new_document_id())
+
+    def add(self, data, document_id=None):
+        ref = self.document(document_id)
+        ref.set(data)
+        return datetime.datetime.utcnow(), ref
+
+
+class WriteBatch:
+    def __init__(self, store):
+        self._store = store
+        self._ops = []
+
+    def __len__(self):
+        return len(self._ops)
+
+    def set(self, ref, data, merge=False):
+        self._ops.append(('set', ref.parent.id, ref.id, data, merge))
+        return self
+
+    def update(self, ref, data):
+        self._ops.append(('update', ref.parent.id, ref.id, data, False))
+        return self
+
+    def delete(self, ref):
+        self._ops.append(('delete', ref.parent.id, ref.id, None, False))
+        return self
+
+    def commit(self):
+        ops, self._ops = self._ops, []
+        if ops:
+            self._store._commit(ops)
+        return ops
+
+
+class Store:
+    """Common collection/document/query surface for the local engines.
+
+    Subclasses implement _get, _commit and _run_query.
+    """
+    name = 'base'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+
+    def collection(self, name):
+        return CollectionReference(self, name)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def close(self):
+        pass
+
+    def _snapshot(self, collection, doc_id, data):
+        return DocumentSnapshot(DocumentReference(self, collection, doc_id), data)
+
+    def _get(self, collection, doc_id):
+        raise NotImplementedError
+
+    def _commit(self, ops):
+        raise NotImplementedError
+
+    def _run_query(self, query):
+        raise NotImplementedError
@@ -0,0 +1,73 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ReadPool:
+    """Bounded thread pool that issues independent store reads at once.
+
+    gather(f, g, ...) runs each zero-argument callable on the pool and
+    returns their results in order, so a handler that needs a plant, a
+    control query and a marker document pays one round trip instead of
+    three. Every store client here is thread-safe (Firestore's gRPC channel,
+    SQLite's per-thread connections, the memory store's lock).
+
+    Calls run in a copy of the caller's context, so per-request metrics
+    still attribute them to the request. A gather issued from inside a
+    pooled call runs inline rather than waiting on the same bounded pool,
+    which could otherwise deadlock. With workers=0 everything runs inline.
+    """
+
+    def __init__(self, workers=8):
+        self.workers = workers
+        self._executor = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def configure(self, workers=None):
+        with self._lock:
+            if workers is not None: self.workers = workers
+            if self._executor:
+                self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='store-read')
+        return self._executor
+
+    def _run(self, context, fn):
+        self._local.pooled = True
+        return context.run(fn)
+
+    def gather(self, *calls):
+        if len(calls) < 2 or self.workers < 1 or getattr(self._local, 'pooled', False):
+            return [fn() for fn in calls]
+
+        pool = self._pool()
+        # The caller's thread takes the first call itself
+        try:
+            futures = [pool.submit(self._run, contextvars.copy_context(), fn) for fn in calls[1:]]
+        except RuntimeError:
+            # The interpreter is exiting (a final flush from atexit) and the
+            # pool takes no new work: read inline
+            return [fn() for fn in calls]
+        try:
+            first = calls[0]()
+        finally:
+            # Never leave reads running past the handler, even on error
+            results = []
+            error = None
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    error = error or e
+        if error:
+            raise error
+        return [first] + results
+
+
+read_pool = ReadPool()
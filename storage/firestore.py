@@ -0,0 +1,23 @@
+class FirestoreStore:
+    """Thin adapter over a firebase_admin Firestore client.
+
+    The client already speaks the collection/document/query surface the
+    routes use, so this only pins down the entry points shared with the
+    local engines. Query.ASCENDING/DESCENDING match Firestore's constants.
+    """
+    name = 'firestore'
+
+    def __init__(self, client):
+        self._client = client
+
+    def collection(self, name):
+        return self._client.collection(name)
+
+    def batch(self):
+        return self._client.batch()
+
+    def close(self):
+        self._client.close()
+
+    def __getattr__(self, attr):
+        return getattr(self._client, attr)
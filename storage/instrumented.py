@@ -0,0 +1,153 @@
+import time
+
+
+def _unwrap(obj):
+    return getattr(obj, '_target', obj)
+
+
+class _Proxy:
+    def __init__(self, store, target):
+        self._store = store
+        self._target = target
+
+    def __getattr__(self, attr):
+        return getattr(self._target, attr)
+
+
+class _Query(_Proxy):
+    # CollectionReference and Query: refinements stay wrapped, reads are timed
+
+    def where(self, *args, **kwargs):
+        return _Query(self._store, self._target.where(*args, **kwargs))
+
+    def order_by(self, *args, **kwargs):
+        return _Query(self._store, self._target.order_by(*args, **kwargs))
+
+    def limit(self, *args, **kwargs):
+        return _Query(self._store, self._target.limit(*args, **kwargs))
+
+    def start_after(self, *args, **kwargs):
+        return _Query(self._store, self._target.start_after(*args, **kwargs))
+
+    def stream(self, *args, **kwargs):
+        # Time only spent inside the store, not in the caller's loop body;
+        # the call is recorded when the iterator is exhausted or dropped
+        elapsed, count = 0.0, 0
+        started = time.perf_counter()
+        try:
+            iterator = iter(self._target.stream(*args, **kwargs))
+            elapsed += time.perf_counter() - started
+            while True:
+                started = time.perf_counter()
+                try:
+                    doc = next(iterator)
+                except StopIteration:
+                    elapsed += time.perf_counter() - started
+                    return
+                elapsed += time.perf_counter() - started
+                count += 1
+                yield doc
+        finally:
+            self._store._record('query', elapsed * 1000, count)
+
+    def get(self, *args, **kwargs):
+        started = time.perf_counter()
+        docs = self._target.get(*args, **kwargs)
+        self._store._record('query', (time.perf_counter() - started) * 1000, len(docs))
+        return docs
+
+    def document(self, *args, **kwargs):
+        return _Document(self._store, self._target.document(*args, **kwargs))
+
+    def add(self, *args, **kwargs):
+        started = time.perf_counter()
+        result = self._target.add(*args, **kwargs)
+        self._store._record('write', (time.perf_counter() - started) * 1000, 1)
+        return result
+
+
+class _Document(_Proxy):
+
+    def get(self, *args, **kwargs):
+        started = time.perf_counter()
+        snapshot = self._target.get(*args, **kwargs)
+        self._store._record('get', (time.perf_counter() - started) * 1000, 1)
+        return snapshot
+
+    def _write(self, method, *args, **kwargs):
+        started = time.perf_counter()
+        result = getattr(self._target, method)(*args, **kwargs)
+        self._store._record('write', (time.perf_counter() - started) * 1000, 1)
+        return result
+
+    def set(self, *args, **kwargs):
+        return self._write('set', *args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        return self._write('update', *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._write('delete', *args, **kwargs)
+
+    def collection(self, name):
+        return _Query(self._store, self._target.collection(name))
+
+
+class _Batch(_Proxy):
+
+    def __init__(self, store, target):
+        super().__init__(store, target)
+        self._ops = 0
+
+    def set(self, ref, *args, **kwargs):
+        self._ops += 1
+        return self._target.set(_unwrap(ref), *args, **kwargs)
+
+    def update(self, ref, *args, **kwargs):
+        self._ops += 1
+        return self._target.update(_unwrap(ref), *args, **kwargs)
+
+    def delete(self, ref, *args, **kwargs):
+        self._ops += 1
+        return self._target.delete(_unwrap(ref), *args, **kwargs)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return self._target.commit()
+        finally:
+            self._store._record('commit', (time.perf_counter() - started) * 1000, self._ops)
+
+
+class InstrumentedStore:
+    """Wraps any store (local engines or the Firestore client) and reports
+    every round trip to `record(op, ms, docs)`.
+
+    op is 'get' (one document), 'query' (stream/get of a query, docs =
+    documents returned), 'write' (one document set/update/delete/add) or
+    'commit' (a batch, docs = operations in it). Everything else is passed
+    through to the wrapped store unchanged.
+    """
+
+    def __init__(self, store, record):
+        self._target = store
+        self.record = record
+
+    @property
+    def wrapped(self):
+        return self._target
+
+    def _record(self, op, ms, docs):
+        try:
+            self.record(op, ms, docs)
+        except Exception:
+            pass  # metrics must never break a store call
+
+    def collection(self, name):
+        return _Query(self, self._target.collection(name))
+
+    def batch(self):
+        return _Batch(self, self._target.batch())
+
+    def __getattr__(self, attr):
+        return getattr(self._target, attr)
@@ -0,0 +1,83 @@
+import copy
+from functools import cmp_to_key
+
+from .base import Store, NotFound, Query, apply_update, get_field, matches, naive_utc
+
+
+def _order_key(data, doc_id, orders):
+    return [naive_utc(get_field(data, field)) for field, _ in orders] + [doc_id]
+
+
+def _compare(a, b, orders):
+    # Field by field, honouring each direction; doc id breaks ties ascending
+    directions = [d for _, d in orders] + [orders[-1][1] if orders else Query.ASCENDING]
+    for x, y, direction in zip(a, b, directions):
+        if x == y:
+            continue
+        try:
+            less = x < y
+        except TypeError:
+            less = str(type(x)) < str(type(y))
+        result = -1 if less else 1
+        return -result if direction == Query.DESCENDING else result
+    return 0
+
+
+class MemoryStore(Store):
+    """Process-local engine backed by plain dicts. Nothing is persisted."""
+    name = 'memory'
+
+    def __init__(self):
+        super().__init__()
+        self._collections = {}
+
+    def _get(self, collection, doc_id):
+        with self._lock:
+            data = self._collections.get(collection, {}).get(doc_id)
+            return copy.deepcopy(data) if data is not None else None
+
+    def _commit(self, ops):
+        with self._lock:
+            # Validate first so a failing batch leaves nothing half applied
+            for op, collection, doc_id, _, _ in ops:
+                if op == 'update' and doc_id not in self._collections.get(collection, {}):
+                    raise NotFound(f"{collection}/{doc_id}")
+
+            for op, collection, doc_id, data, merge in ops:
+                docs = self._collections.setdefault(collection, {})
+                if op == 'delete':
+                    docs.pop(doc_id, None)
+                elif op == 'update' or merge:
+                    docs[doc_id] = apply_update(docs.get(doc_id, {}), copy.deepcopy(data))
+                else:
+                    docs[doc_id] = copy.deepcopy(data)
+
+    def _run_query(self, query):
+        with self._lock:
+            docs = self._collections.get(query._collection, {})
+            rows = []
+            for doc_id, data in docs.items():
+                if not all(matches(data, f, op, v) for f, op, v in query._filters):
+                    continue
+                try:
+                    key = _order_key(data, doc_id, query._orders)
+                except KeyError:
+                    continue  # Firestore drops docs missing an order_by field
+                rows.append((key, doc_id, data))
+
+            compare = cmp_to_key(lambda a, b: _compare(a[0], b[0], query._orders))
+            rows.sort(key=compare)
+
+            if query._cursor is not None:
+                values, cursor_id = query._cursor
+                cursor_key = [naive_utc(v) for v in values]
+                if cursor_id is not None:
+                    cursor_key.append(cursor_id)
+                    rows = [r for r in rows if _compare(r[0], cursor_key, query._orders) > 0]
+                else:
+                    rows = [r for r in rows if _compare(r[0][:len(cursor_key)], cursor_key, query._orders) > 0]
+
+            if query._limit is not None:
+                rows = rows[:query._limit]
+
+            return [self._snapshot(query._collection, doc_id, copy.deepcopy(data)) for _, doc_id, data in rows]
@@ -0,0 +1,194 @@
+import datetime
+import json
+import os
+import re
+import sqlite3
+import threading
+
+from .base import Store, NotFound, Query, apply_update
+
+# Datetimes are stored as tagged, fixed width strings so they sort correctly
+# inside json_extract() comparisons and round-trip back to datetime objects
+DT_PREFIX = '$dt:'
+DT_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+# Fields the routes filter or order on; expression indexes must match the
+# json_extract() text used in queries exactly, so paths are inlined
+INDEXES = (
+    ('timestamp',),
+    ('name',),
+    ('email',),
+    ('control_name', 'timestamp'),
+    ('trigger', 'timestamp'),
+)
+
+FIELD_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$')
+
+SQL_OPS = {'==': '=', '!=': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+
+
+def encode_value(value):
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return DT_PREFIX + value.strftime(DT_FORMAT)
+    if isinstance(value, dict):
+        return {k: encode_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(v) for v in value]
+    return value
+
+
+def decode_value(value):
+    if isinstance(value, str) and value.startswith(DT_PREFIX):
+        return datetime.datetime.strptime(value[len(DT_PREFIX):], DT_FORMAT)
+    if isinstance(value, dict):
+        return {k: decode_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decode_value(v) for v in value]
+    return value
+
+
+def _param(value):
+    value = encode_value(value)
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+def _field_sql(field):
+    if field == '__name__':
+        return 'id'
+    if not FIELD_RE.match(field):
+        raise ValueError(f"Invalid field path: {field}")
+    return f"json_extract(data, '$.{field}')"
+
+
+class SqliteStore(Store):
+    """Single file SQLite engine in WAL mode for edge units and offline runs."""
+    name = 'sqlite'
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        if path != ':memory:' and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._init_schema()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS documents ('
+            ' collection TEXT NOT NULL,'
+            ' id TEXT NOT NULL,'
+            ' data TEXT NOT NULL,'
+            ' PRIMARY KEY (collection, id)) WITHOUT ROWID'
+        )
+        for fields in INDEXES:
+            columns = ', '.join(_field_sql(f) for f in fields)
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_documents_{'_'.join(fields)} "
+                f"ON documents (collection, {columns})"
+            )
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _get(self, collection, doc_id):
+        row = self._conn().execute(
+            'SELECT data FROM documents WHERE collection = ? AND id = ?', (collection, doc_id)
+        ).fetchone()
+        return decode_value(json.loads(row[0])) if row else None
+
+    def _commit(self, ops):
+        conn = self._conn()
+        with self._lock:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for op, collection, doc_id, data, merge in ops:
+                    if op == 'delete':
+                        conn.execute('DELETE FROM documents WHERE collection = ? AND id = ?', (collection, doc_id))
+                        continue
+
+                    if op == 'update' or merge:
+                        current = self._get(collection, doc_id)
+                        if current is None and op == 'update':
+                            raise NotFound(f"{collection}/{doc_id}")
+                        data = apply_update(current or {}, data)
+
+                    conn.execute(
+                        'INSERT OR REPLACE INTO documents (collection, id, data) VALUES (?, ?, ?)',
+                        (collection, doc_id, json.dumps(encode_value(data)))
+                    )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def _run_query(self, query):
+        sql = ['SELECT id, data FROM documents WHERE collection = ?']
+        params = [query._collection]
+
+        for field, op, value in query._filters:
+            column = _field_sql(field)
+            if op in ('in', 'not-in'):
+                placeholders = ', '.join('?' for _ in value) or 'NULL'
+                negate = 'NOT ' if op == 'not-in' else ''
+                sql.append(f'AND {column} {negate}IN ({placeholders})')
+                params.extend(_param(v) for v in value)
+            elif op == 'array-contains':
+                sql.append(f"AND EXISTS (SELECT 1 FROM json_each(data, '$.{field}') WHERE value = ?)")
+                params.append(_param(value))
+            elif value is None and op in ('==', '!='):
+                sql.append(f"AND {column} IS {'NOT ' if op == '!=' else ''}NULL")
+            elif op in SQL_OPS:
+                sql.append(f'AND {column} {SQL_OPS[op]} ?')
+                params.append(_param(value))
+            else:
+                raise ValueError(f"Unsupported operator: {op}")
+
+        # Firestore drops docs missing an order_by field
+        for field, _ in query._orders:
+            sql.append(f"AND json_type(data, '$.{field}') IS NOT NULL")
+
+        orders = list(query._orders)
+        tie_direction = orders[-1][1] if orders else Query.ASCENDING
+
+        if query._cursor is not None:
+            values, cursor_id = query._cursor
+            keys = [(_field_sql(f), d) for f, d in orders[:len(values)]]
+            values = [_param(v) for v in values]
+            if cursor_id is not None:
+                keys.append(('id', tie_direction))
+                values.append(cursor_id)
+            clauses = []
+            for i, (column, direction) in enumerate(keys):
+                cmp = '<' if direction == Query.DESCENDING else '>'
+                parts = [f'{c} = ?' for c, _ in keys[:i]] + [f'{column} {cmp} ?']
+                clauses.append('(' + ' AND '.join(parts) + ')')
+                params.extend(values[:i] + [values[i]])
+            sql.append('AND (' + ' OR '.join(clauses) + ')')
+
+        order_sql = [f"{_field_sql(f)} {'DESC' if d == Query.DESCENDING else 'ASC'}" for f, d in orders]
+        order_sql.append(f"id {'DESC' if tie_direction == Query.DESCENDING else 'ASC'}")
+        sql.append('ORDER BY ' + ', '.join(order_sql))
+
+        if query._limit is not None:
+            sql.append('LIMIT ?')
+            params.append(int(query._limit))
+
+        rows = self._conn().execute(' '.join(sql), params).fetchall()
+        return [self._snapshot(query._collection, doc_id, decode_value(json.loads(data))) for doc_id, data in rows]
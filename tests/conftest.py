@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import MemoryStore, SqliteStore  # noqa: E402
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        yield MemoryStore()
+    else:
+        store = SqliteStore(str(tmp_path / 'store.db'))
+        yield store
+        store.close()
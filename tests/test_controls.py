@@ -0,0 +1,81 @@
+import datetime
+
+import pytest
+
+from models import ControlStatus, SensorData
+from services.controls import control_state, switch_controls
+from services.tanks import tank_model
+from services.units import unit_collection
+
+NAMES = ('n_pump', 'ph_up_pump', 'ph_down_pump', 'grow_light')
+
+
+@pytest.fixture
+def controls(store):
+    batch = store.batch()
+    for name in NAMES:
+        batch.set(unit_collection(store, 'default', 'control_status').document(name), ControlStatus(name=name).to_dict())
+    batch.commit()
+    control_state.configure(store=store)
+    tank_model.configure(store=store)
+    yield control_state.unit()
+    control_state.configure()
+    tank_model.configure()
+
+
+@pytest.fixture
+def reading():
+    return SensorData({'water_level': 90.0, 'ph': 6.0}, timestamp=datetime.datetime.utcnow())
+
+
+def stored(store, name):
+    return unit_collection(store, 'default', 'control_status').document(name).get().to_dict()['is_on']
+
+
+def logged(store):
+    return sorted(d.to_dict()['control_name'] for d in unit_collection(store, 'default', 'control_logs').stream())
+
+
+def test_applies_every_allowed_change_in_one_commit(store, controls, reading):
+    applied, results = switch_controls(store, [('n_pump', True), ('grow_light', True)], reading, 60)
+    assert applied
+    assert [r['status'] for r in results] == ['ok', 'ok']
+    assert stored(store, 'n_pump') and stored(store, 'grow_light')
+    assert controls.states()['n_pump'] is True
+    assert logged(store) == ['grow_light', 'n_pump']
+
+
+def test_non_atomic_applies_what_passes(store, controls, reading):
+    applied, results = switch_controls(
+        store, [('ph_up_pump', True), ('ph_down_pump', True), ('nope', True)], reading, 60)
+    assert applied
+    assert [r['status'] for r in results] == ['ok', 'blocked', 'not_found']
+    assert stored(store, 'ph_up_pump') and not stored(store, 'ph_down_pump')
+    assert logged(store) == ['ph_up_pump']
+
+
+def test_atomic_rejection_applies_nothing(store, controls, reading):
+    applied, results = switch_controls(
+        store, [('ph_up_pump', True), ('ph_down_pump', True)], reading, 60, atomic=True)
+    assert not applied
+    assert [r['status'] for r in results] == ['not_applied', 'blocked']
+    assert not stored(store, 'ph_up_pump') and not stored(store, 'ph_down_pump')
+    assert controls.states()['ph_up_pump'] is False
+    assert logged(store) == []
+
+
+def test_offs_are_evaluated_before_ons(store, controls, reading):
+    switch_controls(store, [('ph_down_pump', True)], reading, 60)
+    applied, results = switch_controls(
+        store, [('ph_up_pump', True), ('ph_down_pump', False)], reading, 60, atomic=True)
+    assert applied
+    assert [r['status'] for r in results] == ['ok', 'ok']
+    assert stored(store, 'ph_up_pump') and not stored(store, 'ph_down_pump')
+
+
+def test_pumps_are_blocked_without_a_recent_reading(store, controls, reading):
+    stale = SensorData({'water_level': 90.0}, timestamp=datetime.datetime.utcnow() - datetime.timedelta(minutes=5))
+    _, results = switch_controls(store, [('n_pump', True), ('grow_light', True)], stale, 60)
+    assert [r['status'] for r in results] == ['blocked', 'ok']
+    _, results = switch_controls(store, [('n_pump', True)], None, 60)
+    assert results[0]['status'] == 'blocked'
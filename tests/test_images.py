@@ -0,0 +1,61 @@
+import threading
+import time
+
+import pytest
+
+from services.images import AnalysisJobs, JobsBusy
+
+
+def wait_for(jobs, job_id, status='done', timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs.get(job_id)
+        if job and job['status'] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} never reached {status}")
+
+
+@pytest.fixture
+def gate():
+    gate = threading.Event()
+    yield gate
+    gate.set()
+
+
+def test_submit_beyond_max_pending_is_refused(gate):
+    jobs = AnalysisJobs(workers=1, max_pending=2)
+    jobs.configure(analyzer=lambda path, unit_id: gate.wait() and {'ok': True})
+    first = jobs.submit('img', 'path')
+    jobs.submit('img', 'path')
+    with pytest.raises(JobsBusy):
+        jobs.submit('img', 'path')
+    gate.set()
+    assert wait_for(jobs, first['id'])['result'] == {'ok': True}
+    jobs.submit('img', 'path')
+
+
+def test_only_finished_jobs_are_evicted(gate):
+    jobs = AnalysisJobs(workers=1, max_jobs=2, max_pending=10)
+    jobs.configure(analyzer=lambda path, unit_id: gate.wait() and {'ok': True})
+    queued = [jobs.submit('img', 'path')['id'] for _ in range(4)]
+    assert all(jobs.get(job_id) for job_id in queued)
+
+    gate.set()
+    for job_id in queued:
+        wait_for(jobs, job_id)
+    newest = jobs.submit('img', 'path')['id']
+    wait_for(jobs, newest)
+    assert jobs.get(queued[0]) is None
+    assert jobs.get(newest) is not None
+
+
+def test_analyzer_errors_are_reported_on_the_job():
+    jobs = AnalysisJobs(workers=1)
+
+    def broken(path, unit_id):
+        raise ValueError('unreadable image')
+
+    jobs.configure(analyzer=broken)
+    job = wait_for(jobs, jobs.submit('img', 'path')['id'], status='error')
+    assert job['error'] == 'unreadable image'
@@ -0,0 +1,57 @@
+import datetime
+
+import pytest
+
+from models import SensorData
+from services.ingest import IngestBuffer, IngestError, parse_reading, parse_timestamp
+
+
+@pytest.mark.parametrize('payload, message', [
+    ([], 'must be a JSON object'),
+    ({}, 'no known sensor fields'),
+    ({'unknown': 1}, 'no known sensor fields'),
+    ({'ph': '6.1'}, "'ph' must be numeric"),
+    ({'ph': True}, "'ph' must be numeric"),
+    ({'ph': None}, "'ph' must be numeric"),
+    ({'ph': float('nan')}, "'ph' must be finite"),
+    ({'ph': float('inf')}, "'ph' must be finite"),
+    ({'ph': 10 ** 400}, "'ph' must be finite"),
+    ({'ph': 6.1, 'id': 'has spaces'}, 'Reading id'),
+    ({'ph': 6.1, 'id': 'x' * 65}, 'Reading id'),
+    ({'ph': 6.1, 'id': 7}, 'Reading id'),
+    ({'ph': 6.1, 'timestamp': 'yesterday'}, 'Invalid timestamp'),
+    ({'ph': 6.1, 'timestamp': 1e20}, 'Invalid timestamp'),
+])
+def test_parse_reading_rejects(payload, message):
+    with pytest.raises(IngestError, match=message):
+        parse_reading(payload)
+
+
+def test_parse_reading_accepts():
+    reading = parse_reading({'ph': 6, 'temperature': 21.5, 'id': 'pi-1_42', 'timestamp': '2026-01-01T01:00:00+01:00'},
+                            unit_id='tent')
+    assert reading.data == {'ph': 6.0, 'temperature': 21.5}
+    assert reading.id == 'pi-1_42' and reading.unit_id == 'tent'
+    assert reading.timestamp == datetime.datetime(2026, 1, 1)
+
+
+def test_parse_timestamp_epoch_seconds():
+    assert parse_timestamp(0) == datetime.datetime(1970, 1, 1)
+    with pytest.raises(IngestError):
+        parse_timestamp(True)
+
+
+def test_failing_subscriber_does_not_fail_the_batch(store):
+    buffer = IngestBuffer()
+    buffer.configure(store)
+    seen = []
+
+    def broken(records):
+        raise RuntimeError('subscriber down')
+
+    buffer.subscribe(broken)
+    buffer.subscribe(seen.extend)
+    assert buffer.add([SensorData({'ph': 6.0})]) == 1
+    assert len(seen) == 1
+    assert buffer.stats['subscriber_errors'] == 1
+    assert len(list(store.collection('sensor_data').stream())) == 1
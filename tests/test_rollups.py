@@ -0,0 +1,70 @@
+import datetime
+
+from models import SensorData
+from services.rollups import RollupManager
+from storage import MAX_BATCH_WRITES
+
+T0 = datetime.datetime(2026, 1, 1)
+
+
+def minutes(count, value=6.0):
+    return [SensorData({'ph': value}, timestamp=T0 + datetime.timedelta(minutes=i)) for i in range(count)]
+
+
+def test_history_merges_memory_and_store(store):
+    rollups = RollupManager()
+    rollups.configure(store)
+    rollups.add([SensorData({'ph': 6.0}, timestamp=T0), SensorData({'ph': 7.0}, timestamp=T0)])
+    rollups.flush()
+    history = rollups.history('ph', '1H', now=T0 + datetime.timedelta(minutes=30))
+    assert history['tier'] == '1m'
+    assert history['min'] == [6.0] and history['max'] == [7.0] and history['avg'] == [6.5]
+    assert history['stats'] == {'min': 6.0, 'max': 7.0, 'avg': 6.5}
+
+
+def test_restarted_process_merges_with_stored_buckets(store):
+    first = RollupManager()
+    first.configure(store)
+    first.add([SensorData({'ph': 6.0}, timestamp=T0)])
+    first.flush()
+
+    second = RollupManager()
+    second.configure(store)
+    second.add([SensorData({'ph': 8.0}, timestamp=T0 + datetime.timedelta(seconds=10))])
+    second.flush()
+    stored = second.collection('1m').document(str(int((T0 - datetime.datetime(1970, 1, 1)).total_seconds()))).get()
+    assert stored.to_dict()['fields']['ph'] == {'min': 6.0, 'max': 8.0, 'sum': 14.0, 'count': 2}
+
+
+def test_flush_commits_in_capped_chunks_and_retries_only_the_rest(store):
+    rollups = RollupManager()
+    rollups.configure(store)
+    rollups.add(minutes(MAX_BATCH_WRITES + 100))
+    total = len(rollups._dirty)
+
+    commits = []
+    batch = store.batch
+
+    def failing_second_batch():
+        b = batch()
+        commit = b.commit
+
+        def checked():
+            commits.append(len(b))
+            if len(commits) == 2:
+                raise RuntimeError('rejected')
+            return commit()
+        b.commit = checked
+        return b
+
+    store.batch = failing_second_batch
+    try:
+        rollups.flush()
+    except RuntimeError:
+        pass
+    assert commits[0] == MAX_BATCH_WRITES
+    assert len(rollups._dirty) == total - MAX_BATCH_WRITES
+
+    assert rollups.flush() == total - MAX_BATCH_WRITES
+    assert not rollups._dirty
+    assert len(list(rollups.collection('1m').stream())) == MAX_BATCH_WRITES + 100
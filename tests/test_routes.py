@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def client():
+    os.environ.update({'STORAGE_BACKEND': 'memory', 'ASSET_BUILD': '0', 'INGEST_API_KEY': 'test-key'})
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    client = app.test_client()
+    client.post('/sign-up', data={'email': 'grower@example.com', 'name': 'Grower', 'password': 'password1'})
+    client.post('/login', data={'email': 'grower@example.com', 'password': 'password1'})
+    return client
+
+
+def test_unknown_unit_on_a_page_redirects_to_the_default_unit(client):
+    response = client.get('/controls?unit=nope')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/controls')
+    assert client.get('/controls').status_code == 200
+
+
+def test_stale_session_unit_is_cleared(client):
+    with client.session_transaction() as session:
+        session['unit'] = 'gone'
+    assert client.get('/graph/ph').status_code == 302
+    with client.session_transaction() as session:
+        assert 'unit' not in session
+
+
+def test_unknown_unit_on_the_api_is_a_json_404(client):
+    response = client.get('/api/controls?unit=nope')
+    assert response.status_code == 404
+    assert response.json == {'success': False, 'error': 'Unknown unit'}
+
+
+@pytest.mark.parametrize('body', [{'mode': 'bogus'}, {'mode': None}, {}, None])
+def test_control_mode_is_validated(client, body):
+    assert client.post('/api/controls/mode', json=body).status_code == 400
+
+
+def test_control_mode_is_applied(client):
+    response = client.post('/api/controls/mode', json={'mode': 'schedule'})
+    assert response.status_code == 200
+    assert response.json == {'success': True, 'mode': 'schedule'}
+    client.post('/api/controls/mode', json={'mode': 'manual'})
+
+
+def test_ingest_rejects_an_overflowing_value(client):
+    response = client.post('/api/sensor-data', json={'ph': 10 ** 400}, headers={'X-API-Key': 'test-key'})
+    assert response.status_code == 400
@@ -0,0 +1,98 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from models import SensorData
+from services.spool import HttpSink, RejectedBatch, Spool, SpoolSyncer
+
+
+@pytest.fixture
+def spool(tmp_path):
+    spool = Spool(str(tmp_path / 'spool.db'))
+    yield spool
+    spool.close()
+
+
+def readings(count):
+    return [SensorData({'ph': 6.0}, unit_id='default') for _ in range(count)]
+
+
+class Sink:
+    name = 'upstream'
+
+    def __init__(self, *failures):
+        self.failures = list(failures)
+        self.batches = []
+
+    def __call__(self, records):
+        error = self.failures.pop(0) if self.failures else None
+        if error:
+            raise error
+        self.batches.append([r.id for r in records])
+
+
+def test_append_drops_resent_readings(spool):
+    batch = readings(3)
+    assert len(spool.append(batch)) == 3
+    assert spool.append(batch) == []
+    assert spool.pending('store') == 3
+
+
+def test_sync_acks_in_batches(spool):
+    spool.append(readings(5))
+    sink = Sink()
+    syncer = SpoolSyncer(spool, sink, batch_size=2)
+    assert syncer.sync() == 5
+    assert [len(b) for b in sink.batches] == [2, 2, 1]
+    assert spool.pending('upstream') == 0
+
+
+def test_transient_failure_keeps_the_batch_and_backs_off(spool):
+    spool.append(readings(3))
+    syncer = SpoolSyncer(spool, Sink(RuntimeError('down')), batch_size=2)
+    assert syncer.sync() == 0
+    assert spool.pending('upstream') == 3
+    assert syncer.stats['errors'] == 1 and syncer.backoff() > 0
+    assert syncer.sync() == 3
+    assert syncer.backoff() == 0
+
+
+def test_rejected_batch_is_dead_lettered_and_skipped(spool):
+    spool.append(readings(5))
+    sink = Sink(RejectedBatch('upstream returned 400'))
+    syncer = SpoolSyncer(spool, sink, batch_size=3)
+    assert syncer.sync() == 2
+    assert spool.pending('upstream') == 0
+    assert syncer.stats['dead_lettered'] == 3 and syncer.backoff() == 0
+    assert spool.stats()['dead_letters'] == {'upstream': 3}
+
+
+def test_cursors_progress_independently_and_rewind(spool):
+    spool.append(readings(4))
+    SpoolSyncer(spool, Sink(), batch_size=10).sync()
+    assert spool.pending('upstream') == 0 and spool.pending('store') == 4
+    assert spool.rewind('upstream') == 4
+    assert spool.pending('upstream') == 4
+
+
+@pytest.mark.parametrize('code, error', [(400, RejectedBatch), (422, RejectedBatch), (408, RuntimeError),
+                                         (429, RuntimeError), (503, RuntimeError)])
+def test_http_sink_treats_only_permanent_4xx_as_rejected(code, error):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers['Content-Length']))
+            self.send_response(code)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with pytest.raises(error) as raised:
+            HttpSink(f"http://127.0.0.1:{server.server_port}/api/sensor-data")(readings(1))
+        assert isinstance(raised.value, RejectedBatch) == (error is RejectedBatch)
+    finally:
+        server.shutdown()
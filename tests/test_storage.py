@@ -0,0 +1,106 @@
+import datetime
+
+import pytest
+
+from storage import NotFound, Query
+
+T0 = datetime.datetime(2026, 1, 1)
+
+
+@pytest.fixture
+def logs(store):
+    ref = store.collection('control_logs')
+    batch = store.batch()
+    for i, (name, action, tags) in enumerate([
+        ('n_pump', 'ON', ['dose']),
+        ('n_pump', 'OFF', []),
+        ('ph_up_pump', 'ON', ['dose', 'ph']),
+        ('grow_light', 'ON', ['light']),
+        ('ph_up_pump', 'OFF', ['ph']),
+        ('n_pump', 'ON', ['dose']),
+    ]):
+        batch.set(ref.document(f"log{i}"), {
+            'control_name': name, 'action': action, 'tags': tags,
+            'timestamp': T0 + datetime.timedelta(minutes=i), 'meta': {'seq': i}
+        })
+    batch.commit()
+    return ref
+
+
+def ids(query):
+    return [doc.id for doc in query.stream()]
+
+
+def test_equality_and_range_filters(logs):
+    assert ids(logs.where('control_name', '==', 'n_pump').order_by('timestamp')) == ['log0', 'log1', 'log5']
+    assert ids(logs.where('timestamp', '>=', T0 + datetime.timedelta(minutes=4)).order_by('timestamp')) == ['log4', 'log5']
+    assert ids(logs.where('action', '!=', 'ON').order_by('timestamp')) == ['log1', 'log4']
+    assert ids(logs.where('meta.seq', '<', 2).order_by('timestamp')) == ['log0', 'log1']
+
+
+def test_in_and_array_contains(logs):
+    query = logs.where('control_name', 'in', ['grow_light', 'ph_up_pump']).order_by('timestamp')
+    assert ids(query) == ['log2', 'log3', 'log4']
+    assert ids(logs.where('tags', 'array-contains', 'ph').order_by('timestamp')) == ['log2', 'log4']
+    assert ids(logs.where('tags', 'array-contains', 'none').order_by('timestamp')) == []
+
+
+def test_order_by_descending_with_limit(logs):
+    query = logs.order_by('timestamp', direction=Query.DESCENDING).limit(2)
+    assert ids(query) == ['log5', 'log4']
+
+
+def test_order_by_ties_break_on_document_id(logs):
+    assert ids(logs.order_by('action').order_by('control_name')) == ['log1', 'log4', 'log3', 'log0', 'log5', 'log2']
+
+
+def test_order_by_drops_documents_missing_the_field(store, logs):
+    logs.document('untimed').set({'control_name': 'n_pump'})
+    assert 'untimed' not in ids(logs.order_by('timestamp'))
+    assert 'untimed' in ids(logs.where('control_name', '==', 'n_pump'))
+
+
+def test_start_after_snapshot_pages_through_everything(logs):
+    query = logs.order_by('timestamp', direction=Query.DESCENDING).limit(4)
+    first = list(query.stream())
+    second = list(query.start_after(first[-1]).stream())
+    assert [d.id for d in first] == ['log5', 'log4', 'log3', 'log2']
+    assert [d.id for d in second] == ['log1', 'log0']
+
+
+def test_start_after_dict_cursor(logs):
+    query = logs.order_by('timestamp').start_after({'timestamp': T0 + datetime.timedelta(minutes=3)})
+    assert ids(query) == ['log4', 'log5']
+
+
+def test_datetimes_round_trip(store, logs):
+    assert logs.document('log2').get().to_dict()['timestamp'] == T0 + datetime.timedelta(minutes=2)
+    aware = datetime.datetime(2026, 1, 1, 1, tzinfo=datetime.timezone(datetime.timedelta(hours=1)))
+    assert ids(logs.where('timestamp', '==', aware)) == ['log0']
+
+
+def test_update_merges_dotted_fields(store):
+    ref = store.collection('control_status').document('n_pump')
+    ref.set({'is_on': False, 'settings': {'flow_ml_per_min': 50, 'min_off_seconds': 300}})
+    ref.update({'is_on': True, 'settings.flow_ml_per_min': 80})
+    assert ref.get().to_dict() == {'is_on': True, 'settings': {'flow_ml_per_min': 80, 'min_off_seconds': 300}}
+    ref.set({'mode': 'auto'}, merge=True)
+    assert ref.get().to_dict()['mode'] == 'auto' and ref.get().to_dict()['is_on'] is True
+
+
+def test_batch_is_atomic(store):
+    ref = store.collection('control_status')
+    ref.document('a').set({'is_on': False})
+    batch = store.batch()
+    batch.update(ref.document('a'), {'is_on': True})
+    batch.update(ref.document('missing'), {'is_on': True})
+    with pytest.raises(NotFound):
+        batch.commit()
+    assert ref.document('a').get().to_dict() == {'is_on': False}
+    assert not ref.document('missing').get().exists
+
+
+def test_delete(store, logs):
+    logs.document('log0').delete()
+    assert not logs.document('log0').get().exists
+    assert len(ids(logs)) == 5
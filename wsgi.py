@@ -0,0 +1,39 @@
+"""Production entry point.
+
+    CONTROL_LOOP=1 gunicorn -w 1 -k gthread --threads 32 -b 0.0.0.0:5000 wsgi:app
+
+Run ONE process and scale with threads. Several features keep their state
+in process memory and are only correct when every request reaches the
+same process:
+
+- the SSE broker behind /api/stream only reaches subscribers of the
+  process that published the event;
+- AI scan jobs (/api/analysis-jobs/<id>) live in the process that queued
+  them;
+- the control table enforces the pH interlock and its lock per process,
+  so a second worker could switch the opposite pump;
+- the control loop must run in exactly one process (CONTROL_LOOP=1; it
+  defaults to off);
+- the recent-readings window and the tank model only see this process's
+  readings and pump switches.
+
+Every open /api/stream connection holds a thread for its lifetime, so use
+a threaded worker (gthread, as above, with --threads well above the
+number of open dashboards) or an async one (`-k gevent
+--worker-connections 1000`, with gevent installed); a plain sync worker
+is taken over by its first dashboard.
+
+Startup does no store I/O (the store opens on first use), so the worker
+boots in milliseconds; run `flask --app wsgi build-assets` and
+`flask --app wsgi seed` once per deploy (ASSET_BUILD defaults to off
+here, so workers never resize images at boot) and set AUTO_SEED=0 to skip
+the first-request seed check as well. Don't use --preload: the worker must
+start its own writer threads after the fork.
+"""
+import os
+
+os.environ.setdefault('ASSET_BUILD', '0')
+
+from app import create_app  # noqa: E402
+
+app = create_app()